@@ -3,6 +3,7 @@ from django.db.models import Q
 from django.db.models.functions import Lower
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
+from django.urls import path
 from django.utils.safestring import mark_safe
 from eveuniverse.models import EveGroup
 
@@ -17,6 +18,7 @@ from .constants import (
     EveGroupId,
 )
 from .core.killmails import Killmail
+from .core.latency import SCOPE_TRACKER, SCOPE_WEBHOOK, format_latency, latency_stats
 from .forms import TrackerAdminForm, TrackerAdminKillmailIdForm, field_nice_display
 from .models import EveKillmail, EveKillmailAttacker, EveTypePlus, Tracker, Webhook
 
@@ -47,13 +49,57 @@ class EveKillmailAdmin(admin.ModelAdmin):
 
 @admin.register(Webhook)
 class WebhookAdmin(admin.ModelAdmin):
-    list_display = ("name", "is_enabled", "_messages_in_queue")
+    list_display = ("name", "is_enabled", "_messages_in_queue", "_dead_letters")
     list_filter = ("is_enabled",)
     ordering = ("name",)
 
     def _messages_in_queue(self, obj):
         return obj.main_queue.size()
 
+    @admin.display(description="dead letters")
+    def _dead_letters(self, obj):
+        return obj.dead_letter_queue.size()
+
+    def get_urls(self):
+        urls = [
+            path(
+                "latency/",
+                self.admin_site.admin_view(self.latency_view),
+                name="killtracker_webhook_latency",
+            )
+        ]
+        return urls + super().get_urls()
+
+    def latency_view(self, request):
+        names = {
+            SCOPE_TRACKER: dict(Tracker.objects.values_list("pk", "name")),
+            SCOPE_WEBHOOK: dict(Webhook.objects.values_list("pk", "name")),
+        }
+        rows = [
+            {
+                "scope": obj.scope,
+                "name": names[obj.scope].get(obj.obj_pk, f"#{obj.obj_pk}"),
+                "stage": obj.stage,
+                "count": obj.count,
+                "mean": format_latency(obj.mean),
+                "p50": format_latency(obj.p50),
+                "p95": format_latency(obj.p95),
+                "p99": format_latency(obj.p99),
+            }
+            for obj in latency_stats()
+        ]
+        return render(
+            request,
+            "admin/killtracker/webhook/latency.html",
+            {
+                **self.admin_site.each_context(request),
+                "title": "Killmail Latency",
+                "site_header": site_header,
+                "opts": Webhook._meta,
+                "rows": rows,
+            },
+        )
+
     actions = ["send_test_message", "purge_messages"]
 
     @admin.display(description="Purge queued messages of selected webhooks")
@@ -132,6 +178,9 @@ class TrackerAdmin(admin.ModelAdmin):
                     "ping_type",
                     "ping_groups",
                     "is_posting_name",
+                    "priority",
+                    "high_priority_min_value",
+                    "max_message_age",
                 ),
             },
         ),
@@ -215,7 +264,7 @@ class TrackerAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.prefetch_related(
+        return qs.select_related("origin_solar_system", "webhook").prefetch_related(
             "exclude_attacker_alliances",
             "require_attacker_alliances",
             "exclude_attacker_corporations",
@@ -315,8 +364,9 @@ class TrackerAdmin(admin.ModelAdmin):
             self._append_field_to_clauses(clauses, field_name, getattr(obj, field_name))
 
     def _add_to_clauses_2(self, clauses, obj, field):
-        if getattr(obj, field).count() > 0:
-            text = ", ".join(sorted(map(str, getattr(obj, field).all())))
+        objs = getattr(obj, field).all()  # using prefetched objects
+        if objs:
+            text = ", ".join(sorted(map(str, objs)))
             self._append_field_to_clauses(clauses, field, text)
 
     def _append_field_to_clauses(self, clauses, field, text):
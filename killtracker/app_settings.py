@@ -21,11 +21,34 @@ KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS = clean_setting(
     "KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 30
 )
 
+# Max number of stale killmails deleted from the database in one chunk
+KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE = clean_setting(
+    "KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE", 900
+)
+
+# Max duration of a purge run in seconds.
+# Remaining stale killmails are deleted in the next run.
+KILLTRACKER_PURGE_KILLMAILS_TIME_BUDGET = clean_setting(
+    "KILLTRACKER_PURGE_KILLMAILS_TIME_BUDGET", 30
+)
+
 # whether killmails retrieved from ZKB are stored in the database
 KILLTRACKER_STORING_KILLMAILS_ENABLED = clean_setting(
     "KILLTRACKER_STORING_KILLMAILS_ENABLED", False
 )
 
+# Max number of buffered killmails stored in the database in one batch.
+# Storing starts as soon as that many killmails have been buffered.
+KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE = clean_setting(
+    "KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE", 100
+)
+
+# Whether all enabled trackers are run for a new killmail in one task.
+# When False a separate task is started for every tracker and killmail.
+KILLTRACKER_BATCHED_MATCHING_ENABLED = clean_setting(
+    "KILLTRACKER_BATCHED_MATCHING_ENABLED", True
+)
+
 # Wether app sets the name and avatar icon of a webhook.
 # When False the webhook will use it's own values as set on the platform
 KILLTRACKER_WEBHOOK_SET_AVATAR = clean_setting("KILLTRACKER_WEBHOOK_SET_AVATAR", True)
@@ -44,12 +67,34 @@ KILLTRACKER_REDISQ_TTW = clean_setting("KILLTRACKER_REDISQ_TTW", 5)
 # Tasks hard timeout
 KILLTRACKER_TASKS_TIMEOUT = clean_setting("KILLTRACKER_TASKS_TIMEOUT", 1_800)
 
-# delay in seconds between every message sent to Discord
+# delay in seconds between messages sent to Discord,
+# when Discord does not report the current rate limit of a webhook
 # this needs to be >= 1 to prevent 429 Too Many Request errors
 KILLTRACKER_DISCORD_SEND_DELAY = clean_setting(
     "KILLTRACKER_DISCORD_SEND_DELAY", default_value=2, min_value=1, max_value=900
 )
 
+# Max number of attempts for sending a message to Discord.
+# Messages which failed that often are moved into the dead letter queue.
+KILLTRACKER_DISCORD_MESSAGE_MAX_ATTEMPTS = clean_setting(
+    "KILLTRACKER_DISCORD_MESSAGE_MAX_ATTEMPTS", default_value=5, min_value=1
+)
+
+# Max number of requests the message delivery service sends to Discord concurrently
+KILLTRACKER_DELIVERY_MAX_WORKERS = clean_setting(
+    "KILLTRACKER_DELIVERY_MAX_WORKERS", default_value=10, min_value=1
+)
+
+# Max number of embeds sent to Discord in one message.
+# Queued messages with the same content are combined up to this number.
+# Set to 1 to send every message on its own.
+KILLTRACKER_DISCORD_MAX_EMBEDS_PER_MESSAGE = clean_setting(
+    "KILLTRACKER_DISCORD_MAX_EMBEDS_PER_MESSAGE",
+    default_value=10,
+    min_value=1,
+    max_value=10,
+)
+
 # Maximum retries when generating a message from a killmail
 KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES = clean_setting(
     "KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES", 3
@@ -74,3 +119,51 @@ KILLTRACKER_TASK_MINIMUM_RETRY_DELAY = clean_setting(
 KILLTRACKER_STORAGE_KILLMAILS_LIFETIME = clean_setting(
     "KILLTRACKER_STORAGE_KILLMAILS_LIFETIME", 3_600 * 1
 )
+
+# Max number of decoded killmails each worker process keeps in memory
+KILLTRACKER_KILLMAIL_LOCAL_CACHE_SIZE = clean_setting(
+    "KILLTRACKER_KILLMAIL_LOCAL_CACHE_SIZE", 100
+)
+
+# Max number of received killmails the RedisQ consumer is buffering
+# before it stops fetching new killmails until the backlog has been dispatched
+KILLTRACKER_CONSUMER_QUEUE_SIZE = clean_setting("KILLTRACKER_CONSUMER_QUEUE_SIZE", 100)
+
+# Max lifetime of the character state index in seconds.
+# The index is rebuilt from scratch after it has expired.
+KILLTRACKER_CHARACTER_STATE_INDEX_TIMEOUT = clean_setting(
+    "KILLTRACKER_CHARACTER_STATE_INDEX_TIMEOUT", 3_600
+)
+
+# Max lifetime of the cache of entity names in seconds.
+# The cache is warmed again from the database after it has expired.
+KILLTRACKER_ENTITY_NAMES_CACHE_TIMEOUT = clean_setting(
+    "KILLTRACKER_ENTITY_NAMES_CACHE_TIMEOUT", 86_400
+)
+
+# Max lifetime of the in-memory universe graph of each process in seconds
+KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT = clean_setting(
+    "KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT", 3_600 * 24
+)
+
+# Max number of connections kept alive per host for outgoing HTTP requests
+KILLTRACKER_HTTP_POOL_MAXSIZE = clean_setting("KILLTRACKER_HTTP_POOL_MAXSIZE", 10)
+
+# Max retries for outgoing HTTP requests on connection errors and server errors
+KILLTRACKER_HTTP_MAX_RETRIES = clean_setting("KILLTRACKER_HTTP_MAX_RETRIES", 3)
+
+# Backoff factor between retries of outgoing HTTP requests in seconds
+KILLTRACKER_HTTP_RETRY_BACKOFF_FACTOR = clean_setting(
+    "KILLTRACKER_HTTP_RETRY_BACKOFF_FACTOR", default_value=0.5, min_value=0.0
+)
+
+# Max lifetime of compiled tracker rules in cache in seconds.
+# Rules are also invalidated whenever a tracker is changed.
+KILLTRACKER_TRACKER_RULES_CACHE_TIMEOUT = clean_setting(
+    "KILLTRACKER_TRACKER_RULES_CACHE_TIMEOUT", 3_600 * 24
+)
+
+# Whether to record how long killmails take from receipt to delivery on Discord
+KILLTRACKER_LATENCY_STATS_ENABLED = clean_setting(
+    "KILLTRACKER_LATENCY_STATS_ENABLED", True
+)
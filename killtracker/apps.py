@@ -9,6 +9,7 @@ class KillmailsConfig(AppConfig):
     verbose_name = f"Killtracker v{__version__}"
 
     def ready(self) -> None:
+        from . import signals  # noqa: F401
         from .core.killmails import Killmail
 
         Killmail.reset_lock_key()
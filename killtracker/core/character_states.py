@@ -0,0 +1,129 @@
+"""Index of the Auth states of all owned characters."""
+
+from typing import Dict, Iterable, Optional
+
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.helpers import chunks
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_CHARACTER_STATE_INDEX_TIMEOUT
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+# Updates fields of the index only when the index has been built,
+# so an expired index is never recreated incomplete and without timeout.
+# KEYS: index
+# ARGV: built field, character ID, state ID, character ID, state ID...
+_UPDATE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+class CharacterStateIndex:
+    """Redis backed index mapping character IDs to the Auth state of their owner.
+
+    The index is rebuilt from scratch after it expires
+    and kept up-to-date by signals in between.
+    """
+
+    KEY = f"{__title__}_character_states"
+    _BUILT_FIELD = "built"
+    _CHUNK_SIZE = 1_000
+
+    @classmethod
+    def exists(cls) -> bool:
+        """Return True when the index has been built, else False."""
+        return bool(get_redis_client().hexists(cls.KEY, cls._BUILT_FIELD))
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """Rebuild the index from the database and return the number of characters.
+
+        The new index is replacing the old one atomically.
+        """
+        state_ids = cls._state_ids_from_database()
+        key_tmp = f"{cls.KEY}_tmp"
+        pipe = get_redis_client().pipeline()
+        pipe.delete(key_tmp)
+        pipe.hset(key_tmp, cls._BUILT_FIELD, 1)
+        for chunk in chunks(list(state_ids.items()), cls._CHUNK_SIZE):
+            pipe.hset(key_tmp, mapping=dict(chunk))
+        pipe.expire(key_tmp, KILLTRACKER_CHARACTER_STATE_INDEX_TIMEOUT)
+        pipe.rename(key_tmp, cls.KEY)
+        pipe.execute()
+        logger.info("Rebuilt character state index with %d characters", len(state_ids))
+        return len(state_ids)
+
+    @classmethod
+    def state_ids(cls, character_ids: Iterable[int]) -> Optional[Dict[int, int]]:
+        """Return map of given character IDs to the Auth state of their owner.
+
+        Characters which are not owned by any user are not included.
+        Returns None when the index is not available.
+        """
+        character_ids = list(character_ids)
+        values = get_redis_client().hmget(cls.KEY, [cls._BUILT_FIELD] + character_ids)
+        if values[0] is None:
+            return None
+        return {
+            character_id: int(state_id)
+            for character_id, state_id in zip(character_ids, values[1:])
+            if state_id is not None
+        }
+
+    @classmethod
+    def state_ids_or_fetch(cls, character_ids: Iterable[int]) -> Dict[int, int]:
+        """Return map of given character IDs to the Auth state of their owner.
+
+        Falls back to fetching the states from the database
+        when the index is not available.
+        """
+        character_ids = set(character_ids)
+        state_ids = cls.state_ids(character_ids)
+        if state_ids is None:
+            logger.debug("Character state index not available")
+            state_ids = cls._state_ids_from_database(character_ids)
+        return state_ids
+
+    @classmethod
+    def update_user(cls, user_id: int) -> None:
+        """Update the states for all characters owned by a user."""
+        state_ids = cls._state_ids_from_database(user_id=user_id)
+        if state_ids:
+            cls._update(state_ids)
+
+    @classmethod
+    def remove_character(cls, character_id: int) -> None:
+        """Remove a character from the index."""
+        get_redis_client().hdel(cls.KEY, character_id)
+
+    @classmethod
+    def _update(cls, state_ids: Dict[int, int]) -> None:
+        # only updating a built index in one atomic step,
+        # so we do not create an incomplete index by accident
+        args = [cls._BUILT_FIELD]
+        for character_id, state_id in state_ids.items():
+            args += [character_id, state_id]
+        get_redis_client().eval(_UPDATE_SCRIPT, 1, cls.KEY, *args)
+
+    @staticmethod
+    def _state_ids_from_database(
+        character_ids: Optional[Iterable[int]] = None, user_id: Optional[int] = None
+    ) -> Dict[int, int]:
+        qs = CharacterOwnership.objects.filter(user__profile__state__isnull=False)
+        if character_ids is not None:
+            qs = qs.filter(character__character_id__in=character_ids)
+        if user_id is not None:
+            qs = qs.filter(user_id=user_id)
+        return dict(
+            qs.values_list("character__character_id", "user__profile__state_id")
+        )
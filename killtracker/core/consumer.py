@@ -0,0 +1,130 @@
+"""Persistent consumer for killmails from ZKB RedisQ."""
+
+import queue
+import threading
+from typing import Callable, Optional
+
+import requests
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_CONSUMER_QUEUE_SIZE
+from .http import log_connection_stats
+from .killmails import Killmail
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+ERROR_BACKOFF_MIN = 1
+ERROR_BACKOFF_MAX = 60
+POLL_INTERVAL = 1
+
+
+class RedisQConsumer:
+    """Consumes killmails from ZKB RedisQ continuously and dispatches them.
+
+    Killmails are fetched in a separate thread over a keep-alive session,
+    which defaults to the pooled session for RedisQ,
+    and put into a bounded queue. The dispatcher is running in the calling thread.
+    When the dispatcher can not keep up the queue fills up
+    and fetching is paused until there is room again (backpressure).
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[Killmail], None],
+        queue_size: int = KILLTRACKER_CONSUMER_QUEUE_SIZE,
+        max_killmails: Optional[int] = None,
+        session: Optional[requests.Session] = None,
+    ) -> None:
+        self._dispatch = dispatch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._max_killmails = max_killmails
+        self._session = session
+        self._stop_event = threading.Event()
+        self._dispatcher_stopped = threading.Event()
+        self.killmails_received = 0
+        self.killmails_dispatched = 0
+
+    def stop(self) -> None:
+        """Request the consumer to shut down gracefully.
+
+        The current request to RedisQ is completed
+        and all queued killmails are dispatched before the consumer stops.
+        """
+        if not self._stop_event.is_set():
+            logger.info("Shutting down RedisQ consumer...")
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """Run the consumer until stopped."""
+        logger.info("RedisQ consumer started")
+        fetcher = threading.Thread(
+            target=self._fetch_loop, name=f"{__title__}_redisq_fetcher", daemon=True
+        )
+        fetcher.start()
+        try:
+            while fetcher.is_alive() or not self._queue.empty():
+                try:
+                    killmail = self._queue.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                try:
+                    self._dispatch(killmail)
+                except Exception:
+                    logger.exception("Failed to dispatch killmail %s", killmail.id)
+                else:
+                    self.killmails_dispatched += 1
+                finally:
+                    self._queue.task_done()
+        finally:
+            self._dispatcher_stopped.set()
+            self.stop()
+            fetcher.join()
+
+        logger.info(
+            "RedisQ consumer stopped. %d killmails received from ZKB",
+            self.killmails_received,
+        )
+        log_connection_stats()
+
+    def _fetch_loop(self) -> None:
+        backoff = ERROR_BACKOFF_MIN
+        while not self._stop_event.is_set():
+            try:
+                killmail = Killmail.create_from_zkb_redisq(
+                    session=self._session, use_lock=False
+                )
+            except Exception:
+                logger.warning(
+                    "Failed to fetch killmail from RedisQ. Retrying in %d seconds.",
+                    backoff,
+                    exc_info=True,
+                )
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX)
+                continue
+
+            backoff = ERROR_BACKOFF_MIN
+            if not killmail:
+                continue
+
+            self.killmails_received += 1
+            self._put(killmail)
+            if self._max_killmails and self.killmails_received >= self._max_killmails:
+                self.stop()
+
+    def _put(self, killmail: Killmail) -> None:
+        while True:
+            try:
+                self._queue.put(killmail, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                logger.debug("Consumer queue is full. Waiting for dispatcher.")
+                if self._dispatcher_stopped.is_set():
+                    logger.warning(
+                        "Discarding killmail %s, because dispatcher has stopped",
+                        killmail.id,
+                    )
+                    return
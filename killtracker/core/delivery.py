@@ -0,0 +1,304 @@
+"""Delivery of queued messages to Discord webhooks."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import dhooks_lite
+
+from django.db import close_old_connections
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_DELIVERY_MAX_WORKERS,
+    KILLTRACKER_DISCORD_MAX_EMBEDS_PER_MESSAGE,
+    KILLTRACKER_DISCORD_SEND_DELAY,
+)
+from ..exceptions import WebhookTooManyRequests
+from ..models import Webhook
+from .http import log_connection_stats
+from .latency import record_message_sent
+from .message_batches import MessageBatch
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+ERROR_BACKOFF = 5
+POLL_INTERVAL = 1
+RELOAD_INTERVAL = 30
+RESET_INTERVAL = 60
+
+
+def send_next_message_batch(webhook: Webhook) -> Optional[float]:
+    """Send the next batch of queued messages to a webhook.
+
+    Returns the seconds to wait before the next batch can be sent
+    or None when there are no more messages.
+    Raises WebhookTooManyRequests when the webhook is blocked.
+    The messages of the batch are put back to the front of their lane in this case
+    and moved to the error queue when sending failed with any other exception.
+    Messages rejected by Discord are moved to the error queue.
+    """
+    if not webhook.main_queue.size():
+        return None
+
+    wait = webhook.rate_limiter.acquire()
+    if wait:
+        logger.debug("%s: Rate limited. Waiting %.1f seconds", webhook, wait)
+        return wait
+
+    batch = webhook.dequeue_message_batch(KILLTRACKER_DISCORD_MAX_EMBEDS_PER_MESSAGE)
+    if not batch:
+        return None
+
+    logger.debug("%s: Sending %d messages to webhook", webhook, len(batch))
+    unsent = list(batch.messages)
+    try:
+        _send_batch(webhook, batch, unsent)
+    except WebhookTooManyRequests:
+        # back to the front of the lane in reverse, so the order is kept
+        for message in reversed(unsent):
+            webhook.main_queue.push_front(message, batch.priority)
+        raise
+    except Exception:
+        webhook.error_queue.enqueue_bulk(unsent)
+        raise
+
+    delay = webhook.rate_limiter.delay()
+    return delay if delay is not None else KILLTRACKER_DISCORD_SEND_DELAY
+
+
+def _send_batch(webhook: Webhook, batch: MessageBatch, unsent: List[str]) -> None:
+    """Send a batch of messages and remove all handled messages from unsent.
+
+    When Discord rejects a combined message with a client error,
+    its messages are sent again one by one,
+    so only the invalid messages are moved to the error queue.
+    """
+    response = webhook.send_message_to_webhook(batch.asjson())
+    if response.status_ok or len(batch) == 1 or not 400 <= response.status_code < 500:
+        _handle_response(webhook, response, batch.messages)
+        unsent.clear()
+        return
+
+    logger.info(
+        "%s: Sending %d messages one by one after failed batch. HTTP status code: %d",
+        webhook,
+        len(batch),
+        response.status_code,
+    )
+    while unsent:
+        response = webhook.send_message_to_webhook(unsent[0])
+        _handle_response(webhook, response, unsent[:1])
+        del unsent[0]
+
+
+def _handle_response(
+    webhook: Webhook, response: dhooks_lite.WebhookResponse, messages: List[str]
+) -> None:
+    if response.status_ok:
+        webhook.main_queue.clear_attempts(messages)
+        for message in messages:
+            record_message_sent(message, webhook_pk=webhook.pk)
+    else:
+        webhook.error_queue.enqueue_bulk(messages)
+        logger.warning(
+            "%s: Failed to send message to webhook, will retry. "
+            "HTTP status code: %d, response: %s",
+            webhook,
+            response.status_code,
+            response.content,
+        )
+
+
+class MessageDeliveryService:
+    """Sends queued messages to all enabled webhooks concurrently.
+
+    Runs an asyncio event loop, which watches the main queues of all webhooks
+    and starts a sender for every webhook with queued messages.
+    Senders run concurrently and each waits as long as the rate limit
+    of its webhook requires.
+    Requests are sent from a thread pool over the pooled sessions,
+    so the number of concurrent requests is limited by the number of threads.
+    Failed messages are moved back into the main queues periodically.
+
+    While the service is running no tasks are started for sending messages
+    and tasks already running stop before sending their next batch.
+    """
+
+    _HEARTBEAT_KEY = f"{__title__}_delivery_service_heartbeat"
+    _HEARTBEAT_TIMEOUT = 10
+    _HEARTBEAT_INTERVAL = 3
+
+    def __init__(self, max_workers: int = KILLTRACKER_DELIVERY_MAX_WORKERS) -> None:
+        self._max_workers = max(1, max_workers)
+        self._stop_event = threading.Event()
+        self._webhooks: Dict[int, Webhook] = {}
+        self._senders: Dict[int, asyncio.Task] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def is_running(cls) -> bool:
+        """Return True when a delivery service is running, else False."""
+        return bool(get_redis_client().exists(cls._HEARTBEAT_KEY))
+
+    def stop(self) -> None:
+        """Request the service to shut down gracefully.
+
+        Requests in flight are completed before the service stops.
+        """
+        if not self._stop_event.is_set():
+            logger.info("Shutting down message delivery service...")
+        self._stop_event.set()
+
+    def run(self) -> None:
+        """Run the service until stopped."""
+        logger.info("Message delivery service started")
+        self._renew_heartbeat()
+        heartbeat = threading.Thread(
+            target=self._beat, name=f"{__title__}_heartbeat", daemon=True
+        )
+        heartbeat.start()
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self._max_workers,
+                thread_name_prefix=f"{__title__}_delivery",
+            ) as executor:
+                self._executor = executor
+                try:
+                    asyncio.run(self._run())
+                finally:
+                    self._executor = None
+        finally:
+            self._stop_event.set()
+            heartbeat.join()
+            get_redis_client().delete(self._HEARTBEAT_KEY)
+
+        logger.info("Message delivery service stopped")
+        log_connection_stats()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        reload_at = reset_at = 0
+        while not self._stop_event.is_set():
+            try:
+                if loop.time() >= reload_at:
+                    await self._call(self._reload_webhooks)
+                    reload_at = loop.time() + RELOAD_INTERVAL
+
+                if loop.time() >= reset_at:
+                    await self._call(self._reset_failed_messages)
+                    reset_at = loop.time() + RESET_INTERVAL
+
+                pending_pks = await self._call(self._webhooks_with_messages)
+            except Exception:
+                logger.exception("Failed to check webhooks for messages")
+                await self._sleep(ERROR_BACKOFF)
+                continue
+
+            for webhook_pk in pending_pks:
+                sender = self._senders.get(webhook_pk)
+                if not sender or sender.done():
+                    self._senders[webhook_pk] = asyncio.create_task(
+                        self._send_all(webhook_pk)
+                    )
+
+            await self._sleep(POLL_INTERVAL)
+
+        senders = [obj for obj in self._senders.values() if not obj.done()]
+        if senders:
+            await asyncio.gather(*senders, return_exceptions=True)
+
+    async def _send_all(self, webhook_pk: int) -> None:
+        """Send all queued messages of a webhook."""
+        while not self._stop_event.is_set():
+            webhook = self._webhooks.get(webhook_pk)
+            if not webhook:
+                return
+            try:
+                wait = await self._call(send_next_message_batch, webhook)
+            except WebhookTooManyRequests as ex:
+                logger.warning(
+                    "%s: Too many requests for webhook. Blocked for %s seconds.",
+                    webhook,
+                    ex.retry_after,
+                )
+                await self._sleep(ex.retry_after)
+                continue
+            except Exception:
+                logger.exception("%s: Failed to send messages", webhook)
+                await self._sleep(ERROR_BACKOFF)
+                continue
+
+            if wait is None:
+                return
+            if wait:
+                await self._sleep(wait)
+
+    async def _call(self, func, *args):
+        """Run a blocking function in the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, _call_with_connection, func, *args
+        )
+
+    async def _sleep(self, seconds: float) -> None:
+        """Sleep for the given seconds or until the service is stopped."""
+        loop = asyncio.get_running_loop()
+        wake_at = loop.time() + seconds
+        while not self._stop_event.is_set():
+            remaining = wake_at - loop.time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, POLL_INTERVAL))
+
+    def _beat(self) -> None:
+        """Renew the heartbeat until the service is stopped.
+
+        Runs in its own thread, so the heartbeat does not expire
+        while all workers of the pool are busy.
+        """
+        while not self._stop_event.wait(self._HEARTBEAT_INTERVAL):
+            try:
+                self._renew_heartbeat()
+            except Exception:
+                logger.exception("Failed to renew heartbeat")
+
+    def _renew_heartbeat(self) -> None:
+        get_redis_client().set(self._HEARTBEAT_KEY, 1, ex=self._HEARTBEAT_TIMEOUT)
+
+    def _reload_webhooks(self) -> None:
+        self._webhooks = {
+            obj.pk: obj for obj in Webhook.objects.filter(is_enabled=True)
+        }
+        logger.debug("Watching %d enabled webhooks", len(self._webhooks))
+
+    def _reset_failed_messages(self) -> None:
+        for webhook in list(self._webhooks.values()):
+            try:
+                webhook.reset_failed_messages()
+            except Exception:
+                logger.exception("%s: Failed to reset failed messages", webhook)
+
+    def _webhooks_with_messages(self) -> list:
+        """Return PKs of all webhooks with queued messages."""
+        pipe = get_redis_client().pipeline()
+        webhooks = list(self._webhooks.values())
+        for webhook in webhooks:
+            for key in webhook.main_queue.keys:
+                pipe.llen(key)
+        sizes = iter(pipe.execute())
+        return [
+            webhook.pk
+            for webhook in webhooks
+            if sum(next(sizes) for _ in webhook.main_queue.keys)
+        ]
+
+
+def _call_with_connection(func, *args):
+    close_old_connections()
+    return func(*args)
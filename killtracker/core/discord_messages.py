@@ -1,20 +1,29 @@
 """Create discord messages from killmails."""
 
+import hashlib
+import json
+from dataclasses import asdict
+from typing import Iterable, List, Optional, Set
+
 import dhooks_lite
 from requests.exceptions import HTTPError
 
+from django.core.cache import cache
 from eveuniverse.helpers import EveEntityNameResolver
-from eveuniverse.models import EveEntity, EveSolarSystem
+from eveuniverse.models import EveSolarSystem
 
 from allianceauth.eveonline.evelinks import dotlan, eveimageserver, zkillboard
 from allianceauth.services.hooks import get_extension_logger
 from app_utils.django import app_labels
+from app_utils.json import JSONDateTimeEncoder
 from app_utils.logging import LoggerAddTag
 from app_utils.urls import static_file_absolute_url
 from app_utils.views import humanize_value
 
 from .. import __title__
+from ..app_settings import KILLTRACKER_STORAGE_KILLMAILS_LIFETIME
 from ..models import Tracker
+from .entity_names import resolve_names
 from .killmails import ZKB_KILLMAIL_BASEURL, Killmail
 
 ICON_SIZE = 128
@@ -23,9 +32,40 @@ ICON_SIZE = 128
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 
-def create_content(tracker: Tracker, intro_text: str = None) -> str:
-    """Create content for Discord message for a killmail."""
+def create_content(
+    tracker: Tracker,
+    intro_text: str = None,
+    other_trackers: Optional[Iterable[Tracker]] = None,
+) -> str:
+    """Create content for Discord message for a killmail.
+
+    Pings and names of other trackers matching the same killmail
+    are added to the content.
+    """
+
+    trackers = [tracker] + list(other_trackers or [])
+    intro_parts = []
+    for obj in trackers:
+        for part in _ping_parts(obj):
+            if part not in intro_parts:
+                intro_parts.append(part)
+
+    tracker_names = [f"**{obj.name}**" for obj in trackers if obj.is_posting_name]
+    if len(tracker_names) == 1:
+        intro_parts.append(f"Tracker {tracker_names[0]}:")
+    elif tracker_names:
+        intro_parts.append(f"Trackers {', '.join(tracker_names)}:")
+
+    intro_parts_2 = []
+    if intro_text:
+        intro_parts_2.append(intro_text)
+    if intro_parts:
+        intro_parts_2.append(" ".join(intro_parts))
+
+    return "\n".join(intro_parts_2)
+
 
+def _ping_parts(tracker: Tracker) -> List[str]:
     intro_parts = []
 
     if tracker.ping_type == Tracker.ChannelPingType.EVERYBODY:
@@ -54,16 +94,7 @@ def create_content(tracker: Tracker, intro_text: str = None) -> str:
                 "to use groups ping features."
             )
 
-    if tracker.is_posting_name:
-        intro_parts.append(f"Tracker **{tracker.name}**:")
-
-    intro_parts_2 = []
-    if intro_text:
-        intro_parts_2.append(intro_text)
-    if intro_parts:
-        intro_parts_2.append(" ".join(intro_parts))
-
-    return "\n".join(intro_parts_2)
+    return intro_parts
 
 
 def _import_discord_user():
@@ -72,10 +103,41 @@ def _import_discord_user():
     return DiscordUser
 
 
+def create_embed_cached(tracker: Tracker, killmail: Killmail) -> dhooks_lite.Embed:
+    """Create Discord embed for a killmail or return it from cache.
+
+    Embeds are shared between all trackers with the same inputs for a killmail.
+    """
+    key = _embed_cache_key(tracker, killmail)
+    embed = cache.get(key)
+    if embed is None:
+        embed = create_embed(tracker, killmail)
+        cache.set(key, embed, timeout=KILLTRACKER_STORAGE_KILLMAILS_LIFETIME)
+    else:
+        logger.debug("%s: Using cached embed for killmail %s", tracker, killmail.id)
+    return embed
+
+
+def _embed_cache_key(tracker: Tracker, killmail: Killmail) -> str:
+    tracker_info = asdict(killmail.tracker_info) if killmail.tracker_info else None
+    if tracker_info:
+        del tracker_info["tracker_pk"]
+    inputs = {
+        "color": tracker.color,
+        "identify_fleets": tracker.identify_fleets,
+        "origin_solar_system_id": tracker.origin_solar_system_id,
+        "tracker_info": tracker_info,
+    }
+    digest = hashlib.md5(
+        json.dumps(inputs, sort_keys=True, cls=JSONDateTimeEncoder).encode("utf-8")
+    ).hexdigest()
+    return f"{__title__}_embed_{killmail.id}_{digest}"
+
+
 def create_embed(tracker: Tracker, killmail: Killmail) -> dhooks_lite.Embed:
     """Create Discord embed for a killmail."""
 
-    resolver = EveEntity.objects.bulk_resolve_names(ids=killmail.entity_ids())
+    resolver = resolve_names(_rendered_entity_ids(killmail))
 
     # victim
     if killmail.victim.alliance_id:
@@ -113,12 +175,7 @@ def create_embed(tracker: Tracker, killmail: Killmail) -> dhooks_lite.Embed:
         victim_str = ""
 
     # final attacker
-    for attacker in killmail.attackers:
-        if attacker.is_final_blow:
-            final_attacker = attacker
-            break
-    else:
-        final_attacker = None
+    final_attacker = killmail.attacker_final_blow()
 
     if final_attacker:
         if final_attacker.corporation_id:
@@ -281,6 +338,32 @@ def create_embed(tracker: Tracker, killmail: Killmail) -> dhooks_lite.Embed:
     return embed
 
 
+def _rendered_entity_ids(killmail: Killmail) -> Set[int]:
+    """Return IDs of all entities shown in the embed for a killmail."""
+    victim = killmail.victim
+    ids = {
+        victim.character_id,
+        victim.corporation_id,
+        victim.alliance_id,
+        victim.ship_type_id,
+        killmail.solar_system_id,
+    }
+    final_attacker = killmail.attacker_final_blow()
+    if final_attacker:
+        ids |= {
+            final_attacker.character_id,
+            final_attacker.corporation_id,
+            final_attacker.faction_id,
+            final_attacker.ship_type_id,
+        }
+    if killmail.tracker_info:
+        if killmail.tracker_info.main_org:
+            ids.add(killmail.tracker_info.main_org.id)
+        ids.update(killmail.tracker_info.matching_ship_type_ids or [])
+    ids.discard(None)
+    return ids
+
+
 def _character_zkb_link(
     tracker, entity_id: int, resolver: EveEntityNameResolver
 ) -> str:
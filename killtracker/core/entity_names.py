@@ -0,0 +1,118 @@
+"""Cache of the names of Eve entities for rendering messages."""
+
+from typing import Dict, Iterable
+
+from eveuniverse.helpers import EveEntityNameResolver
+from eveuniverse.models import EveEntity
+
+from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.helpers import chunks
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_ENTITY_NAMES_CACHE_TIMEOUT
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+class EntityNameCache:
+    """Redis backed cache mapping entity IDs to their names.
+
+    The cache is warmed from the local database after it expires
+    and names are added as they are resolved in between.
+    """
+
+    KEY = f"{__title__}_entity_names"
+    _WARMED_FIELD = "warmed"
+    _CHUNK_SIZE = 1_000
+
+    @classmethod
+    def exists(cls) -> bool:
+        """Return True when the cache has been warmed, else False."""
+        return bool(get_redis_client().hexists(cls.KEY, cls._WARMED_FIELD))
+
+    @classmethod
+    def warm(cls) -> int:
+        """Fill the cache with all names known locally
+        and return the number of names.
+        """
+        names = dict(
+            EveEntity.objects.exclude(name="").values_list("id", "name").iterator()
+        )
+        names.update(
+            EveCorporationInfo.objects.values_list(
+                "corporation_id", "corporation_name"
+            ).iterator()
+        )
+        names.update(
+            EveAllianceInfo.objects.values_list(
+                "alliance_id", "alliance_name"
+            ).iterator()
+        )
+        pipe = get_redis_client().pipeline()
+        pipe.hset(cls.KEY, cls._WARMED_FIELD, 1)
+        for chunk in chunks(list(names.items()), cls._CHUNK_SIZE):
+            pipe.hset(cls.KEY, mapping=dict(chunk))
+        pipe.expire(cls.KEY, KILLTRACKER_ENTITY_NAMES_CACHE_TIMEOUT)
+        pipe.execute()
+        logger.info("Warmed entity name cache with %d names", len(names))
+        return len(names)
+
+    @classmethod
+    def names(cls, ids: Iterable[int]) -> Dict[int, str]:
+        """Return map of given IDs to their cached names.
+
+        IDs without a cached name are not included.
+        """
+        ids = list(ids)
+        if not ids:
+            return dict()
+        values = get_redis_client().hmget(cls.KEY, ids)
+        return {
+            entity_id: value.decode() if isinstance(value, bytes) else value
+            for entity_id, value in zip(ids, values)
+            if value is not None
+        }
+
+    @classmethod
+    def add(cls, names: Dict[int, str]) -> None:
+        """Add names to the cache.
+
+        Does not renew the timeout, which is only set when the cache is warmed.
+        """
+        names = {entity_id: name for entity_id, name in names.items() if name}
+        if names:
+            get_redis_client().hset(cls.KEY, mapping=names)
+
+    @classmethod
+    def clear(cls) -> None:
+        get_redis_client().delete(cls.KEY)
+
+
+def resolve_names(ids: Iterable[int]) -> EveEntityNameResolver:
+    """Return resolver for the names of given entity IDs.
+
+    Names are looked up in the cache first, then in the local database.
+    Only names which are still unknown are resolved from ESI in one batch.
+    """
+    ids = {int(entity_id) for entity_id in ids if entity_id}
+    names = EntityNameCache.names(ids)
+    missing_ids = ids.difference(names.keys())
+    if missing_ids:
+        names_new = _names_from_database(missing_ids)
+        unknown_ids = missing_ids.difference(names_new.keys())
+        if unknown_ids:
+            logger.debug("Resolving %d entity names from ESI", len(unknown_ids))
+            EveEntity.objects.update_from_esi_by_id(unknown_ids)
+            names_new.update(_names_from_database(unknown_ids))
+        EntityNameCache.add(names_new)
+        names.update(names_new)
+    return EveEntityNameResolver(names)
+
+
+def _names_from_database(ids: Iterable[int]) -> Dict[int, str]:
+    return dict(
+        EveEntity.objects.filter(id__in=ids).exclude(name="").values_list("id", "name")
+    )
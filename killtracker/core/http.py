@@ -0,0 +1,165 @@
+"""Pooled HTTP sessions shared by all outgoing requests of a process."""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import dhooks_lite
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.json import JSONDateTimeEncoder
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_HTTP_MAX_RETRIES,
+    KILLTRACKER_HTTP_POOL_MAXSIZE,
+    KILLTRACKER_HTTP_RETRY_BACKOFF_FACTOR,
+)
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+REQUESTS_TIMEOUT = (5, 30)
+
+_sessions: Dict[str, requests.Session] = dict()
+_sessions_pid: Optional[int] = None
+_sessions_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ConnectionStats:
+    """Connection reuse statistics for a host."""
+
+    host: str
+    requests: int
+    connections: int
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Share of requests which reused an existing connection."""
+        if not self.requests:
+            return 0.0
+        return max(0.0, 1 - self.connections / self.requests)
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the pooled session for the host of the given URL.
+
+    Sessions are created on first use and then shared within the process.
+    They are recreated after a fork, e.g. for new Celery worker processes.
+    """
+    global _sessions_pid
+    host = _host_from_url(url)
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        try:
+            return _sessions[host]
+        except KeyError:
+            session = _create_session()
+            _sessions[host] = session
+            return session
+
+
+def connection_stats() -> List[ConnectionStats]:
+    """Return connection reuse statistics for all pooled sessions."""
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    result = []
+    for host, session in sessions:
+        num_requests = 0
+        num_connections = 0
+        adapters = {id(obj): obj for obj in session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool:
+                    num_requests += pool.num_requests
+                    num_connections += pool.num_connections
+        result.append(
+            ConnectionStats(
+                host=host, requests=num_requests, connections=num_connections
+            )
+        )
+    return result
+
+
+def log_connection_stats() -> None:
+    for stats in connection_stats():
+        logger.info(
+            "%s: %d requests over %d connections (%.0f%% reused)",
+            stats.host,
+            stats.requests,
+            stats.connections,
+            stats.reuse_ratio * 100,
+        )
+
+
+def close_sessions() -> None:
+    """Close all pooled sessions."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _host_from_url(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _create_session() -> requests.Session:
+    # Requests are only retried when it is safe to do so.
+    # POST requests are therefore only retried when no connection could be made.
+    retry = Retry(
+        total=KILLTRACKER_HTTP_MAX_RETRIES,
+        backoff_factor=KILLTRACKER_HTTP_RETRY_BACKOFF_FACTOR,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=KILLTRACKER_HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PooledWebhook(dhooks_lite.Webhook):
+    """A Discord webhook which sends requests over the pooled session of its host.
+
+    dhooks-lite has no public API for passing a session,
+    so this overrides the method it sends requests with.
+    The supported versions of dhooks-lite are therefore pinned in setup.py.
+    """
+
+    def _send_request_to_webhook(self, payload: dict, wait_for_response: bool):
+        logger.debug("Sending request to '%s' with payload: %s", self.url, payload)
+        r = get_session(self.url).post(
+            url=self.url,
+            params={"wait": wait_for_response},
+            headers={
+                "Content-Type": "application/json",
+                "User-Agent": str(self.user_agent),
+            },
+            data=json.dumps(payload, cls=JSONDateTimeEncoder),
+            timeout=REQUESTS_TIMEOUT,
+        )
+        if not r.ok:
+            logger.warning("HTTP status code: %s", r.status_code)
+        else:
+            logger.debug("HTTP status code: %s", r.status_code)
+        return r
@@ -0,0 +1,57 @@
+"""Write-behind buffer for storing received killmails in the database."""
+
+from typing import List, Tuple
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from .killmails import Killmail
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+class KillmailArchiveBuffer:
+    """Buffer of received killmails waiting to be stored in the database.
+
+    Killmails are kept in a Redis list in the order they were received.
+    Only one process must read from the buffer at a time.
+    """
+
+    _KEY = f"{__title__}_archive_buffer"
+
+    @classmethod
+    def add(cls, killmail: Killmail) -> int:
+        """Add a killmail to the buffer and return the new size of the buffer."""
+        return get_redis_client().rpush(cls._KEY, killmail.asstorage())
+
+    @classmethod
+    def size(cls) -> int:
+        return get_redis_client().llen(cls._KEY)
+
+    @classmethod
+    def read(cls, max_count: int) -> Tuple[List[Killmail], int]:
+        """Read the oldest killmails from the buffer without removing them.
+
+        Returns the killmails and the number of items read,
+        which includes items that could not be decoded.
+        """
+        items = get_redis_client().lrange(cls._KEY, 0, max_count - 1)
+        killmails = []
+        for data in items:
+            try:
+                killmails.append(Killmail.from_storage(data))
+            except Exception:
+                logger.warning("Skipping invalid killmail in buffer", exc_info=True)
+        return killmails, len(items)
+
+    @classmethod
+    def remove(cls, count: int) -> None:
+        """Remove the oldest killmails from the buffer."""
+        if count > 0:
+            get_redis_client().ltrim(cls._KEY, count, -1)
+
+    @classmethod
+    def clear(cls) -> None:
+        get_redis_client().delete(cls._KEY)
@@ -1,8 +1,13 @@
 import json
-from dataclasses import asdict, dataclass
+import struct
+from array import array
+from collections import Counter
+from contextlib import nullcontext
+from copy import deepcopy
+from dataclasses import asdict, dataclass, field, fields, is_dataclass
 from datetime import datetime
 from http import HTTPStatus
-from typing import List, Optional, Set
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Union
 
 import requests
 from dacite import DaciteError, from_dict
@@ -20,19 +25,49 @@ from app_utils.logging import LoggerAddTag
 
 from .. import USER_AGENT_TEXT, __title__
 from ..app_settings import (
+    KILLTRACKER_KILLMAIL_LOCAL_CACHE_SIZE,
     KILLTRACKER_REDISQ_LOCK_TIMEOUT,
     KILLTRACKER_REDISQ_TTW,
     KILLTRACKER_STORAGE_KILLMAILS_LIFETIME,
 )
 from ..exceptions import KillmailDoesNotExist
 from ..providers import esi
+from .http import REQUESTS_TIMEOUT, get_session
+from .latency import STAGE_RECEIVED, now
+from .local_cache import LocalCache, LocalCacheStats
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
 
 ZKB_REDISQ_URL = "https://redisq.zkillboard.com/listen.php"
 ZKB_API_URL = "https://zkillboard.com/api/"
 ZKB_KILLMAIL_BASEURL = "https://zkillboard.com/kill/"
-REQUESTS_TIMEOUT = (5, 30)
+
+# decoded killmails of this process, so trackers do not need to fetch them again
+_local_cache = LocalCache(
+    name="killmails",
+    maxsize=KILLTRACKER_KILLMAIL_LOCAL_CACHE_SIZE,
+    timeout=KILLTRACKER_STORAGE_KILLMAILS_LIFETIME,
+)
+
+# Binary format for killmails in temporary storage:
+# magic, version, length of header, header as JSON, attackers as packed rows.
+# Each attacker row starts with a bit mask of the fields which are not None.
+_BINARY_MAGIC = b"\x00KM"
+_BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct("<4sI")
+_BINARY_ATTACKER = struct.Struct("<HIIIIIIIBd")
+_BINARY_ATTACKER_FIELDS = (
+    "character_id",
+    "corporation_id",
+    "alliance_id",
+    "faction_id",
+    "ship_type_id",
+    "weapon_type_id",
+    "damage_done",
+    "is_final_blow",
+    "security_status",
+)
+_BINARY_ATTACKER_ALL_FIELDS = (1 << len(_BINARY_ATTACKER_FIELDS)) - 1
 
 
 @dataclass
@@ -73,6 +108,220 @@ class KillmailAttacker(_KillmailCharacter):
     weapon_type_id: Optional[int] = None
 
 
+def _column_property(name: str) -> property:
+    def getter(self):
+        return self._attackers.value(name, self._idx)
+
+    def setter(self, value):
+        self._attackers.set_value(name, self._idx, value)
+
+    return property(getter, setter)
+
+
+class KillmailAttackerView:
+    """View of an attacker stored in KillmailAttackers.
+
+    Behaves like a KillmailAttacker.
+    Changes to a view are written through to the attackers.
+    """
+
+    __slots__ = ("_attackers", "_idx")
+
+    ENTITY_PROPS = KillmailAttacker.ENTITY_PROPS
+
+    character_id = _column_property("character_id")
+    corporation_id = _column_property("corporation_id")
+    alliance_id = _column_property("alliance_id")
+    faction_id = _column_property("faction_id")
+    ship_type_id = _column_property("ship_type_id")
+    damage_done = _column_property("damage_done")
+    is_final_blow = _column_property("is_final_blow")
+    security_status = _column_property("security_status")
+    weapon_type_id = _column_property("weapon_type_id")
+
+    def __init__(self, attackers: "KillmailAttackers", idx: int) -> None:
+        self._attackers = attackers
+        self._idx = idx
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, KillmailAttackerView):
+            return self.asdict() == other.asdict()
+        if isinstance(other, KillmailAttacker):
+            return self.asdict() == asdict(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.to_attacker()).replace(
+            KillmailAttacker.__name__, type(self).__name__, 1
+        )
+
+    def asdict(self) -> dict:
+        return {name: getattr(self, name) for name in KillmailAttackers.FIELDS}
+
+    def to_attacker(self) -> KillmailAttacker:
+        """Return a copy of this attacker as independent object."""
+        return KillmailAttacker(**self.asdict())
+
+
+class KillmailAttackers:
+    """Attackers of a killmail stored in columns.
+
+    Each field is stored as a separate array,
+    which needs much less memory than a list of objects.
+    Distinct values and counts for a field are calculated once and then cached.
+
+    For backwards compatibility attackers can be accessed like a list,
+    which returns views into the columns.
+    """
+
+    FIELDS = (
+        "character_id",
+        "corporation_id",
+        "alliance_id",
+        "faction_id",
+        "ship_type_id",
+        "damage_done",
+        "is_final_blow",
+        "security_status",
+        "weapon_type_id",
+    )
+    _NULL_INT = -(2**63)
+    _NULL_BOOL = -1
+    _NULL_FLOAT = float("nan")
+
+    def __init__(self, attackers: Iterable[KillmailAttacker] = ()) -> None:
+        self._columns = {name: self._create_column(name) for name in self.FIELDS}
+        self._cache = dict()
+        for attacker in attackers:
+            self.append(attacker)
+
+    def __len__(self) -> int:
+        return len(self._columns["character_id"])
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [KillmailAttackerView(self, n) for n in range(len(self))[idx]]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("attacker index out of range")
+        return KillmailAttackerView(self, idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield KillmailAttackerView(self, idx)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, KillmailAttackers):
+            return all(self.values(name) == other.values(name) for name in self.FIELDS)
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({list(self)})"
+
+    def __deepcopy__(self, memo) -> "KillmailAttackers":
+        obj = type(self)()
+        obj._columns = {
+            name: array(col.typecode, col) for name, col in self._columns.items()
+        }
+        return obj
+
+    @classmethod
+    def from_values(cls, columns: Dict[str, List]) -> "KillmailAttackers":
+        """Create new attackers from a list of values for each field."""
+        obj = cls()
+        for name in cls.FIELDS:
+            null = obj._null(name)
+            obj._columns[name].extend(
+                null if value is None else value for value in columns[name]
+            )
+        return obj
+
+    def append(self, attacker: KillmailAttacker) -> None:
+        for name, column in self._columns.items():
+            value = getattr(attacker, name)
+            column.append(self._null(name) if value is None else value)
+        self._cache.clear()
+
+    def asdicts(self) -> List[dict]:
+        columns = [self.values(name) for name in self.FIELDS]
+        return [dict(zip(self.FIELDS, row)) for row in zip(*columns)]
+
+    def value(self, name: str, idx: int):
+        """Return value of a field for an attacker."""
+        return self._from_column(name, self._columns[name][idx])
+
+    def set_value(self, name: str, idx: int, value) -> None:
+        """Set value of a field for an attacker."""
+        self._columns[name][idx] = self._null(name) if value is None else value
+        self._cache.clear()
+
+    def values(self, name: str) -> List:
+        """Return values of a field for all attackers. Result is cached."""
+        key = ("values", name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        column = self._columns[name]
+        if name == "is_final_blow":
+            result = [None if value < 0 else bool(value) for value in column]
+        elif name == "security_status":
+            result = [None if value != value else value for value in column]
+        else:
+            null = self._NULL_INT
+            result = [None if value == null else value for value in column]
+        self._cache[key] = result
+        return result
+
+    def distinct(self, name: str) -> FrozenSet:
+        """Return distinct values of a field excluding None. Result is cached."""
+        key = ("distinct", name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        result = frozenset(self.values(name)) - {None}
+        self._cache[key] = result
+        return result
+
+    def counts(self, name: str) -> Counter:
+        """Return number of attackers for each value of a field excluding None.
+        Result is cached.
+        """
+        key = ("counts", name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        result = Counter(value for value in self.values(name) if value is not None)
+        self._cache[key] = result
+        return result
+
+    def _create_column(self, name: str) -> array:
+        if name == "is_final_blow":
+            return array("b")
+        if name == "security_status":
+            return array("d")
+        return array("q")
+
+    def _null(self, name: str):
+        if name == "is_final_blow":
+            return self._NULL_BOOL
+        if name == "security_status":
+            return self._NULL_FLOAT
+        return self._NULL_INT
+
+    def _from_column(self, name: str, value):
+        if name == "is_final_blow":
+            return None if value < 0 else bool(value)
+        if name == "security_status":
+            return None if value != value else value
+        return None if value == self._NULL_INT else value
+
+
 @dataclass
 class KillmailPosition(_KillmailBase):
     x: Optional[float] = None
@@ -135,25 +384,30 @@ class Killmail(_KillmailBase):
     zkb: KillmailZkb
     solar_system_id: Optional[int] = None
     tracker_info: Optional[TrackerInfo] = None
+    timestamps: Dict[str, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not isinstance(self.attackers, KillmailAttackers):
+            self.attackers = KillmailAttackers(self.attackers)
 
     def __repr__(self):
         return f"{type(self).__name__}(id={self.id})"
 
     def attackers_distinct_alliance_ids(self) -> Set[int]:
         """Return distinct alliance IDs of all attackers."""
-        return {obj.alliance_id for obj in self.attackers if obj.alliance_id}
+        return {obj for obj in self.attackers.distinct("alliance_id") if obj}
 
     def attackers_distinct_corporation_ids(self) -> Set[int]:
         """Return distinct corporation IDs of all attackers."""
-        return {obj.corporation_id for obj in self.attackers if obj.corporation_id}
+        return {obj for obj in self.attackers.distinct("corporation_id") if obj}
 
     def attackers_distinct_character_ids(self) -> Set[int]:
         """Return distinct character IDs of all attackers."""
-        return {obj.character_id for obj in self.attackers if obj.character_id}
+        return {obj for obj in self.attackers.distinct("character_id") if obj}
 
     def attackers_ship_type_ids(self) -> List[int]:
         """Returns ship type IDs of all attackers with duplicates."""
-        return [obj.ship_type_id for obj in self.attackers if obj.ship_type_id]
+        return [obj for obj in self.attackers.values("ship_type_id") if obj]
 
     def entity_ids(self) -> Set[int]:
         """Return distinct IDs of all entities (excluding None)."""
@@ -165,17 +419,8 @@ class Killmail(_KillmailBase):
             self.victim.ship_type_id,
             self.solar_system_id,
         }
-        for attacker in self.attackers:
-            ids.update(
-                {
-                    attacker.character_id,
-                    attacker.corporation_id,
-                    attacker.alliance_id,
-                    attacker.faction_id,
-                    attacker.ship_type_id,
-                    attacker.weapon_type_id,
-                }
-            )
+        for prop in KillmailAttacker.ENTITY_PROPS:
+            ids.update(self.attackers.distinct(prop))
         ids.discard(None)
         return ids
 
@@ -187,42 +432,138 @@ class Killmail(_KillmailBase):
 
     def attacker_final_blow(self) -> Optional[KillmailAttacker]:
         """Returns the attacker with the final blow or None if not found."""
-        for attacker in self.attackers:
-            if attacker.is_final_blow:
-                return attacker
-        return None
+        try:
+            idx = self.attackers.values("is_final_blow").index(True)
+        except ValueError:
+            return None
+        return self.attackers[idx]
+
+    def mark_stage(self, stage: str) -> None:
+        """Record the time this killmail reached a stage of the pipeline."""
+        self.timestamps[stage] = now()
+
+    def asdict(self) -> dict:
+        result = dict()
+        for obj in fields(self):
+            value = getattr(self, obj.name)
+            if isinstance(value, KillmailAttackers):
+                result[obj.name] = value.asdicts()
+            elif is_dataclass(value):
+                result[obj.name] = asdict(value)
+            else:
+                result[obj.name] = deepcopy(value)
+        return result
 
     def asjson(self) -> str:
-        return json.dumps(asdict(self), cls=JSONDateTimeEncoder)
+        return json.dumps(self.asdict(), cls=JSONDateTimeEncoder)
+
+    def asbytes(self) -> bytes:
+        """Return this killmail in the compact binary format.
+
+        Raises struct.error if an attacker can not be packed,
+        e.g. because an ID is out of range.
+        """
+        header = {
+            "id": self.id,
+            "time": self.time.isoformat(),
+            "victim": self.victim.asdict(),
+            "position": self.position.asdict(),
+            "zkb": self.zkb.asdict(),
+            "solar_system_id": self.solar_system_id,
+            "tracker_info": self.tracker_info.asdict() if self.tracker_info else None,
+            "timestamps": self.timestamps,
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        version = _BINARY_MAGIC + bytes([_BINARY_VERSION])
+        parts = [_BINARY_HEADER.pack(version, len(header_bytes)), header_bytes]
+        pack = _BINARY_ATTACKER.pack
+        columns = [self.attackers.values(name) for name in _BINARY_ATTACKER_FIELDS]
+        for values in zip(*columns):
+            values = list(values)
+            mask = 0
+            for bit, value in enumerate(values):
+                if value is not None:
+                    mask |= 1 << bit
+                else:
+                    values[bit] = 0
+            parts.append(pack(mask, *values))
+        return b"".join(parts)
 
     def save(self) -> None:
-        """Save this killmail to temporary storage."""
+        """Save this killmail to temporary storage.
+
+        Killmails with tracker info are stored separately for each tracker.
+        Killmails are stored in the compact binary format if possible, else as JSON.
+        """
+        key = self._storage_key(self.id, self._tracker_pk())
         cache.set(
-            key=self._storage_key(self.id),
-            value=self.asjson(),
+            key=key,
+            value=self.asstorage(),
             timeout=KILLTRACKER_STORAGE_KILLMAILS_LIFETIME,
         )
+        _local_cache.delete(key)
+
+    def asstorage(self) -> Union[bytes, str]:
+        """Return this killmail in the compact binary format if possible,
+        else as JSON.
+        """
+        try:
+            return self.asbytes()
+        except struct.error:
+            logger.debug("%s: Can not pack killmail, storing as JSON", self.id)
+            return self.asjson()
 
     def delete(self) -> bool:
         """Delete this killmail from temporary storage.
 
         Returns True on success, else False.
         """
-        return cache.delete(self._storage_key(self.id))
+        key = self._storage_key(self.id, self._tracker_pk())
+        _local_cache.delete(key)
+        return cache.delete(key)
+
+    def _tracker_pk(self) -> Optional[int]:
+        return self.tracker_info.tracker_pk if self.tracker_info else None
 
     @classmethod
-    def get(cls, id: int) -> "Killmail":
-        """Fetch a killmail from temporary storage."""
-        data = cache.get(key=cls._storage_key(id))
-        if not data:
-            raise KillmailDoesNotExist(
-                f"Killmail with ID {id} does not exist in storage."
-            )
-        return cls.from_json(data)
+    def get(cls, id: int, tracker_pk: Optional[int] = None) -> "Killmail":
+        """Fetch a killmail from temporary storage.
+
+        When a tracker is given will try to fetch the killmail
+        with tracker info from that tracker first.
+
+        Decoded killmails are kept in a local cache of the current process.
+        Returned killmails are therefore shared and must not be modified.
+        """
+        keys = [cls._storage_key(id, tracker_pk)] if tracker_pk else []
+        keys.append(cls._storage_key(id))
+        for key in keys:
+            killmail = _local_cache.get(key)
+            if killmail:
+                return killmail
+            data = cache.get(key=key)
+            if data:
+                killmail = cls.from_storage(data)
+                _local_cache.set(key, killmail)
+                return killmail
+        raise KillmailDoesNotExist(f"Killmail with ID {id} does not exist in storage.")
+
+    @staticmethod
+    def local_cache_stats() -> LocalCacheStats:
+        """Return usage statistics of the local cache for this process."""
+        return _local_cache.stats()
+
+    @staticmethod
+    def clear_local_cache() -> None:
+        """Remove all killmails from the local cache of this process."""
+        _local_cache.clear()
 
     @classmethod
-    def _storage_key(cls, id: int) -> str:
-        return cls._STORAGE_BASE_KEY + str(id)
+    def _storage_key(cls, id: int, tracker_pk: Optional[int] = None) -> str:
+        key = cls._STORAGE_BASE_KEY + str(id)
+        if tracker_pk:
+            key += f"_{tracker_pk}"
+        return key
 
     @classmethod
     def from_dict(cls, data: dict) -> "Killmail":
@@ -237,18 +578,80 @@ class Killmail(_KillmailBase):
         return cls.from_dict(json.loads(json_str, cls=JSONDateTimeDecoder))
 
     @classmethod
-    def create_from_zkb_redisq(cls) -> Optional["Killmail"]:
+    def from_bytes(cls, data: bytes) -> "Killmail":
+        """Create a killmail from the compact binary format."""
+        version, header_size = _BINARY_HEADER.unpack_from(data)
+        if version[:3] != _BINARY_MAGIC:
+            raise ValueError("Data is not a killmail in binary format")
+        if version[3] != _BINARY_VERSION:
+            raise ValueError(f"Unsupported binary format version: {version[3]}")
+
+        offset = _BINARY_HEADER.size
+        header = json.loads(data[offset : offset + header_size])
+        offset += header_size
+        rows = [
+            values
+            if mask == _BINARY_ATTACKER_ALL_FIELDS
+            else [
+                value if mask & (1 << bit) else None for bit, value in enumerate(values)
+            ]
+            for mask, *values in _BINARY_ATTACKER.iter_unpack(data[offset:])
+        ]
+        columns = zip(*rows) if rows else [()] * len(_BINARY_ATTACKER_FIELDS)
+        attackers = KillmailAttackers.from_values(
+            dict(zip(_BINARY_ATTACKER_FIELDS, columns))
+        )
+
+        tracker_info = header["tracker_info"]
+        if tracker_info:
+            for prop in ("main_org", "main_ship_group"):
+                if tracker_info[prop]:
+                    tracker_info[prop] = EntityCount(**tracker_info[prop])
+            tracker_info = TrackerInfo(**tracker_info)
+
+        return cls(
+            id=header["id"],
+            time=datetime.fromisoformat(header["time"]),
+            victim=KillmailVictim(**header["victim"]),
+            attackers=attackers,
+            position=KillmailPosition(**header["position"]),
+            zkb=KillmailZkb(**header["zkb"]),
+            solar_system_id=header["solar_system_id"],
+            tracker_info=tracker_info,
+            timestamps=header["timestamps"],
+        )
+
+    @classmethod
+    def from_storage(cls, data: Union[bytes, str]) -> "Killmail":
+        """Create a killmail from the binary format or from JSON."""
+        # killmails stored by older versions are still in JSON
+        if isinstance(data, bytes) and data.startswith(_BINARY_MAGIC):
+            return cls.from_bytes(data)
+        return cls.from_json(data)
+
+    @classmethod
+    def create_from_zkb_redisq(
+        cls, session: Optional[requests.Session] = None, use_lock: bool = True
+    ) -> Optional["Killmail"]:
         """Fetches and returns a killmail from ZKB.
 
+        Args:
+            session: Session used for the request, e.g. to keep the connection alive
+            use_lock: Whether to acquire a lock to ensure atomic access to RedisQ.
+                Can be disabled if there is only a single consumer.
+
         Returns None if no killmail is received.
         """
         logger.debug("Trying to fetch killmail from ZKB RedisQ...")
-        redis = get_redis_client()
         try:
-            with redis.lock(
-                cls.lock_key(), blocking_timeout=KILLTRACKER_REDISQ_LOCK_TIMEOUT
-            ):
-                r = requests.get(
+            if use_lock:
+                lock = get_redis_client().lock(
+                    cls.lock_key(), blocking_timeout=KILLTRACKER_REDISQ_LOCK_TIMEOUT
+                )
+            else:
+                lock = nullcontext()
+            with lock:
+                r = (session or get_session(ZKB_REDISQ_URL)).get(
                     ZKB_REDISQ_URL,
                     params={"ttw": KILLTRACKER_REDISQ_TTW},
                     timeout=REQUESTS_TIMEOUT,
@@ -275,7 +678,10 @@ class Killmail(_KillmailBase):
         if data and "package" in data and data["package"]:
             logger.debug("Received a killmail from ZKB RedisQ")
             package_data = data["package"]
-            return cls._create_from_dict(package_data)
+            killmail = cls._create_from_dict(package_data)
+            if killmail:
+                killmail.mark_stage(STAGE_RECEIVED)
+            return killmail
         else:
             logger.debug("Did not received a killmail from ZKB RedisQ")
             return None
@@ -296,7 +702,7 @@ class Killmail(_KillmailBase):
             killmail_id,
         )
         url = f"{ZKB_API_URL}killID/{killmail_id}/"
-        r = requests.get(
+        r = get_session(url).get(
             url, timeout=REQUESTS_TIMEOUT, headers={"User-Agent": USER_AGENT_TEXT}
         )
         r.raise_for_status()
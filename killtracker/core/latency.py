@@ -0,0 +1,241 @@
+"""Latency of killmails through the pipeline from receipt on ZKB to Discord."""
+
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_LATENCY_STATS_ENABLED
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+STAGE_RECEIVED = "received"
+STAGE_STORED = "stored"
+STAGE_MATCHED = "matched"
+STAGE_GENERATED = "generated"
+STAGE_ENQUEUED = "enqueued"
+STAGE_SENT = "sent"
+STAGE_TOTAL = "total"
+
+STAGES = (
+    STAGE_RECEIVED,
+    STAGE_STORED,
+    STAGE_MATCHED,
+    STAGE_GENERATED,
+    STAGE_ENQUEUED,
+    STAGE_SENT,
+)
+
+SCOPE_TRACKER = "tracker"
+SCOPE_WEBHOOK = "webhook"
+
+# upper bounds of histogram buckets in seconds. Last bucket is for all above.
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_KEY_BASE = f"{__title__}_latency"
+_SUM_FIELD = "sum"
+
+
+def now() -> float:
+    return time.time()
+
+
+def add_stage(timestamps: Dict[str, float], stage: str) -> Dict[str, float]:
+    """Return copy of timestamps with the current time added for a stage."""
+    return {**timestamps, stage: now()}
+
+
+@dataclass(frozen=True)
+class LatencyStats:
+    """Aggregated latency of a stage for a tracker or webhook."""
+
+    scope: str
+    obj_pk: int
+    stage: str
+    count: int
+    mean: Optional[float]
+    p50: Optional[float]
+    p95: Optional[float]
+    p99: Optional[float]
+
+
+class LatencyHistogram:
+    """Histogram of latencies with fixed buckets stored in Redis."""
+
+    def __init__(self, scope: str, obj_pk: int, stage: str) -> None:
+        self.scope = scope
+        self.obj_pk = int(obj_pk)
+        self.stage = stage
+
+    @property
+    def key(self) -> str:
+        return f"{_KEY_BASE}_{self.scope}_{self.obj_pk}_{self.stage}"
+
+    @classmethod
+    def from_key(cls, key: str) -> "LatencyHistogram":
+        scope, obj_pk, stage = key[len(_KEY_BASE) + 1 :].split("_", 2)
+        return cls(scope=scope, obj_pk=int(obj_pk), stage=stage)
+
+    @classmethod
+    def all(cls) -> List["LatencyHistogram"]:
+        """Return all existing histograms."""
+        keys = get_redis_client().scan_iter(match=f"{_KEY_BASE}_*")
+        return sorted(
+            (cls.from_key(_as_str(key)) for key in keys),
+            key=lambda obj: (obj.scope, obj.obj_pk, _stage_order(obj.stage)),
+        )
+
+    def add(self, seconds: float, pipe=None) -> None:
+        """Add a latency to this histogram."""
+        redis = pipe if pipe is not None else get_redis_client()
+        redis.hincrby(self.key, _bucket_index(seconds), 1)
+        redis.hincrbyfloat(self.key, _SUM_FIELD, seconds)
+
+    def counts(self) -> List[int]:
+        """Return number of latencies for each bucket."""
+        counts, _ = self._load()
+        return counts
+
+    def stats(self) -> LatencyStats:
+        """Return aggregated statistics for this histogram."""
+        counts, total = self._load()
+        count = sum(counts)
+        return LatencyStats(
+            scope=self.scope,
+            obj_pk=self.obj_pk,
+            stage=self.stage,
+            count=count,
+            mean=total / count if count else None,
+            p50=percentile(counts, 0.50),
+            p95=percentile(counts, 0.95),
+            p99=percentile(counts, 0.99),
+        )
+
+    def _load(self) -> Tuple[List[int], float]:
+        counts = [0] * (len(BUCKETS) + 1)
+        total = 0.0
+        for field, value in get_redis_client().hgetall(self.key).items():
+            field = _as_str(field)
+            if field == _SUM_FIELD:
+                total = float(value)
+            else:
+                counts[int(field)] = int(value)
+        return counts, total
+
+    def delete(self) -> None:
+        get_redis_client().delete(self.key)
+
+
+def percentile(counts: Sequence[int], quantile: float) -> Optional[float]:
+    """Return upper bound of the bucket containing the given quantile
+    or None if there are no latencies.
+
+    Returns infinity when the quantile is above the last bucket.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    for idx, count in enumerate(counts):
+        cumulative += count
+        if cumulative >= rank:
+            return BUCKETS[idx] if idx < len(BUCKETS) else float("inf")
+    return float("inf")
+
+
+def stage_latencies(timestamps: Dict[str, float]) -> Dict[str, float]:
+    """Return the latency of each stage from given timestamps.
+
+    The latency of a stage is the time since the previous recorded stage.
+    The total latency is the time from the first to the last recorded stage.
+    """
+    recorded = [stage for stage in STAGES if stage in timestamps]
+    if len(recorded) < 2:
+        return dict()
+    result = {
+        stage: max(0.0, timestamps[stage] - timestamps[previous])
+        for previous, stage in zip(recorded, recorded[1:])
+    }
+    result[STAGE_TOTAL] = max(0.0, timestamps[recorded[-1]] - timestamps[recorded[0]])
+    return result
+
+
+def record_latencies(
+    timestamps: Dict[str, float], tracker_pk: Optional[int], webhook_pk: int
+) -> None:
+    """Record latencies from given timestamps for a tracker and a webhook."""
+    latencies = stage_latencies(timestamps)
+    if not latencies:
+        return
+    pipe = get_redis_client().pipeline()
+    for stage, seconds in latencies.items():
+        LatencyHistogram(SCOPE_WEBHOOK, webhook_pk, stage).add(seconds, pipe)
+        if tracker_pk:
+            LatencyHistogram(SCOPE_TRACKER, tracker_pk, stage).add(seconds, pipe)
+    pipe.execute()
+
+
+def record_message_sent(message_json: str, webhook_pk: int) -> None:
+    """Record latencies of a message which was sent successfully.
+
+    Messages without latency data, e.g. test messages, are ignored.
+    """
+    if not KILLTRACKER_LATENCY_STATS_ENABLED:
+        return
+    try:
+        meta = json.loads(message_json).get("_meta")
+    except (ValueError, AttributeError):
+        meta = None
+    if not meta or not meta.get("timestamps"):
+        return
+    timestamps = add_stage(meta["timestamps"], STAGE_SENT)
+    try:
+        record_latencies(timestamps, meta.get("tracker_pk"), webhook_pk)
+    except Exception:
+        logger.warning("Failed to record latencies", exc_info=True)
+
+
+def format_latency(seconds: Optional[float]) -> str:
+    """Format a latency for display."""
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return f"> {BUCKETS[-1]}s"
+    return f"{seconds:.2f}s"
+
+
+def latency_stats() -> List[LatencyStats]:
+    """Return aggregated statistics for all trackers and webhooks."""
+    return [obj.stats() for obj in LatencyHistogram.all()]
+
+
+def reset_latency_stats() -> int:
+    """Delete all latency statistics and return the number of deleted histograms."""
+    histograms = LatencyHistogram.all()
+    for obj in histograms:
+        obj.delete()
+    return len(histograms)
+
+
+def _bucket_index(seconds: float) -> int:
+    for idx, upper_bound in enumerate(BUCKETS):
+        if seconds <= upper_bound:
+            return idx
+    return len(BUCKETS)
+
+
+def _stage_order(stage: str) -> int:
+    try:
+        return STAGES.index(stage)
+    except ValueError:
+        return len(STAGES)
+
+
+def _as_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
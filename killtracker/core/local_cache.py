@@ -0,0 +1,114 @@
+"""In-process cache for objects which are expensive to fetch or decode."""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+@dataclass(frozen=True)
+class LocalCacheStats:
+    """Usage statistics of a local cache."""
+
+    hits: int
+    misses: int
+    size: int
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LocalCache:
+    """Thread-safe LRU cache with a time-to-live for the current process.
+
+    Objects are shared between all users of the cache in a process
+    and must therefore not be modified.
+    A max size of 0 disables the cache.
+    """
+
+    def __init__(
+        self, name: str, maxsize: int, timeout: float, log_every: int = 1000
+    ) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._log_every = log_every
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return object for key or None if it is not cached or has expired."""
+        if not self.maxsize:
+            return None
+        with self._lock:
+            try:
+                expires_at, obj = self._data[key]
+            except KeyError:
+                obj = None
+            else:
+                if expires_at < time.monotonic():
+                    del self._data[key]
+                    obj = None
+                else:
+                    self._data.move_to_end(key)
+            if obj is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+            lookups = self._hits + self._misses
+        if self._log_every and lookups % self._log_every == 0:
+            self._log_stats()
+        return obj
+
+    def set(self, key: Hashable, obj: Any) -> None:
+        """Add an object to the cache. Removes the least recently used if full."""
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, obj)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all objects and reset the statistics."""
+        with self._lock:
+            self._data.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def stats(self) -> LocalCacheStats:
+        with self._lock:
+            return LocalCacheStats(
+                hits=self._hits, misses=self._misses, size=len(self._data)
+            )
+
+    def _log_stats(self) -> None:
+        stats = self.stats()
+        logger.info(
+            "Local cache for %s: %d hits, %d misses (%.0f%% hits), %d objects",
+            self.name,
+            stats.hits,
+            stats.misses,
+            stats.hit_ratio * 100,
+            stats.size,
+        )
@@ -0,0 +1,89 @@
+"""Combine queued Discord messages into as few requests as possible."""
+
+import json
+from typing import List, Optional
+
+from app_utils.json import JSONDateTimeDecoder, JSONDateTimeEncoder
+
+# limits of Discord for one message
+MAX_EMBEDS = 10
+MAX_EMBEDS_CHARS = 6_000
+
+_MERGE_FIELDS = ("content", "tts", "username", "avatar_url")
+
+
+class MessageBatch:
+    """A batch of queued messages, which are sent as one message to Discord.
+
+    Messages can be combined when they only differ in their embeds
+    and all embeds fit into one message.
+    """
+
+    def __init__(
+        self, max_embeds: int = MAX_EMBEDS, priority: Optional[int] = None
+    ) -> None:
+        self.max_embeds = min(max(1, max_embeds), MAX_EMBEDS)
+        self.priority = priority
+        self.messages: List[str] = []
+        self._head: Optional[dict] = None
+        self._embeds: List[dict] = []
+        self._embeds_chars = 0
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def add(self, message_json: str, message: Optional[dict] = None) -> bool:
+        """Add a message to this batch if it can be combined.
+
+        Params
+            message_json: The queued message
+            message: The queued message already decoded, if available
+
+        Returns True when the message was added, else False.
+        """
+        if message is None:
+            message = decode_message(message_json)
+        embeds = message.get("embeds") or []
+        embeds_chars = sum(embed_chars(embed) for embed in embeds)
+        if self._head is not None:
+            if not self._head.get("embeds") or not embeds:
+                return False
+            if _merge_key(message) != _merge_key(self._head):
+                return False
+            if len(self._embeds) + len(embeds) > self.max_embeds:
+                return False
+            if self._embeds_chars + embeds_chars > MAX_EMBEDS_CHARS:
+                return False
+        else:
+            self._head = message
+        self.messages.append(message_json)
+        self._embeds += embeds
+        self._embeds_chars += embeds_chars
+        return True
+
+    def asjson(self) -> str:
+        """Return combined message as JSON."""
+        if len(self.messages) == 1:
+            return self.messages[0]
+        message = {key: value for key, value in self._head.items() if key != "_meta"}
+        message["embeds"] = self._embeds
+        return json.dumps(message, cls=JSONDateTimeEncoder)
+
+
+def decode_message(message_json: str) -> dict:
+    """Return a queued message decoded from JSON."""
+    return json.loads(message_json, cls=JSONDateTimeDecoder)
+
+
+def embed_chars(embed: dict) -> int:
+    """Return number of characters of an embed, which count against Discord's limit."""
+    total = len(embed.get("title") or "") + len(embed.get("description") or "")
+    total += len((embed.get("footer") or {}).get("text") or "")
+    total += len((embed.get("author") or {}).get("name") or "")
+    for field in embed.get("fields") or []:
+        total += len(field.get("name") or "") + len(field.get("value") or "")
+    return total
+
+
+def _merge_key(message: dict) -> tuple:
+    return tuple(message.get(key) for key in _MERGE_FIELDS)
@@ -0,0 +1,252 @@
+"""Message queue with priority lanes."""
+
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis import Redis
+from simple_mq import SimpleMQ
+
+# Moves up to a max number of messages from a source queue
+# into the lanes of their priorities.
+# Counts the attempts of every message and moves messages
+# which have reached the max attempts into the dead letter queue.
+# The timeout of the attempts is only set when they are created,
+# so attempts of messages which are never requeued again expire.
+# KEYS: source, attempts, dead letters, lanes...
+# ARGV: max attempts, attempts timeout, default lane index, max messages,
+#   lane priorities...
+_ENQUEUE_FROM_SCRIPT = """
+local max_attempts = tonumber(ARGV[1])
+local default_lane = KEYS[3 + tonumber(ARGV[3])]
+local max_messages = tonumber(ARGV[4])
+local lanes = {}
+for i = 5, #ARGV do
+    lanes[ARGV[i]] = KEYS[i - 1]
+end
+local moved = 0
+local dead = 0
+for _ = 1, max_messages do
+    local message = redis.call('LPOP', KEYS[1])
+    if not message then
+        break
+    end
+    local digest = redis.sha1hex(message)
+    local attempts = redis.call('HINCRBY', KEYS[2], digest, 1)
+    if attempts >= max_attempts then
+        redis.call('RPUSH', KEYS[3], message)
+        redis.call('HDEL', KEYS[2], digest)
+        dead = dead + 1
+    else
+        local lane = default_lane
+        local ok, data = pcall(cjson.decode, message)
+        if ok and type(data) == 'table' and type(data['_meta']) == 'table' then
+            local priority = data['_meta']['priority']
+            if priority then
+                lane = lanes[tostring(priority)] or default_lane
+            end
+        end
+        redis.call('RPUSH', lane, message)
+        moved = moved + 1
+    end
+end
+if moved > 0 and redis.call('TTL', KEYS[2]) < 0 then
+    redis.call('EXPIRE', KEYS[2], tonumber(ARGV[2]))
+end
+return {moved, dead}
+"""
+
+
+class PriorityMQ:
+    """A message queue with priority lanes based on Redis.
+
+    Each lane is a separate FIFO queue. Messages are always dequeued
+    from the lane with the highest priority first.
+    The lane with the default priority has the name of the queue,
+    so messages queued before lanes were introduced are kept.
+    """
+
+    def __init__(
+        self,
+        conn: Redis,
+        name: str,
+        priorities: Iterable[int],
+        default_priority: int,
+    ) -> None:
+        priorities = sorted(set(priorities), reverse=True)
+        if default_priority not in priorities:
+            raise ValueError(f"Invalid default priority: {default_priority}")
+        self.default_priority = default_priority
+        self._name = str(name)
+        self._lanes: Dict[int, SimpleMQ] = {
+            priority: SimpleMQ(
+                conn,
+                self._name
+                if priority == default_priority
+                else f"{self._name}_p{priority}",
+            )
+            for priority in priorities
+        }
+        self._conn = conn
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name='{self.name}')"
+
+    @property
+    def conn(self) -> Redis:
+        return self._conn
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def priorities(self) -> List[int]:
+        """Priorities of all lanes from highest to lowest."""
+        return list(self._lanes.keys())
+
+    @property
+    def keys(self) -> List[str]:
+        """Redis keys of all lanes from highest to lowest priority."""
+        return [_redis_key(lane) for lane in self._lanes.values()]
+
+    @property
+    def _attempts_key(self) -> str:
+        return f"{_redis_key(self.lane())}_attempts"
+
+    def lane(self, priority: Optional[int] = None) -> SimpleMQ:
+        """Return lane for a priority.
+
+        Unknown priorities are mapped to the default lane.
+        """
+        return self._lanes.get(priority, self._lanes[self.default_priority])
+
+    def size(self) -> int:
+        """Return current number of messages in all lanes."""
+        return sum(self.sizes().values())
+
+    def sizes(self) -> Dict[int, int]:
+        """Return current number of messages per lane."""
+        pipe = self.conn.pipeline()
+        for key in self.keys:
+            pipe.llen(key)
+        return dict(zip(self.priorities, (int(obj) for obj in pipe.execute())))
+
+    def clear(self) -> int:
+        """Purge all lanes and return count of cleared messages."""
+        self.conn.delete(self._attempts_key)
+        return sum(lane.clear() for lane in self._lanes.values())
+
+    def enqueue(self, message: str, priority: Optional[int] = None) -> int:
+        """Enqueue one message into the lane of a priority
+        and return size of that lane after enqueuing.
+        """
+        return self.lane(priority).enqueue(message)
+
+    def enqueue_bulk(
+        self, messages: Iterable[str], priority: Optional[int] = None
+    ) -> Optional[int]:
+        """Enqueue messages into the lane of a priority.
+
+        Return size of that lane after enqueuing or None if list was empty.
+        """
+        return self.lane(priority).enqueue_bulk(messages)
+
+    def dequeue(self, priority: Optional[int] = None) -> Optional[str]:
+        """Dequeue the next message.
+
+        Messages are taken from the highest lane with messages
+        or only from the lane of the given priority.
+        Return None if there was no message.
+        """
+        message, _ = self.dequeue_with_priority(priority)
+        return message
+
+    def dequeue_with_priority(
+        self, priority: Optional[int] = None
+    ) -> Tuple[Optional[str], int]:
+        """Dequeue the next message and return it with its priority.
+
+        Messages are taken from the highest lane with messages
+        or only from the lane of the given priority.
+        """
+        priorities = self.priorities if priority is None else [priority]
+        for obj in priorities:
+            message = self.lane(obj).dequeue()
+            if message is not None:
+                return message, obj
+        return None, self.default_priority if priority is None else priority
+
+    def push_front(self, message: str, priority: Optional[int] = None) -> int:
+        """Put a dequeued message back to the front of the lane of a priority
+        and return size of that lane.
+        """
+        return self.conn.lpush(_redis_key(self.lane(priority)), str(message))
+
+    def peek(self, priority: Optional[int] = None) -> Tuple[Optional[str], int]:
+        """Return the next message without dequeuing it and its priority.
+
+        Messages are taken from the highest lane with messages
+        or only from the lane of the given priority.
+        """
+        priorities = self.priorities if priority is None else [priority]
+        pipe = self.conn.pipeline()
+        for obj in priorities:
+            pipe.lindex(_redis_key(self.lane(obj)), 0)
+        for obj, message in zip(priorities, pipe.execute()):
+            if message is not None:
+                return message.decode("utf8"), obj
+        return None, self.default_priority if priority is None else priority
+
+    def enqueue_from(
+        self,
+        source: SimpleMQ,
+        dead_letter_queue: SimpleMQ,
+        max_attempts: int,
+        attempts_timeout: int = 86_400,
+        batch_size: int = 100,
+    ) -> Tuple[int, int]:
+        """Move all messages from a source queue into this queue.
+
+        Messages are moved in atomic batches, so Redis is never blocked for long.
+        Messages are put into the lane of the priority in their meta data.
+        The attempts of every message are counted
+        and messages which reached the max attempts
+        are moved into the dead letter queue instead.
+
+        Returns the number of moved and the number of dead lettered messages.
+        """
+        priorities = self.priorities
+        keys = [
+            _redis_key(source),
+            self._attempts_key,
+            _redis_key(dead_letter_queue),
+            *self.keys,
+        ]
+        batch_size = max(1, batch_size)
+        args = [
+            max(1, max_attempts),
+            attempts_timeout,
+            priorities.index(self.default_priority) + 1,
+            batch_size,
+            *priorities,
+        ]
+        moved_total = dead_total = 0
+        while True:
+            moved, dead = self.conn.eval(_ENQUEUE_FROM_SCRIPT, len(keys), *keys, *args)
+            moved_total += int(moved)
+            dead_total += int(dead)
+            if int(moved) + int(dead) < batch_size:
+                break
+        return moved_total, dead_total
+
+    def clear_attempts(self, messages: Iterable[str]) -> None:
+        """Clear the counted attempts of messages, e.g. after they were sent."""
+        digests = [
+            hashlib.sha1(str(obj).encode("utf8")).hexdigest() for obj in messages
+        ]
+        if digests:
+            self.conn.hdel(self._attempts_key, *digests)
+
+
+def _redis_key(queue: SimpleMQ) -> str:
+    return f"{SimpleMQ.REDIS_KEY_PREFIX}_{queue.name}"
@@ -0,0 +1,109 @@
+"""Rate limiting of messages sent to Discord webhooks."""
+
+import math
+import time
+from typing import Optional
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.allianceauth import get_redis_client
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+# Takes a token from the bucket if possible.
+# Returns "0" when a token was taken or the state is unknown,
+# else the seconds until the bucket is refilled.
+_ACQUIRE_SCRIPT = """
+local values = redis.call('HMGET', KEYS[1], 'remaining', 'reset_at')
+if not values[1] or not values[2] then
+    return '0'
+end
+local wait = tonumber(values[2]) - tonumber(ARGV[1])
+if wait <= 0 then
+    return '0'
+end
+if tonumber(values[1]) > 0 then
+    redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+    return '0'
+end
+return tostring(wait)
+"""
+
+
+class WebhookRateLimiter:
+    """Token bucket for messages sent to a Discord webhook.
+
+    The bucket is filled from the rate limit headers of Discord's last response
+    and kept in Redis, so it is shared by all workers.
+    """
+
+    HEADER_REMAINING = "x-ratelimit-remaining"
+    HEADER_RESET_AFTER = "x-ratelimit-reset-after"
+
+    def __init__(self, webhook_pk: int) -> None:
+        self.webhook_pk = int(webhook_pk)
+        self._key = f"{__title__}_webhook_{self.webhook_pk}_rate_limit"
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(webhook_pk={self.webhook_pk})"
+
+    def acquire(self) -> float:
+        """Take a token for sending one message.
+
+        Returns 0 when a message can be sent right away,
+        else the seconds to wait until the bucket is refilled.
+        """
+        client = get_redis_client()
+        result = client.eval(_ACQUIRE_SCRIPT, 1, self._key, time.time())
+        return max(0.0, float(result))
+
+    def delay(self) -> Optional[float]:
+        """Return seconds to wait before the next message can be sent
+        or None if the current rate limit is not known.
+        """
+        remaining, reset_at = get_redis_client().hmget(
+            self._key, "remaining", "reset_at"
+        )
+        if remaining is None or reset_at is None:
+            return None
+        wait = float(reset_at) - time.time()
+        if wait <= 0 or int(remaining) > 0:
+            return 0.0
+        return wait
+
+    def update_from_headers(self, headers: dict) -> bool:
+        """Update the bucket from the headers of a response.
+
+        Returns True when the response had rate limit headers, else False.
+        """
+        headers = {str(key).lower(): value for key, value in headers.items()}
+        try:
+            remaining = int(headers[self.HEADER_REMAINING])
+            reset_after = float(headers[self.HEADER_RESET_AFTER])
+        except (KeyError, TypeError, ValueError):
+            return False
+        self._set(remaining, reset_after)
+        logger.debug(
+            "%s: %d requests remaining, reset after %s seconds",
+            self,
+            remaining,
+            reset_after,
+        )
+        return True
+
+    def block(self, seconds: float) -> None:
+        """Empty the bucket for the given seconds."""
+        self._set(0, seconds)
+
+    def clear(self) -> None:
+        get_redis_client().delete(self._key)
+
+    def _set(self, remaining: int, reset_after: float) -> None:
+        reset_after = max(0.0, reset_after)
+        reset_at = time.time() + reset_after
+        pipe = get_redis_client().pipeline()
+        pipe.hset(self._key, mapping={"remaining": remaining, "reset_at": reset_at})
+        pipe.expire(self._key, math.ceil(reset_after) + 1)
+        pipe.execute()
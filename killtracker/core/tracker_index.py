@@ -0,0 +1,190 @@
+"""Inverted index for finding the trackers which could match a killmail."""
+
+from collections import defaultdict
+from enum import Enum
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from .trackers import KillmailContext, TrackerRules
+from .universe import SolarSystemInfo
+
+
+class _Key(Enum):
+    """Dimensions trackers can be indexed by.
+
+    Each tracker is indexed by exactly one dimension,
+    which is the first one in this order the tracker has a require clause for.
+    """
+
+    SOLAR_SYSTEM = "solar_system"
+    CONSTELLATION = "constellation"
+    REGION = "region"
+    VICTIM_SHIP_TYPE = "victim_ship_type"
+    VICTIM_ALLIANCE = "victim_alliance"
+    VICTIM_CORPORATION = "victim_corporation"
+    ATTACKER_SHIP_TYPE = "attacker_ship_type"
+    ATTACKER_ORGANIZATION = "attacker_organization"
+    VICTIM_SHIP_GROUP = "victim_ship_group"
+    ATTACKER_SHIP_GROUP = "attacker_ship_group"
+    SECURITY = "security"
+
+
+_SECURITY_BANDS = ("high_sec", "low_sec", "null_sec", "w_space")
+
+
+class TrackerIndex:
+    """Inverted index of trackers by their selective clauses.
+
+    For a killmail it returns all trackers, which could possibly match.
+    Trackers without any selective clause are always returned.
+
+    The index only excludes trackers which can not match,
+    so the remaining trackers still need to be matched as usual.
+    """
+
+    def __init__(self, rules: Iterable[TrackerRules]) -> None:
+        self._always: Set[int] = set()
+        self._index: Dict[_Key, Dict[object, Set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        self._size = 0
+        for obj in rules:
+            self._add(obj)
+            self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    @classmethod
+    @lru_cache(maxsize=1)
+    def for_rules(cls, rules: Tuple[TrackerRules, ...]) -> "TrackerIndex":
+        """Return index for the given rules. The last index is cached."""
+        return cls(rules)
+
+    def candidates(self, context: KillmailContext) -> Set[int]:
+        """Return PKs of all trackers which could match the given killmail."""
+        result = set(self._always)
+        for key, buckets in self._index.items():
+            for value in self._killmail_values(key, context):
+                result.update(buckets.get(value, ()))
+        return result
+
+    def _add(self, rules: TrackerRules) -> None:
+        tracker_pk = rules.tracker_pk
+        for key, values in (
+            (_Key.SOLAR_SYSTEM, rules.require_solar_system_ids),
+            (_Key.CONSTELLATION, rules.require_constellation_ids),
+            (_Key.REGION, rules.require_region_ids),
+            (_Key.VICTIM_SHIP_TYPE, rules.require_victim_ship_type_ids),
+            (_Key.VICTIM_ALLIANCE, rules.require_victim_alliance_ids),
+            (_Key.VICTIM_CORPORATION, rules.require_victim_corporation_ids),
+            (_Key.ATTACKER_SHIP_TYPE, rules.require_attackers_ship_type_ids),
+            (_Key.ATTACKER_ORGANIZATION, self._attacker_organizations(rules)),
+            (_Key.VICTIM_SHIP_GROUP, rules.require_victim_ship_group_ids),
+            (_Key.ATTACKER_SHIP_GROUP, rules.require_attackers_ship_group_ids),
+            (_Key.SECURITY, self._security_bands(rules)),
+        ):
+            if values:
+                for value in values:
+                    self._index[key][value].add(tracker_pk)
+                return
+
+        self._always.add(tracker_pk)
+
+    @staticmethod
+    def _attacker_organizations(rules: TrackerRules) -> FrozenSet[Tuple[str, int]]:
+        """Return attacker organizations of which at least one must be present.
+
+        Alliance and corporation clauses are combined with AND normally,
+        so the alliances alone are sufficient for indexing if there are any.
+        When restricted to the final blow the clauses are combined with OR.
+        """
+        alliances = {("alliance", id) for id in rules.require_attacker_alliance_ids}
+        corporations = {
+            ("corporation", id) for id in rules.require_attacker_corporation_ids
+        }
+        if rules.require_attacker_organizations_final_blow:
+            return frozenset(alliances | corporations)
+        return frozenset(alliances or corporations)
+
+    @staticmethod
+    def _security_bands(rules: TrackerRules) -> FrozenSet[FrozenSet[str]]:
+        """Return allowed security bands as single key
+        or an empty set if all security bands are allowed.
+        """
+        allowed = frozenset(
+            band for band in _SECURITY_BANDS if not getattr(rules, f"exclude_{band}")
+        )
+        if len(allowed) == len(_SECURITY_BANDS):
+            return frozenset()
+        return frozenset([allowed])
+
+    def _killmail_values(self, key: _Key, context: KillmailContext) -> Iterable:
+        return self._KILLMAIL_VALUES[key](self, context)
+
+    def _solar_system_values(self, context: KillmailContext) -> Iterable:
+        solar_system = _solar_system(context)
+        return [solar_system.id] if solar_system else []
+
+    def _constellation_values(self, context: KillmailContext) -> Iterable:
+        solar_system = _solar_system(context)
+        return [solar_system.constellation_id] if solar_system else []
+
+    def _region_values(self, context: KillmailContext) -> Iterable:
+        solar_system = _solar_system(context)
+        return [solar_system.region_id] if solar_system else []
+
+    def _security_values(self, context: KillmailContext) -> Iterable:
+        solar_system = _solar_system(context)
+        if not solar_system:
+            return self._index[_Key.SECURITY].keys()  # will not match anyway
+        bands = {
+            band for band in _SECURITY_BANDS if getattr(solar_system, f"is_{band}")
+        }
+        return [allowed for allowed in self._index[_Key.SECURITY] if bands <= allowed]
+
+    def _victim_ship_type_values(self, context: KillmailContext) -> Iterable:
+        return [context.killmail.victim.ship_type_id]
+
+    def _victim_alliance_values(self, context: KillmailContext) -> Iterable:
+        return [context.killmail.victim.alliance_id]
+
+    def _victim_corporation_values(self, context: KillmailContext) -> Iterable:
+        return [context.killmail.victim.corporation_id]
+
+    def _attacker_ship_type_values(self, context: KillmailContext) -> Iterable:
+        return context.killmail.attackers_ship_type_ids()
+
+    def _attacker_organization_values(self, context: KillmailContext) -> Iterable:
+        killmail = context.killmail
+        return [
+            ("alliance", id) for id in killmail.attackers_distinct_alliance_ids()
+        ] + [
+            ("corporation", id) for id in killmail.attackers_distinct_corporation_ids()
+        ]
+
+    def _victim_ship_group_values(self, context: KillmailContext) -> Iterable:
+        return [context.ship_type_group_ids.get(context.killmail.victim.ship_type_id)]
+
+    def _attacker_ship_group_values(self, context: KillmailContext) -> Iterable:
+        group_ids = context.ship_type_group_ids
+        return {group_ids.get(id) for id in context.killmail.attackers_ship_type_ids()}
+
+    # Functions returning the values of a killmail for each dimension
+    _KILLMAIL_VALUES = {
+        _Key.SOLAR_SYSTEM: _solar_system_values,
+        _Key.CONSTELLATION: _constellation_values,
+        _Key.REGION: _region_values,
+        _Key.SECURITY: _security_values,
+        _Key.VICTIM_SHIP_TYPE: _victim_ship_type_values,
+        _Key.VICTIM_ALLIANCE: _victim_alliance_values,
+        _Key.VICTIM_CORPORATION: _victim_corporation_values,
+        _Key.ATTACKER_SHIP_TYPE: _attacker_ship_type_values,
+        _Key.ATTACKER_ORGANIZATION: _attacker_organization_values,
+        _Key.VICTIM_SHIP_GROUP: _victim_ship_group_values,
+        _Key.ATTACKER_SHIP_GROUP: _attacker_ship_group_values,
+    }
+
+
+def _solar_system(context: KillmailContext) -> Optional[SolarSystemInfo]:
+    return context.solar_system if context.killmail.solar_system_id else None
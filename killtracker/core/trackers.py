@@ -0,0 +1,605 @@
+"""Compiled tracker rules for matching killmails in memory."""
+
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from eveuniverse.helpers import meters_to_ly
+from eveuniverse.models import EveSolarSystem, EveType
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import (
+    KILLTRACKER_TRACKER_RULES_CACHE_TIMEOUT,
+    KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT,
+)
+from .character_states import CharacterStateIndex
+from .killmails import Killmail, TrackerInfo
+from .universe import NO_ROUTE, SolarSystemInfo, UniverseGraph
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+METERS_PER_LY = 9_460_730_472_580_800
+
+
+class KillmailContext:
+    """Data about a killmail which is shared between all trackers.
+
+    All data is loaded lazily and at most once,
+    so that trackers can be matched against a killmail without repeating queries.
+    """
+
+    def __init__(self, killmail: Killmail) -> None:
+        self.killmail = killmail
+        self._jumps: Dict[int, Optional[int]] = dict()
+
+    @cached_property
+    def eve_solar_system(self) -> Optional[EveSolarSystem]:
+        """Solar system of this killmail or None if it has none."""
+        if not self.killmail.solar_system_id:
+            return None
+        solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
+            id=self.killmail.solar_system_id
+        )
+        return solar_system
+
+    @cached_property
+    def solar_system(self) -> Optional[SolarSystemInfo]:
+        """Matching properties of the solar system or None if it has none."""
+        if not self.killmail.solar_system_id:
+            return None
+        info = UniverseGraph.instance().solar_system_info(self.killmail.solar_system_id)
+        if info:
+            return info
+        if not self.eve_solar_system:
+            return None
+        return SolarSystemInfo.from_solar_system(self.eve_solar_system)
+
+    @cached_property
+    def ship_type_group_ids(self) -> Dict[int, int]:
+        """Map of all ship type IDs in this killmail to their group ID."""
+        ids = self.killmail.ship_type_distinct_ids()
+        ids.discard(None)
+        # Make sure all ship types are in the local database
+        EveType.objects.bulk_get_or_create_esi(ids=ids)
+        return dict(
+            EveType.objects.filter(id__in=ids).values_list("id", "eve_group_id")
+        )
+
+    @cached_property
+    def character_state_ids(self) -> Dict[int, int]:
+        """Map of character IDs in this killmail to the Auth state of their owner.
+
+        Characters which are not owned by any user are not included.
+        """
+        character_ids = self.killmail.attackers_distinct_character_ids()
+        if self.killmail.victim.character_id:
+            character_ids.add(self.killmail.victim.character_id)
+        return CharacterStateIndex.state_ids_or_fetch(character_ids)
+
+    def distance_from(
+        self, origin_position: Optional[Tuple[float, float, float]]
+    ) -> Optional[float]:
+        """Distance in light years from given origin
+        or None if it can not be calculated, e.g. in WH space.
+        """
+        if not origin_position or not self.solar_system:
+            return None
+        position = self.solar_system.position
+        if not position:
+            return None
+        return meters_to_ly(math.dist(origin_position, position))
+
+    def jumps_from(self, origin_solar_system_id: int) -> Optional[int]:
+        """Number of jumps from given origin or None if there is no route."""
+        if not self.killmail.solar_system_id:
+            return None
+        if origin_solar_system_id not in self._jumps:
+            jumps = UniverseGraph.instance().jumps(
+                origin_solar_system_id, self.killmail.solar_system_id
+            )
+            if jumps is None:
+                jumps = self._jumps_from_esi(origin_solar_system_id)
+            self._jumps[origin_solar_system_id] = None if jumps == NO_ROUTE else jumps
+        return self._jumps[origin_solar_system_id]
+
+    def _jumps_from_esi(self, origin_solar_system_id: int) -> Optional[int]:
+        """Return jumps from ESI or NO_ROUTE.
+
+        Results are cached, including when there is no route.
+        """
+        if not self.eve_solar_system:
+            return None
+        key = f"{__title__}_jumps_{origin_solar_system_id}_{self.eve_solar_system.id}"
+        jumps = cache.get(key)
+        if jumps is None:
+            origin = EveSolarSystem.objects.get(id=origin_solar_system_id)
+            jumps = origin.jumps_to(self.eve_solar_system)
+            if jumps is None:
+                jumps = NO_ROUTE
+            cache.set(key, jumps, timeout=KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT)
+        return jumps
+
+
+@dataclass(frozen=True)
+class TrackerRules:
+    """Clauses of a tracker compiled into an immutable object.
+
+    Matching a killmail against compiled rules requires no database queries
+    for the clauses of the tracker itself.
+    """
+
+    _CACHE_KEY_BASE = "killtracker_tracker_rules_"
+
+    tracker_pk: int
+    origin_solar_system_id: Optional[int] = None
+    origin_position: Optional[Tuple[float, float, float]] = None
+    require_max_jumps: Optional[int] = None
+    require_max_distance: Optional[float] = None
+    exclude_high_sec: bool = False
+    exclude_low_sec: bool = False
+    exclude_null_sec: bool = False
+    exclude_w_space: bool = False
+    require_min_attackers: Optional[int] = None
+    require_max_attackers: Optional[int] = None
+    exclude_npc_kills: bool = False
+    require_npc_kills: bool = False
+    require_min_value: Optional[int] = None
+    require_region_ids: FrozenSet[int] = frozenset()
+    require_constellation_ids: FrozenSet[int] = frozenset()
+    require_solar_system_ids: FrozenSet[int] = frozenset()
+    exclude_attacker_alliance_ids: FrozenSet[int] = frozenset()
+    exclude_attacker_corporation_ids: FrozenSet[int] = frozenset()
+    require_attacker_alliance_ids: FrozenSet[int] = frozenset()
+    require_attacker_corporation_ids: FrozenSet[int] = frozenset()
+    require_attacker_organizations_final_blow: bool = False
+    require_victim_alliance_ids: FrozenSet[int] = frozenset()
+    exclude_victim_alliance_ids: FrozenSet[int] = frozenset()
+    require_victim_corporation_ids: FrozenSet[int] = frozenset()
+    exclude_victim_corporation_ids: FrozenSet[int] = frozenset()
+    exclude_attacker_state_ids: FrozenSet[int] = frozenset()
+    require_attacker_state_ids: FrozenSet[int] = frozenset()
+    require_victim_state_ids: FrozenSet[int] = frozenset()
+    require_attackers_ship_group_ids: FrozenSet[int] = frozenset()
+    require_attackers_ship_type_ids: FrozenSet[int] = frozenset()
+    require_victim_ship_group_ids: FrozenSet[int] = frozenset()
+    require_victim_ship_type_ids: FrozenSet[int] = frozenset()
+
+    @property
+    def has_localization_clause(self) -> bool:
+        """True if a clause needs the killmails's solar system."""
+        return bool(
+            self.exclude_high_sec
+            or self.exclude_low_sec
+            or self.exclude_null_sec
+            or self.exclude_w_space
+            or self.require_max_distance is not None
+            or self.require_max_jumps is not None
+            or self.require_region_ids
+            or self.require_constellation_ids
+            or self.require_solar_system_ids
+        )
+
+    @property
+    def has_type_clause(self) -> bool:
+        """True if a clause needs the types of the killmail."""
+        return bool(
+            self.require_attackers_ship_group_ids
+            or self.require_attackers_ship_type_ids
+            or self.require_victim_ship_group_ids
+            or self.require_victim_ship_type_ids
+        )
+
+    def match(self, context: KillmailContext) -> Optional[TrackerInfo]:
+        """Match a killmail against these rules.
+
+        Returns tracker info for the killmail if it matches, else None.
+        Main attacker organization and ship group are not calculated.
+        """
+        killmail = context.killmail
+        solar_system = None
+        distance = None
+        jumps = None
+        if killmail.solar_system_id and (
+            self.origin_solar_system_id or self.has_localization_clause
+        ):
+            solar_system = context.solar_system
+            if self.origin_solar_system_id:
+                distance = context.distance_from(self.origin_position)
+                jumps = context.jumps_from(self.origin_solar_system_id)
+
+        try:
+            is_matching, matching_ship_type_ids = self._apply_clauses(
+                context, solar_system, distance, jumps
+            )
+        except AttributeError:
+            is_matching = False
+
+        if not is_matching:
+            return None
+
+        return TrackerInfo(
+            tracker_pk=self.tracker_pk,
+            jumps=jumps,
+            distance=distance,
+            matching_ship_type_ids=matching_ship_type_ids,
+        )
+
+    def _apply_clauses(
+        self,
+        context: KillmailContext,
+        solar_system: Optional[SolarSystemInfo],
+        distance: Optional[float],
+        jumps: Optional[int],
+    ) -> Tuple[bool, Optional[List[int]]]:
+        killmail = context.killmail
+        if self.exclude_high_sec and solar_system and solar_system.is_high_sec:
+            return False, None
+
+        if self.exclude_low_sec and solar_system and solar_system.is_low_sec:
+            return False, None
+
+        if self.exclude_null_sec and solar_system and solar_system.is_null_sec:
+            return False, None
+
+        if self.exclude_w_space and solar_system and solar_system.is_w_space:
+            return False, None
+
+        if (
+            self.require_min_attackers
+            and len(killmail.attackers) < self.require_min_attackers
+        ):
+            return False, None
+
+        if (
+            self.require_max_attackers
+            and len(killmail.attackers) > self.require_max_attackers
+        ):
+            return False, None
+
+        if self.exclude_npc_kills and killmail.zkb.is_npc:
+            return False, None
+
+        if self.require_npc_kills and not killmail.zkb.is_npc:
+            return False, None
+
+        if self.require_min_value and (
+            killmail.zkb.total_value is None
+            or killmail.zkb.total_value < self.require_min_value * 1_000_000
+        ):
+            return False, None
+
+        if self.require_max_distance and (
+            distance is None or distance > self.require_max_distance
+        ):
+            return False, None
+
+        if self.require_max_jumps and (jumps is None or jumps > self.require_max_jumps):
+            return False, None
+
+        if self.require_region_ids and (
+            not solar_system or solar_system.region_id not in self.require_region_ids
+        ):
+            return False, None
+
+        if self.require_constellation_ids and (
+            not solar_system
+            or solar_system.constellation_id not in self.require_constellation_ids
+        ):
+            return False, None
+
+        if self.require_solar_system_ids and (
+            not solar_system or solar_system.id not in self.require_solar_system_ids
+        ):
+            return False, None
+
+        if not self._match_organizations(killmail):
+            return False, None
+
+        if not self._match_states(context):
+            return False, None
+
+        return self._match_ship_types(context)
+
+    def _match_organizations(self, killmail: Killmail) -> bool:
+        if self.exclude_attacker_alliance_ids and (
+            self.exclude_attacker_alliance_ids
+            & killmail.attackers_distinct_alliance_ids()
+        ):
+            return False
+
+        if self.exclude_attacker_corporation_ids and (
+            self.exclude_attacker_corporation_ids
+            & killmail.attackers_distinct_corporation_ids()
+        ):
+            return False
+
+        if self.require_attacker_organizations_final_blow:
+            attacker_final_blow = killmail.attacker_final_blow()
+            if not attacker_final_blow or (
+                attacker_final_blow.alliance_id
+                not in self.require_attacker_alliance_ids
+                and attacker_final_blow.corporation_id
+                not in self.require_attacker_corporation_ids
+            ):
+                return False
+        else:
+            if self.require_attacker_alliance_ids and not (
+                self.require_attacker_alliance_ids
+                & killmail.attackers_distinct_alliance_ids()
+            ):
+                return False
+
+            if self.require_attacker_corporation_ids and not (
+                self.require_attacker_corporation_ids
+                & killmail.attackers_distinct_corporation_ids()
+            ):
+                return False
+
+        victim = killmail.victim
+        if (
+            self.require_victim_alliance_ids
+            and victim.alliance_id not in self.require_victim_alliance_ids
+        ):
+            return False
+
+        if (
+            victim.alliance_id
+            and victim.alliance_id in self.exclude_victim_alliance_ids
+        ):
+            return False
+
+        if (
+            self.require_victim_corporation_ids
+            and victim.corporation_id not in self.require_victim_corporation_ids
+        ):
+            return False
+
+        if (
+            victim.corporation_id
+            and victim.corporation_id in self.exclude_victim_corporation_ids
+        ):
+            return False
+
+        return True
+
+    def _match_states(self, context: KillmailContext) -> bool:
+        if not (
+            self.require_attacker_state_ids
+            or self.exclude_attacker_state_ids
+            or self.require_victim_state_ids
+        ):
+            return True
+
+        state_ids = context.character_state_ids
+        killmail = context.killmail
+        if self.require_attacker_state_ids or self.exclude_attacker_state_ids:
+            attacker_state_ids = {
+                state_ids[character_id]
+                for character_id in killmail.attackers_distinct_character_ids()
+                if character_id in state_ids
+            }
+            if self.require_attacker_state_ids and not (
+                self.require_attacker_state_ids & attacker_state_ids
+            ):
+                return False
+
+            if self.exclude_attacker_state_ids & attacker_state_ids:
+                return False
+
+        if (
+            self.require_victim_state_ids
+            and state_ids.get(killmail.victim.character_id)
+            not in self.require_victim_state_ids
+        ):
+            return False
+
+        return True
+
+    def _match_ship_types(
+        self, context: KillmailContext
+    ) -> Tuple[bool, Optional[List[int]]]:
+        if not self.has_type_clause:
+            return True, None
+
+        killmail = context.killmail
+        group_ids = context.ship_type_group_ids
+        matching_ship_type_ids = None
+        victim_ship_type_id = killmail.victim.ship_type_id
+        if self.require_victim_ship_group_ids:
+            if group_ids.get(victim_ship_type_id) not in (
+                self.require_victim_ship_group_ids
+            ):
+                return False, None
+            matching_ship_type_ids = [victim_ship_type_id]
+
+        if self.require_victim_ship_type_ids:
+            if victim_ship_type_id not in self.require_victim_ship_type_ids:
+                return False, None
+            matching_ship_type_ids = [victim_ship_type_id]
+
+        attackers_ship_type_ids = set(killmail.attackers_ship_type_ids())
+        if self.require_attackers_ship_group_ids:
+            matching_ship_type_ids = sorted(
+                type_id
+                for type_id in attackers_ship_type_ids
+                if group_ids.get(type_id) in self.require_attackers_ship_group_ids
+            )
+            if not matching_ship_type_ids:
+                return False, None
+
+        if self.require_attackers_ship_type_ids:
+            matching_ship_type_ids = sorted(
+                attackers_ship_type_ids & self.require_attackers_ship_type_ids
+            )
+            if not matching_ship_type_ids:
+                return False, None
+
+        return True, matching_ship_type_ids
+
+    @classmethod
+    def from_tracker(cls, tracker) -> "TrackerRules":
+        """Compile rules from a tracker."""
+
+        def ids(field_name: str, id_field: str = "pk") -> FrozenSet[int]:
+            if not tracker.pk:
+                return frozenset()  # unsaved trackers can not have clauses yet
+            related = getattr(tracker, field_name)
+            return frozenset(related.values_list(id_field, flat=True))
+
+        origin = tracker.origin_solar_system
+        if origin and not origin.is_w_space:
+            origin_position = (origin.position_x, origin.position_y, origin.position_z)
+        else:
+            origin_position = None
+
+        return cls(
+            tracker_pk=tracker.pk,
+            origin_solar_system_id=origin.id if origin else None,
+            origin_position=origin_position,
+            require_max_jumps=tracker.require_max_jumps,
+            require_max_distance=tracker.require_max_distance,
+            exclude_high_sec=tracker.exclude_high_sec,
+            exclude_low_sec=tracker.exclude_low_sec,
+            exclude_null_sec=tracker.exclude_null_sec,
+            exclude_w_space=tracker.exclude_w_space,
+            require_min_attackers=tracker.require_min_attackers,
+            require_max_attackers=tracker.require_max_attackers,
+            exclude_npc_kills=tracker.exclude_npc_kills,
+            require_npc_kills=tracker.require_npc_kills,
+            require_min_value=tracker.require_min_value,
+            require_region_ids=ids("require_regions"),
+            require_constellation_ids=ids("require_constellations"),
+            require_solar_system_ids=ids("require_solar_systems"),
+            exclude_attacker_alliance_ids=ids(
+                "exclude_attacker_alliances", "alliance_id"
+            ),
+            exclude_attacker_corporation_ids=ids(
+                "exclude_attacker_corporations", "corporation_id"
+            ),
+            require_attacker_alliance_ids=ids(
+                "require_attacker_alliances", "alliance_id"
+            ),
+            require_attacker_corporation_ids=ids(
+                "require_attacker_corporations", "corporation_id"
+            ),
+            require_attacker_organizations_final_blow=(
+                tracker.require_attacker_organizations_final_blow
+            ),
+            require_victim_alliance_ids=ids("require_victim_alliances", "alliance_id"),
+            exclude_victim_alliance_ids=ids("exclude_victim_alliances", "alliance_id"),
+            require_victim_corporation_ids=ids(
+                "require_victim_corporations", "corporation_id"
+            ),
+            exclude_victim_corporation_ids=ids(
+                "exclude_victim_corporations", "corporation_id"
+            ),
+            exclude_attacker_state_ids=ids("exclude_attacker_states"),
+            require_attacker_state_ids=ids("require_attacker_states"),
+            require_victim_state_ids=ids("require_victim_states"),
+            require_attackers_ship_group_ids=ids("require_attackers_ship_groups"),
+            require_attackers_ship_type_ids=ids("require_attackers_ship_types"),
+            require_victim_ship_group_ids=ids("require_victim_ship_groups"),
+            require_victim_ship_type_ids=ids("require_victim_ship_types"),
+        )
+
+    @classmethod
+    def get_or_compile(cls, tracker) -> "TrackerRules":
+        """Return compiled rules for a tracker from cache
+        or compile them if they are not cached yet.
+        """
+        if not tracker.pk:
+            return cls.from_tracker(tracker)
+        # not using get_or_set() here,
+        # because invalidation would not work reliably with all cache backends
+        key = cls._cache_key(tracker.pk)
+        rules = cache.get(key)
+        if rules is None:
+            rules = cls.from_tracker(tracker)
+            cache.set(key, rules, timeout=KILLTRACKER_TRACKER_RULES_CACHE_TIMEOUT)
+        return rules
+
+    @classmethod
+    def invalidate(cls, tracker_pk: int) -> None:
+        """Remove compiled rules for a tracker from cache."""
+        cache.delete(cls._cache_key(tracker_pk))
+
+    @classmethod
+    def _cache_key(cls, tracker_pk: int) -> str:
+        return cls._CACHE_KEY_BASE + str(tracker_pk)
+
+
+class OriginDistanceFilter:
+    """Filter for pruning trackers with a killmail outside of their max distance.
+
+    The distances from a killmail to the origins of all trackers
+    are calculated in one operation, which is vectorized when numpy is installed.
+    """
+
+    def __init__(self, rules: Iterable[TrackerRules]) -> None:
+        self._tracker_pks = []
+        self._without_origin = set()
+        origins = []
+        max_distances = []
+        for obj in rules:
+            if not obj.require_max_distance:
+                continue
+            if not obj.origin_position:
+                self._without_origin.add(obj.tracker_pk)
+                continue
+            self._tracker_pks.append(obj.tracker_pk)
+            origins.append(obj.origin_position)
+            max_distances.append(obj.require_max_distance * METERS_PER_LY)
+
+        if np is not None and origins:
+            self._origins = np.array(origins, dtype=float)
+            self._max_distances = np.array(max_distances, dtype=float)
+        else:
+            self._origins = origins
+            self._max_distances = max_distances
+
+    def __len__(self) -> int:
+        return len(self._tracker_pks) + len(self._without_origin)
+
+    @classmethod
+    @lru_cache(maxsize=1)
+    def for_rules(cls, rules: Tuple[TrackerRules, ...]) -> "OriginDistanceFilter":
+        """Return filter for the given rules. The last filter is cached."""
+        return cls(rules)
+
+    def trackers_out_of_range(self, context: KillmailContext) -> Set[int]:
+        """Return PKs of trackers which can not match the killmail
+        because it is outside of their max distance.
+        """
+        if not self:
+            return set()
+        solar_system = (
+            context.solar_system if context.killmail.solar_system_id else None
+        )
+        position = solar_system.position if solar_system else None
+        if not position:
+            return self._without_origin.union(self._tracker_pks)
+
+        if np is not None:
+            distances = np.sqrt(((self._origins - position) ** 2).sum(axis=1))
+            is_out_of_range = (distances > self._max_distances).tolist()
+        else:
+            is_out_of_range = [
+                math.dist(origin, position) > max_distance
+                for origin, max_distance in zip(self._origins, self._max_distances)
+            ]
+        return self._without_origin.union(
+            tracker_pk
+            for tracker_pk, is_out in zip(self._tracker_pks, is_out_of_range)
+            if is_out
+        )
@@ -0,0 +1,244 @@
+"""In-memory map of the Eve universe for matching killmails against locations."""
+
+import threading
+import time
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from eveuniverse.models import EveSolarSystem, EveStargate
+
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from .. import __title__
+from ..app_settings import KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+NO_ROUTE = -1
+
+
+@dataclass(frozen=True)
+class SolarSystemInfo:
+    """Properties of a solar system needed for matching killmails."""
+
+    id: int
+    constellation_id: int
+    region_id: int
+    is_high_sec: bool
+    is_low_sec: bool
+    is_null_sec: bool
+    is_w_space: bool
+    position: Optional[Tuple[float, float, float]] = None
+
+    @classmethod
+    def from_solar_system(cls, solar_system: EveSolarSystem) -> "SolarSystemInfo":
+        return cls(
+            id=solar_system.id,
+            constellation_id=solar_system.eve_constellation_id,
+            region_id=solar_system.eve_constellation.eve_region_id,
+            is_high_sec=solar_system.is_high_sec,
+            is_low_sec=solar_system.is_low_sec,
+            is_null_sec=solar_system.is_null_sec,
+            is_w_space=solar_system.is_w_space,
+            position=(
+                None
+                if solar_system.is_w_space
+                else (
+                    solar_system.position_x,
+                    solar_system.position_y,
+                    solar_system.position_z,
+                )
+            ),
+        )
+
+
+class UniverseGraph:
+    """Compact map of all locally stored solar systems and their stargate connections.
+
+    Solar systems are stored in arrays, which are addressed by an index per system.
+    Stargate connections are stored as adjacency lists in CSR format.
+
+    The graph is loaded once per process from the local eveuniverse data
+    and reloaded after it expires. Jumps are calculated with a BFS
+    from the origin to all other systems and cached per origin.
+
+    The local data can be incomplete, e.g. when stargates have only been loaded
+    for some regions. A system is complete when all its stargates
+    and their destinations are known. Jumps are only reported
+    when no shorter route could exist through an incomplete system.
+    """
+
+    _instance: Optional["UniverseGraph"] = None
+    _instance_lock = threading.Lock()
+    _MAX_CACHED_ORIGINS = 256
+
+    def __init__(self) -> None:
+        self.loaded_at = time.monotonic()
+        self._index: Dict[int, int] = dict()
+        self._ids = array("l")
+        self._constellation_ids = array("l")
+        self._region_ids = array("l")
+        self._security_status = array("d")
+        self._positions = array("d")
+        self._neighbor_offsets = array("l", [0])
+        self._neighbors = array("l")
+        self._is_complete = array("b")
+        self._jumps_cache: Dict[int, Tuple[array, Optional[int]]] = dict()
+        self._jumps_cache_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, solar_system_id: int) -> bool:
+        return solar_system_id in self._index
+
+    @property
+    def num_stargates(self) -> int:
+        return len(self._neighbors)
+
+    @classmethod
+    def instance(cls) -> "UniverseGraph":
+        """Return the graph for this process. Loads it when needed."""
+        with cls._instance_lock:
+            if (
+                cls._instance is None
+                or time.monotonic() - cls._instance.loaded_at
+                > KILLTRACKER_UNIVERSE_GRAPH_TIMEOUT
+            ):
+                cls._instance = cls.load()
+            return cls._instance
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop the graph for this process, so that it is reloaded on next use."""
+        with cls._instance_lock:
+            cls._instance = None
+
+    @classmethod
+    def load(cls) -> "UniverseGraph":
+        """Load a new graph from the local database."""
+        obj = cls()
+        rows = EveSolarSystem.objects.values_list(
+            "id",
+            "eve_constellation_id",
+            "eve_constellation__eve_region_id",
+            "security_status",
+            "position_x",
+            "position_y",
+            "position_z",
+        ).order_by("id")
+        for row in rows:
+            (id, constellation_id, region_id, security_status, x, y, z) = row
+            obj._index[id] = len(obj._ids)
+            obj._ids.append(id)
+            obj._constellation_ids.append(constellation_id)
+            obj._region_ids.append(region_id)
+            obj._security_status.append(security_status)
+            obj._positions.extend((x or 0.0, y or 0.0, z or 0.0))
+
+        adjacency = [set() for _ in range(len(obj._ids))]
+        incomplete = set()
+        connections = EveStargate.objects.values_list(
+            "eve_solar_system_id", "destination_eve_solar_system_id"
+        )
+        for source_id, destination_id in connections:
+            try:
+                source = obj._index[source_id]
+            except KeyError:
+                continue
+            try:
+                destination = obj._index[destination_id]
+            except KeyError:
+                incomplete.add(source)
+                continue
+            adjacency[source].add(destination)
+
+        for idx, neighbors in enumerate(adjacency):
+            obj._neighbors.extend(sorted(neighbors))
+            obj._neighbor_offsets.append(len(obj._neighbors))
+            obj._is_complete.append(bool(neighbors) and idx not in incomplete)
+
+        logger.info(
+            "Loaded universe graph with %d solar systems and %d stargates",
+            len(obj),
+            obj.num_stargates,
+        )
+        return obj
+
+    def solar_system_info(self, solar_system_id: int) -> Optional[SolarSystemInfo]:
+        """Return properties of a solar system or None if it is not known."""
+        try:
+            idx = self._index[solar_system_id]
+        except KeyError:
+            return None
+        security_status = round(self._security_status[idx], 1)
+        is_w_space = 31000000 <= solar_system_id < 32000000
+        position = self._positions[idx * 3 : idx * 3 + 3]
+        return SolarSystemInfo(
+            id=solar_system_id,
+            constellation_id=self._constellation_ids[idx],
+            region_id=self._region_ids[idx],
+            is_high_sec=security_status >= 0.5,
+            is_low_sec=0 < security_status < 0.5,
+            is_null_sec=security_status <= 0 and not is_w_space,
+            is_w_space=is_w_space,
+            position=None if is_w_space else tuple(position),
+        )
+
+    def jumps(self, origin_id: int, destination_id: int) -> Optional[int]:
+        """Return number of jumps on the shortest route between two solar systems.
+
+        Returns NO_ROUTE when there is no route between them
+        and None when the route can not be calculated from the local data,
+        e.g. because stargates have not been loaded for all systems on the way.
+        """
+        if origin_id not in self._index or destination_id not in self._index:
+            return None
+        jumps, max_exact_jumps = self._jumps_from(origin_id)
+        result = jumps[self._index[destination_id]]
+        if max_exact_jumps is None:
+            return result
+        if result == NO_ROUTE or result > max_exact_jumps:
+            return None
+        return result
+
+    def _jumps_from(self, origin_id: int) -> Tuple[array, Optional[int]]:
+        with self._jumps_cache_lock:
+            try:
+                return self._jumps_cache[origin_id]
+            except KeyError:
+                pass
+        result = self._bfs(self._index[origin_id])
+        with self._jumps_cache_lock:
+            if len(self._jumps_cache) >= self._MAX_CACHED_ORIGINS:
+                self._jumps_cache.clear()
+            self._jumps_cache[origin_id] = result
+        return result
+
+    def _bfs(self, origin: int) -> Tuple[array, Optional[int]]:
+        """Return jumps from origin to all systems
+        and the max jumps which are exact or None if all are exact.
+
+        A route through an incomplete system found at n jumps
+        can have a missing stargate, so only routes up to n + 1 jumps are exact.
+        """
+        jumps = array("l", [NO_ROUTE]) * len(self._ids)
+        jumps[origin] = 0
+        max_exact_jumps = None
+        queue = deque([origin])
+        offsets = self._neighbor_offsets
+        neighbors = self._neighbors
+        is_complete = self._is_complete
+        while queue:
+            current = queue.popleft()
+            next_jumps = jumps[current] + 1
+            if max_exact_jumps is None and not is_complete[current]:
+                max_exact_jumps = next_jumps
+            for neighbor in neighbors[offsets[current] : offsets[current + 1]]:
+                if jumps[neighbor] == NO_ROUTE:
+                    jumps[neighbor] = next_jumps
+                    queue.append(neighbor)
+        return jumps, max_exact_jumps
@@ -0,0 +1,57 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from ...app_settings import KILLTRACKER_CONSUMER_QUEUE_SIZE
+from ...core.consumer import RedisQConsumer
+from ...tasks import dispatch_killmail, reset_failed_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Continuously fetches new killmails from ZKB RedisQ and runs trackers for them."
+        " Replaces the periodic task run_killtracker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=KILLTRACKER_CONSUMER_QUEUE_SIZE,
+            help="Max number of received killmails waiting to be dispatched",
+        )
+        parser.add_argument(
+            "--max-killmails",
+            type=int,
+            default=None,
+            help="Stop after receiving the given number of killmails",
+        )
+
+    def handle(self, *args, **options):
+        consumer = RedisQConsumer(
+            dispatch=dispatch_killmail,
+            queue_size=options["queue_size"],
+            max_killmails=options["max_killmails"],
+        )
+
+        def handle_signal(signum, frame):
+            consumer.stop()
+
+        previous_handlers = {
+            signum: signal.signal(signum, handle_signal)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            reset_failed_messages()
+            self.stdout.write(
+                "Consuming killmails from ZKB RedisQ. Press CTRL-C to stop."
+            )
+            consumer.run()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stopped. Killmails received: {consumer.killmails_received}"
+            )
+        )
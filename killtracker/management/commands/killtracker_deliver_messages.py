@@ -0,0 +1,39 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from ...app_settings import KILLTRACKER_DELIVERY_MAX_WORKERS
+from ...core.delivery import MessageDeliveryService
+
+
+class Command(BaseCommand):
+    help = (
+        "Continuously sends queued messages to all enabled webhooks concurrently."
+        " Replaces the tasks for sending messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=KILLTRACKER_DELIVERY_MAX_WORKERS,
+            help="Max number of requests sent to Discord concurrently",
+        )
+
+    def handle(self, *args, **options):
+        service = MessageDeliveryService(max_workers=options["max_workers"])
+
+        def handle_signal(signum, frame):
+            service.stop()
+
+        previous_handlers = {
+            signum: signal.signal(signum, handle_signal)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        self.stdout.write("Delivering messages to webhooks. Press CTRL-C to stop.")
+        try:
+            service.run()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS("Stopped."))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from ...core.latency import (
+    SCOPE_TRACKER,
+    SCOPE_WEBHOOK,
+    format_latency,
+    latency_stats,
+    reset_latency_stats,
+)
+from ...models import Tracker, Webhook
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows how long killmails take through each stage of the pipeline "
+        "from receipt on ZKB until their message has been sent to Discord."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Delete all latency statistics"
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            count = reset_latency_stats()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {count} histograms."))
+            return
+
+        stats = latency_stats()
+        if not stats:
+            self.stdout.write("No latency statistics recorded yet.")
+            return
+
+        names = {
+            SCOPE_TRACKER: dict(Tracker.objects.values_list("pk", "name")),
+            SCOPE_WEBHOOK: dict(Webhook.objects.values_list("pk", "name")),
+        }
+        row = "{:<8} {:<30} {:<10} {:>8} {:>8} {:>8} {:>8} {:>8}"
+        self.stdout.write(
+            row.format("Scope", "Name", "Stage", "Count", "Mean", "p50", "p95", "p99")
+        )
+        for obj in stats:
+            name = names[obj.scope].get(obj.obj_pk, f"#{obj.obj_pk}")
+            self.stdout.write(
+                row.format(
+                    obj.scope,
+                    name[:30],
+                    obj.stage,
+                    obj.count,
+                    format_latency(obj.mean),
+                    format_latency(obj.p50),
+                    format_latency(obj.p95),
+                    format_latency(obj.p99),
+                )
+            )
@@ -1,7 +1,9 @@
+import datetime as dt
+import time
 from datetime import timedelta
-from typing import Dict, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, transaction
 from django.utils.timezone import now
 from eveuniverse.models import EveEntity
 
@@ -10,7 +12,11 @@ from app_utils.caching import ObjectCacheMixin
 from app_utils.logging import LoggerAddTag
 
 from . import __title__
-from .app_settings import KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS
+from .app_settings import (
+    KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS,
+    KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE,
+    KILLTRACKER_PURGE_KILLMAILS_TIME_BUDGET,
+)
 from .core.killmails import Killmail, _KillmailCharacter
 
 logger = LoggerAddTag(get_extension_logger(__name__), __title__)
@@ -22,6 +28,27 @@ class EveTypePlusManager(models.Manager):
         return qs.select_related("eve_group")
 
 
+def _raw_delete(model, field_name: str, ids: List[int], using: str) -> int:
+    """Delete objects of a model by IDs with one DELETE statement
+    and return the number of deleted objects.
+
+    Unlike ``QuerySet.delete()`` this does not load the objects,
+    send delete signals or cascade to related objects.
+    This is only safe for killmails and their attackers,
+    because no other model references them and the app does not use
+    delete signals for them. Attackers must be deleted before their killmails.
+    """
+    if not ids:
+        return 0
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.get_field(field_name).column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+        return cursor.rowcount
+
+
 class EveKillmailQuerySet(models.QuerySet):
     """Custom queryset for EveKillmail"""
 
@@ -37,11 +64,68 @@ class EveKillmailQuerySet(models.QuerySet):
 
 
 class EveKillmailBaseManager(models.Manager):
-    def delete_stale(self) -> Tuple[int, Dict[str, int]]:
-        """deletes all stale killmail"""
-        if KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS > 0:
-            deadline = now() - timedelta(days=KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS)
-            return self.filter(time__lt=deadline).delete()
+    def delete_stale(self) -> Optional[Tuple[int, Dict[str, int]]]:
+        """Delete stale killmails until all are deleted
+        or the time budget is exhausted.
+
+        Killmails are deleted in chunks of IDs and the time budget
+        is checked after each chunk.
+        Attackers and killmails are deleted with raw DELETE statements,
+        so they are not loaded into memory.
+
+        Returns the total count and the count of deleted objects per model
+        like ``QuerySet.delete()``.
+        """
+        from .models import EveKillmailAttacker
+
+        if KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS <= 0:
+            return None
+        deadline = now() - timedelta(days=KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS)
+        budget_ends = time.monotonic() + KILLTRACKER_PURGE_KILLMAILS_TIME_BUDGET
+        killmails_count = attackers_count = 0
+        for ids in self._stale_id_chunks(deadline):
+            with transaction.atomic(using=self.db):
+                attackers_count += _raw_delete(
+                    EveKillmailAttacker, "killmail", ids, using=self.db
+                )
+                killmails_count += _raw_delete(self.model, "id", ids, using=self.db)
+            logger.debug(
+                "Purge: Deleted %d stale killmails up to ID %d",
+                killmails_count,
+                ids[-1],
+            )
+            if time.monotonic() > budget_ends:
+                logger.info(
+                    "Purge: Time budget exhausted after deleting %d stale killmails. "
+                    "Will continue with the next run",
+                    killmails_count,
+                )
+                break
+
+        details = {
+            self.model._meta.label: killmails_count,
+            EveKillmailAttacker._meta.label: attackers_count,
+        }
+        return killmails_count + attackers_count, details
+
+    def _stale_id_chunks(self, deadline: dt.datetime) -> Iterable[List[int]]:
+        """Yield the IDs of stale killmails in chunks.
+
+        Expects each chunk to be deleted before the next one is requested.
+        """
+        chunk_size = max(1, KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE)
+        # IDs are passed as parameters and some backends limit their number
+        max_query_params = connections[self.db].features.max_query_params
+        if max_query_params:
+            chunk_size = min(chunk_size, max_query_params)
+        stale_qs = self.filter(time__lt=deadline).order_by("id")
+        while True:
+            ids = list(stale_qs.values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            yield ids
+            if len(ids) < chunk_size:
+                break
 
     def create_from_killmail(
         self, killmail: Killmail, resolve_ids=True
@@ -52,54 +136,102 @@ class EveKillmailBaseManager(models.Manager):
         - resolve_ids: When set to False will not resolve EveEntity IDs
 
         """
-        from .models import EveKillmailAttacker
-
-        params = {
-            "id": killmail.id,
-            "time": killmail.time,
-            "damage_taken": killmail.victim.damage_taken,
-            "position_x": killmail.position.x,
-            "position_y": killmail.position.y,
-            "position_z": killmail.position.z,
-        }
-        victim = self._create_args_for_entities(killmail.victim)
-        params.update(victim)
-        if killmail.solar_system_id:
-            params["solar_system"], _ = EveEntity.objects.get_or_create(
-                id=killmail.solar_system_id
-            )
-        if killmail.zkb:
-            zkb = killmail.zkb.asdict()
-            zkb["zkb_points"] = zkb.pop("points")
-            params.update(zkb)
-        eve_killmail = self.create(**params)
-        if killmail.attackers:
-            attacker_objs = []
-            for attacker in killmail.attackers:
-                params = {
-                    **{
-                        "killmail": eve_killmail,
-                        "damage_done": attacker.damage_done,
-                        "security_status": attacker.security_status,
-                        "is_final_blow": attacker.is_final_blow,
-                    },
-                    **self._create_args_for_entities(attacker),
-                }
-                attacker_objs.append(EveKillmailAttacker(**params))
-            EveKillmailAttacker.objects.bulk_create(attacker_objs)
+        eve_killmail = self._bulk_create_from_killmails([killmail])[0]
         if resolve_ids:
             eve_killmail.load_entities()
         return eve_killmail
 
+    def create_from_killmails(
+        self, killmails: Iterable[Killmail], resolve_ids=True
+    ) -> List[models.Model]:
+        """Create new EveKillmails from many Killmail objects in bulk
+        and return the created objects.
+
+        Killmails which already exist are skipped.
+        This includes killmails stored by another process in the meantime.
+
+        Args:
+        - resolve_ids: When set to False will not resolve EveEntity IDs
+        """
+        killmails_new = self._without_existing(killmails)
+        if not killmails_new:
+            return []
+        try:
+            eve_killmails = self._bulk_create_from_killmails(killmails_new.values())
+        except IntegrityError:
+            killmails_new = self._without_existing(killmails_new.values())
+            if not killmails_new:
+                return []
+            logger.info("Retrying to store killmails without conflicting ones")
+            eve_killmails = self._bulk_create_from_killmails(killmails_new.values())
+        if resolve_ids:
+            self.filter(id__in=killmails_new.keys()).load_entities()
+        return eve_killmails
+
+    def _without_existing(self, killmails: Iterable[Killmail]) -> Dict[int, Killmail]:
+        """Return map of given killmails which do not exist yet by their ID."""
+        killmails_new = {obj.id: obj for obj in killmails}
+        existing_ids = self.filter(id__in=killmails_new.keys()).values_list(
+            "id", flat=True
+        )
+        for killmail_id in existing_ids:
+            del killmails_new[killmail_id]
+        return killmails_new
+
+    def _bulk_create_from_killmails(
+        self, killmails: Iterable[Killmail]
+    ) -> List[models.Model]:
+        """Create killmails with their attackers and all missing entities
+        with one bulk insert per table.
+        """
+        from .models import EveKillmailAttacker
+
+        entity_ids = set()
+        eve_killmails = []
+        attacker_objs = []
+        for killmail in killmails:
+            entity_ids |= killmail.entity_ids()
+            params = {
+                "id": killmail.id,
+                "time": killmail.time,
+                "damage_taken": killmail.victim.damage_taken,
+                "position_x": killmail.position.x,
+                "position_y": killmail.position.y,
+                "position_z": killmail.position.z,
+                "solar_system_id": killmail.solar_system_id,
+            }
+            params.update(self._create_args_for_entities(killmail.victim))
+            if killmail.zkb:
+                zkb = killmail.zkb.asdict()
+                zkb["zkb_points"] = zkb.pop("points")
+                params.update(zkb)
+            eve_killmails.append(self.model(**params))
+            for attacker in killmail.attackers:
+                attacker_objs.append(
+                    EveKillmailAttacker(
+                        killmail_id=killmail.id,
+                        damage_done=attacker.damage_done,
+                        security_status=attacker.security_status,
+                        is_final_blow=attacker.is_final_blow,
+                        **self._create_args_for_entities(attacker),
+                    )
+                )
+        with transaction.atomic():
+            EveEntity.objects.bulk_create(
+                [EveEntity(id=entity_id) for entity_id in entity_ids],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+            self.bulk_create(eve_killmails, batch_size=500)
+            EveKillmailAttacker.objects.bulk_create(attacker_objs, batch_size=500)
+        return eve_killmails
+
     @staticmethod
     def _create_args_for_entities(killmail_character: _KillmailCharacter) -> dict:
-        args = dict()
-        for prop_name in killmail_character.ENTITY_PROPS:
-            entity_id = getattr(killmail_character, prop_name)
-            if entity_id:
-                field = prop_name.replace("_id", "")
-                args[field], _ = EveEntity.objects.get_or_create(id=entity_id)
-        return args
+        return {
+            prop_name: getattr(killmail_character, prop_name)
+            for prop_name in killmail_character.ENTITY_PROPS
+        }
 
     def update_or_create_from_killmail(
         self, killmail: Killmail
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0001_initial_new"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhook",
+            name="collapse_duplicates",
+            field=models.BooleanField(
+                default=False,
+                help_text="when enabled a killmail matching several trackers of this webhook is sent as one message listing all matching trackers. Requires batched matching",
+            ),
+        ),
+    ]
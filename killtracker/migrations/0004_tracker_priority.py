@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0003_webhook_collapse_duplicates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="high_priority_min_value",
+            field=models.PositiveBigIntegerField(
+                blank=True,
+                default=None,
+                help_text="Messages for killmails with at least this total value in ISK are sent with high priority.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="tracker",
+            name="priority",
+            field=models.IntegerField(
+                choices=[(10, "low"), (20, "normal"), (30, "high")],
+                default=20,
+                help_text="Priority of messages from this tracker. When many messages are waiting to be sent to a webhook, messages with a higher priority are sent first.",
+            ),
+        ),
+    ]
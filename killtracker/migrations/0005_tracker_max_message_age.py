@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-17 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("killtracker", "0004_tracker_priority"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tracker",
+            name="max_message_age",
+            field=models.PositiveIntegerField(
+                blank=True,
+                default=None,
+                help_text="Max duration in minutes a message can wait for being sent. Older messages are skipped, e.g. after Discord was not reachable, and a short note with the number of skipped messages is sent instead.",
+                null=True,
+            ),
+        ),
+    ]
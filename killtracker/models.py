@@ -1,17 +1,18 @@
 import json
+import time
 from copy import deepcopy
+from dataclasses import replace
 from datetime import timedelta
-from typing import List, Optional, Set
+from typing import Iterable, List, Optional, Set, Tuple
 
 import dhooks_lite
 from simple_mq import SimpleMQ
 
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.db import models
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
-from eveuniverse.helpers import meters_to_ly
 from eveuniverse.models import (
     EveConstellation,
     EveEntity,
@@ -31,10 +32,17 @@ from app_utils.urls import static_file_absolute_url
 
 from . import APP_NAME, HOMEPAGE_URL, __title__, __version__
 from .app_settings import (
+    KILLTRACKER_DISCORD_MESSAGE_MAX_ATTEMPTS,
     KILLTRACKER_KILLMAIL_MAX_AGE_FOR_TRACKER,
     KILLTRACKER_WEBHOOK_SET_AVATAR,
 )
-from .core.killmails import EntityCount, Killmail, TrackerInfo
+from .core.http import PooledWebhook
+from .core.killmails import EntityCount, Killmail
+from .core.latency import STAGE_ENQUEUED, STAGE_GENERATED, STAGE_MATCHED, add_stage
+from .core.message_batches import MessageBatch, decode_message
+from .core.priority_queues import PriorityMQ
+from .core.rate_limits import WebhookRateLimiter
+from .core.trackers import KillmailContext, TrackerRules
 from .exceptions import WebhookTooManyRequests
 from .managers import (
     EveKillmailManager,
@@ -370,6 +378,11 @@ class Webhook(models.Model):
     class WebhookType(models.IntegerChoices):
         DISCORD = 1, _("Discord Webhook")
 
+    class MessagePriority(models.IntegerChoices):
+        LOW = 10, _("low")
+        NORMAL = 20, _("normal")
+        HIGH = 30, _("high")
+
     name = models.CharField(
         max_length=64, unique=True, help_text="short name to identify this webhook"
     )
@@ -395,12 +408,21 @@ class Webhook(models.Model):
         db_index=True,
         help_text="whether notifications are currently sent to this webhook",
     )
+    collapse_duplicates = models.BooleanField(
+        default=False,
+        help_text=(
+            "when enabled a killmail matching several trackers of this webhook "
+            "is sent as one message listing all matching trackers. "
+            "Requires batched matching"
+        ),
+    )
     objects = WebhookManager()
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
-        self.main_queue = self._create_queue("main")
+        self.main_queue = self._create_main_queue()
         self.error_queue = self._create_queue("error")
+        self.dead_letter_queue = self._create_queue("dead")
 
     def __str__(self) -> str:
         return self.name
@@ -418,6 +440,7 @@ class Webhook(models.Model):
         # Remove the unpicklable entries.
         del state["main_queue"]
         del state["error_queue"]
+        del state["dead_letter_queue"]
         return state
 
     def __setstate__(self, state):
@@ -425,15 +448,30 @@ class Webhook(models.Model):
         self.__dict__.update(state)
         # Restore the previously opened file's state. To do so, we need to
         # reopen it and read from it until the line count is restored.
-        self.main_queue = self._create_queue("main")
+        self.main_queue = self._create_main_queue()
         self.error_queue = self._create_queue("error")
+        self.dead_letter_queue = self._create_queue("dead")
 
     def save(self, *args, **kwargs):
         is_new = self.id is None
         super().save(*args, **kwargs)
         if is_new:
-            self.main_queue = self._create_queue("main")
+            self.main_queue = self._create_main_queue()
             self.error_queue = self._create_queue("error")
+            self.dead_letter_queue = self._create_queue("dead")
+
+    def _create_main_queue(self) -> Optional[PriorityMQ]:
+        redis_client = get_redis_client()
+        return (
+            PriorityMQ(
+                redis_client,
+                f"{__title__}_webhook_{self.pk}_main",
+                priorities=self.MessagePriority.values,
+                default_priority=self.MessagePriority.NORMAL,
+            )
+            if self.pk
+            else None
+        )
 
     def _create_queue(self, suffix: str) -> Optional[SimpleMQ]:
         redis_client = get_redis_client()
@@ -443,20 +481,91 @@ class Webhook(models.Model):
             else None
         )
 
-    def reset_failed_messages(self) -> int:
-        """moves all messages from error queue into main queue.
-        returns number of moved messages.
+    @property
+    def rate_limiter(self) -> WebhookRateLimiter:
+        """Rate limiter shared by all workers sending to this webhook."""
+        return WebhookRateLimiter(self.pk)
+
+    def dequeue_message_batch(self, max_embeds: int) -> MessageBatch:
+        """Dequeue the next messages from the main queue,
+        which can be sent together as one message.
+
+        Messages are taken from the lane with the highest priority.
+        Each message is dequeued before it is added to the batch,
+        so concurrent senders never get the same message.
+        A message which can not be added is put back to the front of its lane.
         """
-        counter = 0
+        message_json, priority = self.main_queue.dequeue_with_priority()
+        batch = MessageBatch(max_embeds, priority=priority)
+        if message_json is None:
+            return batch
+
+        message = decode_message(message_json)
+        if self._is_message_expired(message):
+            skipped = 1 + self._remove_expired_messages(priority)
+            logger.info("%s: Skipped %d expired messages", self, skipped)
+            batch.add(self._skipped_messages_asjson(skipped))
+            return batch
+
+        batch.add(message_json, message)
         while True:
-            message = self.error_queue.dequeue()
-            if message is None:
+            message_json = self.main_queue.dequeue(priority)
+            if message_json is None:
+                break
+            message = decode_message(message_json)
+            if self._is_message_expired(message) or not batch.add(
+                message_json, message
+            ):
+                self.main_queue.push_front(message_json, priority)
                 break
-            else:
-                self.main_queue.enqueue(message)
-                counter += 1
+        return batch
 
-        return counter
+    def _remove_expired_messages(self, priority: int) -> int:
+        """Remove all expired messages from the start of a lane
+        and return how many were removed.
+        """
+        total = 0
+        while True:
+            message_json = self.main_queue.dequeue(priority)
+            if message_json is None:
+                break
+            if not self._is_message_expired(decode_message(message_json)):
+                self.main_queue.push_front(message_json, priority)
+                break
+            total += 1
+        return total
+
+    def _skipped_messages_asjson(self, count: int) -> str:
+        content = (
+            f"{count} older alert{'s' if count != 1 else ''} skipped, "
+            "because they could not be sent in time."
+        )
+        username, avatar_url = (
+            self._branding() if KILLTRACKER_WEBHOOK_SET_AVATAR else (None, None)
+        )
+        return self._discord_message_asjson(
+            content=content, username=username, avatar_url=avatar_url
+        )
+
+    def reset_failed_messages(self) -> int:
+        """moves all messages from error queue into main queue.
+        returns number of moved messages.
+
+        Messages which have failed too often are moved
+        into the dead letter queue instead.
+        """
+        moved, dead = self.main_queue.enqueue_from(
+            self.error_queue,
+            dead_letter_queue=self.dead_letter_queue,
+            max_attempts=KILLTRACKER_DISCORD_MESSAGE_MAX_ATTEMPTS,
+        )
+        if dead:
+            logger.warning(
+                "%s: Moved %d failed messages into the dead letter queue",
+                self,
+                dead,
+            )
+        return moved
 
     def enqueue_message(
         self,
@@ -465,11 +574,29 @@ class Webhook(models.Model):
         tts: bool = None,
         username: str = None,
         avatar_url: str = None,
+        meta: dict = None,
+        priority: int = None,
+        max_age: int = None,
     ) -> int:
-        """Enqueues a message to be send with this webhook"""
-        username = __title__ if KILLTRACKER_WEBHOOK_SET_AVATAR else username
-        brand_url = static_file_absolute_url("killtracker/killtracker_logo.png")
-        avatar_url = brand_url if KILLTRACKER_WEBHOOK_SET_AVATAR else avatar_url
+        """Enqueues a message to be send with this webhook
+
+        Params
+            meta: Data about the message, which is not sent to Discord
+            priority: Priority of the message, messages with a higher priority
+                are sent first. Defaults to normal priority.
+            max_age: Max duration in seconds the message can wait for being sent.
+                Expired messages are skipped.
+        """
+        if KILLTRACKER_WEBHOOK_SET_AVATAR:
+            username, avatar_url = self._branding()
+        enqueued_at = time.time()
+        meta = {**(meta or {}), "enqueued_at": enqueued_at}
+        if "timestamps" in meta:
+            meta["timestamps"] = add_stage(meta["timestamps"], STAGE_ENQUEUED)
+        if max_age:
+            meta["expires_at"] = enqueued_at + max_age
+        if priority is not None:
+            meta["priority"] = int(priority)
         return self.main_queue.enqueue(
             self._discord_message_asjson(
                 content=content,
@@ -477,9 +604,21 @@ class Webhook(models.Model):
                 tts=tts,
                 username=username,
                 avatar_url=avatar_url,
-            )
+                meta=meta,
+            ),
+            priority=priority,
         )
 
+    @staticmethod
+    def _branding() -> Tuple[str, str]:
+        """Return username and avatar URL of this app."""
+        return __title__, static_file_absolute_url("killtracker/killtracker_logo.png")
+
+    @staticmethod
+    def _is_message_expired(message: dict) -> bool:
+        expires_at = (message.get("_meta") or {}).get("expires_at")
+        return bool(expires_at) and expires_at < time.time()
+
     @staticmethod
     def _discord_message_asjson(
         content: str = None,
@@ -487,6 +626,7 @@ class Webhook(models.Model):
         tts: bool = None,
         username: str = None,
         avatar_url: str = None,
+        meta: dict = None,
     ) -> str:
         """Converts a Discord message to JSON and returns it
 
@@ -511,6 +651,8 @@ class Webhook(models.Model):
             message["username"] = username
         if avatar_url:
             message["avatar_url"] = avatar_url
+        if meta:
+            message["_meta"] = meta
 
         return json.dumps(message, cls=JSONDateTimeEncoder)
 
@@ -532,7 +674,7 @@ class Webhook(models.Model):
             ]
         else:
             embeds = None
-        hook = dhooks_lite.Webhook(
+        hook = PooledWebhook(
             url=self.url,
             user_agent=dhooks_lite.UserAgent(
                 name=APP_NAME, url=HOMEPAGE_URL, version=__version__
@@ -549,6 +691,7 @@ class Webhook(models.Model):
         logger.debug("headers: %s", response.headers)
         logger.debug("status_code: %s", response.status_code)
         logger.debug("content: %s", response.content)
+        self.rate_limiter.update_from_headers(response.headers)
         if response.status_code == self.HTTP_TOO_MANY_REQUESTS:
             logger.error(
                 "%s: Received too many requests error from API: %s",
@@ -562,6 +705,7 @@ class Webhook(models.Model):
             cache.set(
                 key=self._blocked_cache_key(), value="BLOCKED", timeout=retry_after
             )
+            self.rate_limiter.block(retry_after)
             raise WebhookTooManyRequests(retry_after)
         return response
 
@@ -881,6 +1025,34 @@ class Tracker(models.Model):
     is_posting_name = models.BooleanField(
         default=True, help_text="Whether posted messages include the tracker's name."
     )
+    priority = models.IntegerField(
+        choices=Webhook.MessagePriority.choices,
+        default=Webhook.MessagePriority.NORMAL,
+        help_text=(
+            "Priority of messages from this tracker. "
+            "When many messages are waiting to be sent to a webhook, "
+            "messages with a higher priority are sent first."
+        ),
+    )
+    max_message_age = models.PositiveIntegerField(
+        default=None,
+        null=True,
+        blank=True,
+        help_text=(
+            "Max duration in minutes a message can wait for being sent. "
+            "Older messages are skipped, e.g. after Discord was not reachable, "
+            "and a short note with the number of skipped messages is sent instead."
+        ),
+    )
+    high_priority_min_value = models.PositiveBigIntegerField(
+        default=None,
+        null=True,
+        blank=True,
+        help_text=(
+            "Messages for killmails with at least this total value in ISK "
+            "are sent with high priority."
+        ),
+    )
     is_enabled = models.BooleanField(
         default=True,
         db_index=True,
@@ -925,13 +1097,17 @@ class Tracker(models.Model):
         )
 
     def process_killmail(
-        self, killmail: Killmail, ignore_max_age: bool = False
+        self,
+        killmail: Killmail,
+        ignore_max_age: bool = False,
+        context: Optional[KillmailContext] = None,
     ) -> Optional[Killmail]:
         """Run tracker on a killmail and see if it matches
 
         Args:
         - killmail: Killmail to process
         - ignore_max_age: Whether to discord killmails that are older then the defined threshold
+        - context: Shared data for this killmail, e.g. when processing it with many trackers
 
         Returns:
         - Copy of killmail with added tracker info if it matches or None if there is no match
@@ -942,283 +1118,45 @@ class Tracker(models.Model):
         if not ignore_max_age and killmail.time < threshold_date:
             return None
 
-        # pre-calculate shared information
-        solar_system = None
-        distance = None
-        jumps = None
-        is_high_sec = None
-        is_low_sec = None
-        is_null_sec = None
-        is_w_space = None
-        matching_ship_type_ids = None
-        if killmail.solar_system_id and (
-            self.origin_solar_system or self.has_localization_clause
-        ):
-            solar_system, _ = EveSolarSystem.objects.get_or_create_esi(
-                id=killmail.solar_system_id
-            )
-            is_high_sec = solar_system.is_high_sec
-            is_low_sec = solar_system.is_low_sec
-            is_null_sec = solar_system.is_null_sec
-            is_w_space = solar_system.is_w_space
-            if self.origin_solar_system:
-                distance = meters_to_ly(
-                    self.origin_solar_system.distance_to(solar_system)
-                )
-                jumps = self.origin_solar_system.jumps_to(solar_system)
-
-        # Make sure all ship types are in the local database
-        if self.has_type_clause:
-            EveType.objects.bulk_get_or_create_esi(
-                ids=killmail.ship_type_distinct_ids()
-            )
-
-        # apply filters
-        is_matching = True
-        try:
-            if is_matching and self.exclude_high_sec:
-                is_matching = not is_high_sec
-
-            if is_matching and self.exclude_low_sec:
-                is_matching = not is_low_sec
-
-            if is_matching and self.exclude_null_sec:
-                is_matching = not is_null_sec
-
-            if is_matching and self.exclude_w_space:
-                is_matching = not is_w_space
-
-            if is_matching and self.require_min_attackers:
-                is_matching = len(killmail.attackers) >= self.require_min_attackers
-
-            if is_matching and self.require_max_attackers:
-                is_matching = len(killmail.attackers) <= self.require_max_attackers
-
-            if is_matching and self.exclude_npc_kills:
-                is_matching = not killmail.zkb.is_npc
-
-            if is_matching and self.require_npc_kills:
-                is_matching = killmail.zkb.is_npc
-
-            if is_matching and self.require_min_value:
-                is_matching = (
-                    killmail.zkb.total_value is not None
-                    and killmail.zkb.total_value >= self.require_min_value * 1_000_000
-                )
-
-            if is_matching and self.require_max_distance:
-                is_matching = distance is not None and (
-                    distance <= self.require_max_distance
-                )
-
-            if is_matching and self.require_max_jumps:
-                is_matching = jumps is not None and (jumps <= self.require_max_jumps)
-
-            if is_matching and self.require_regions.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_regions.filter(
-                        id=solar_system.eve_constellation.eve_region_id
-                    ).exists()
-                )
+        if not context:
+            context = KillmailContext(killmail)
+        tracker_info = self.rules().match(context)
+        if not tracker_info:
+            return None
 
-            if is_matching and self.require_constellations.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_constellations.filter(
-                        id=solar_system.eve_constellation_id
-                    ).exists()
-                )
+        killmail_new = deepcopy(killmail)
+        killmail_new.tracker_info = replace(
+            tracker_info,
+            main_org=self._killmail_main_attacker_org(killmail),
+            main_ship_group=self._killmail_main_attacker_ship_group(killmail),
+        )
+        killmail_new.mark_stage(STAGE_MATCHED)
+        return killmail_new
 
-            if is_matching and self.require_solar_systems.exists():
-                is_matching = (
-                    solar_system
-                    and self.require_solar_systems.filter(id=solar_system.id).exists()
-                )
-
-            if is_matching and self.exclude_attacker_alliances.exists():
-                is_matching = self.exclude_attacker_alliances.exclude(
-                    alliance_id__in=killmail.attackers_distinct_alliance_ids()
-                ).exists()
-
-            if is_matching and self.exclude_attacker_corporations.exists():
-                is_matching = self.exclude_attacker_corporations.exclude(
-                    corporation_id__in=killmail.attackers_distinct_corporation_ids()
-                ).exists()
-
-            if is_matching:
-                if self.require_attacker_organizations_final_blow:
-                    attacker_final_blow = killmail.attacker_final_blow()
-                    is_matching = bool(attacker_final_blow) and (
-                        (
-                            bool(attacker_final_blow.alliance_id)
-                            and self.require_attacker_alliances.filter(
-                                alliance_id=attacker_final_blow.alliance_id
-                            ).exists()
-                        )
-                        | (
-                            bool(attacker_final_blow.corporation_id)
-                            and self.require_attacker_corporations.filter(
-                                corporation_id=attacker_final_blow.corporation_id
-                            ).exists()
-                        )
-                    )
-                else:
-                    if is_matching and self.require_attacker_alliances.exists():
-                        is_matching = self.require_attacker_alliances.filter(
-                            alliance_id__in=killmail.attackers_distinct_alliance_ids()
-                        ).exists()
-                    if is_matching and self.require_attacker_corporations.exists():
-                        is_matching = self.require_attacker_corporations.filter(
-                            corporation_id__in=killmail.attackers_distinct_corporation_ids()
-                        ).exists()
-
-            if is_matching and self.require_victim_alliances.exists():
-                is_matching = self.require_victim_alliances.filter(
-                    alliance_id=killmail.victim.alliance_id
-                ).exists()
-
-            if is_matching and self.exclude_victim_alliances.exists():
-                is_matching = self.exclude_victim_alliances.exclude(
-                    alliance_id=killmail.victim.alliance_id
-                ).exists()
-
-            if is_matching and self.require_victim_corporations.exists():
-                is_matching = self.require_victim_corporations.filter(
-                    corporation_id=killmail.victim.corporation_id
-                ).exists()
-
-            if is_matching and self.exclude_victim_corporations.exists():
-                is_matching = self.exclude_victim_corporations.exclude(
-                    corporation_id=killmail.victim.corporation_id
-                ).exists()
-
-            if is_matching and self.require_attacker_states.exists():
-                is_matching = User.objects.filter(
-                    profile__state__in=list(self.require_attacker_states.all()),
-                    character_ownerships__character__character_id__in=(
-                        killmail.attackers_distinct_character_ids()
-                    ),
-                ).exists()
-
-            if is_matching and self.exclude_attacker_states.exists():
-                is_matching = not User.objects.filter(
-                    profile__state__in=list(self.exclude_attacker_states.all()),
-                    character_ownerships__character__character_id__in=(
-                        killmail.attackers_distinct_character_ids()
-                    ),
-                ).exists()
-
-            if is_matching and self.require_victim_states.exists():
-                is_matching = User.objects.filter(
-                    profile__state__in=list(self.require_victim_states.all()),
-                    character_ownerships__character__character_id=(
-                        killmail.victim.character_id
-                    ),
-                ).exists()
-
-            if is_matching and self.require_victim_ship_groups.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    eve_group_id__in=list(
-                        self.require_victim_ship_groups.values_list("id", flat=True)
-                    ),
-                    id=killmail.victim.ship_type_id,
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_victim_ship_types.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=list(
-                        self.require_victim_ship_types.values_list("id", flat=True)
-                    ),
-                    id=killmail.victim.ship_type_id,
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_attackers_ship_groups.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=set(killmail.attackers_ship_type_ids())
-                ).filter(
-                    eve_group_id__in=list(
-                        self.require_attackers_ship_groups.values_list("id", flat=True)
-                    )
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-            if is_matching and self.require_attackers_ship_types.exists():
-                ship_types_matching_qs = EveType.objects.filter(
-                    id__in=set(killmail.attackers_ship_type_ids())
-                ).filter(
-                    id__in=list(
-                        self.require_attackers_ship_types.values_list("id", flat=True)
-                    )
-                )
-                is_matching = ship_types_matching_qs.exists()
-                if is_matching:
-                    matching_ship_type_ids = list(
-                        ship_types_matching_qs.values_list("id", flat=True)
-                    )
-
-        except AttributeError:
-            is_matching = False
-
-        if is_matching:
-            killmail_new = deepcopy(killmail)
-            killmail_new.tracker_info = TrackerInfo(
-                tracker_pk=self.pk,
-                jumps=jumps,
-                distance=distance,
-                main_org=self._killmail_main_attacker_org(killmail),
-                main_ship_group=self._killmail_main_attacker_ship_group(killmail),
-                matching_ship_type_ids=matching_ship_type_ids,
-            )
-            return killmail_new
-        return None
+    def rules(self) -> TrackerRules:
+        """Compiled rules of this tracker."""
+        return TrackerRules.get_or_compile(self)
 
     @classmethod
     def _killmail_main_attacker_org(cls, killmail) -> Optional[EntityCount]:
         """returns the main attacker group with count"""
-        org_items = []
-        for attacker in killmail.attackers:
-            if attacker.alliance_id:
-                org_items.append(
-                    EntityCount(
-                        id=attacker.alliance_id, category=EntityCount.CATEGORY_ALLIANCE
-                    )
-                )
-
-            if attacker.corporation_id:
-                org_items.append(
-                    EntityCount(
-                        id=attacker.corporation_id,
-                        category=EntityCount.CATEGORY_CORPORATION,
-                    )
-                )
-
+        org_items = [
+            EntityCount(id=id, category=EntityCount.CATEGORY_ALLIANCE, count=count)
+            for id, count in killmail.attackers.counts("alliance_id").items()
+            if id
+        ] + [
+            EntityCount(id=id, category=EntityCount.CATEGORY_CORPORATION, count=count)
+            for id, count in killmail.attackers.counts("corporation_id").items()
+            if id
+        ]
         if org_items:
-            org_items_2 = [
-                EntityCount(id=x.id, category=x.category, count=org_items.count(x))
-                for x in set(org_items)
-            ]
-            max_count = max([x.count for x in org_items_2])
+            max_count = max([x.count for x in org_items])
             threshold = max(
                 len(killmail.attackers) * cls.MAIN_MINIMUM_SHARE,
                 cls.MAIN_MINIMUM_COUNT,
             )
             if max_count >= threshold:
-                org_items_3 = [x for x in org_items_2 if x.count == max_count]
+                org_items_3 = [x for x in org_items if x.count == max_count]
                 if len(org_items_3) > 1:
                     org_items_4 = [x for x in org_items_3 if x.is_alliance]
                     if len(org_items_4) > 0:
@@ -1274,14 +1212,46 @@ class Tracker(models.Model):
         return None
 
     def generate_killmail_message(
-        self, killmail: Killmail, intro_text: str = None
+        self,
+        killmail: Killmail,
+        intro_text: str = None,
+        other_trackers: Optional[Iterable["Tracker"]] = None,
     ) -> int:
         """generate a message from given killmail and enqueue for later sending
 
+        Params
+            other_trackers: Other trackers of the same webhook matching the killmail,
+                which are listed in the same message
+
         returns new queue size
         """
         from .core import discord_messages
 
-        content = discord_messages.create_content(self, intro_text)
-        embed = discord_messages.create_embed(self, killmail)
-        return self.webhook.enqueue_message(content=content, embeds=[embed])
+        content = discord_messages.create_content(self, intro_text, other_trackers)
+        embed = discord_messages.create_embed_cached(self, killmail)
+        trackers = [self, *(other_trackers or [])]
+        priority = max(tracker.message_priority(killmail) for tracker in trackers)
+        max_ages = [tracker.max_message_age for tracker in trackers]
+        max_age = None if not all(max_ages) else max(max_ages) * 60
+        return self.webhook.enqueue_message(
+            content=content,
+            embeds=[embed],
+            meta={
+                "killmail_id": killmail.id,
+                "killmail_time": killmail.time,
+                "tracker_pk": self.pk,
+                "timestamps": add_stage(killmail.timestamps, STAGE_GENERATED),
+            },
+            priority=priority,
+            max_age=max_age,
+        )
+
+    def message_priority(self, killmail: Killmail) -> int:
+        """Return priority of the message for a killmail."""
+        if (
+            self.high_priority_min_value
+            and killmail.zkb.total_value
+            and killmail.zkb.total_value >= self.high_priority_min_value
+        ):
+            return max(self.priority, Webhook.MessagePriority.HIGH)
+        return self.priority
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from allianceauth.authentication.models import CharacterOwnership, UserProfile
+from allianceauth.services.hooks import get_extension_logger
+from app_utils.logging import LoggerAddTag
+
+from . import __title__
+from .core.character_states import CharacterStateIndex
+from .core.trackers import TrackerRules
+from .models import Tracker
+
+logger = LoggerAddTag(get_extension_logger(__name__), __title__)
+
+
+@receiver(post_save, sender=Tracker)
+def tracker_saved(sender, instance, **kwargs):
+    """Rebuild compiled rules when a tracker is changed."""
+    _rebuild_rules(instance.pk)
+
+
+@receiver(post_delete, sender=Tracker)
+def tracker_deleted(sender, instance, **kwargs):
+    """Remove compiled rules when a tracker is deleted."""
+    TrackerRules.invalidate(instance.pk)
+
+
+def tracker_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Rebuild compiled rules when a clause of a tracker is changed."""
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if not reverse:
+        _rebuild_rules(instance.pk)
+    elif pk_set:
+        for tracker_pk in pk_set:
+            _rebuild_rules(tracker_pk)
+    elif action == "post_clear":
+        # trackers which were related are no longer known after a reverse clear
+        for tracker_pk in Tracker.objects.values_list("pk", flat=True):
+            _rebuild_rules(tracker_pk)
+
+
+def tracker_clause_deleted(sender, instance, **kwargs):
+    """Rebuild compiled rules when an object used in a clause of a tracker
+    is deleted.
+
+    Deleting the object removes it from all trackers without sending m2m_changed.
+    The trackers need to be looked up before, because the relations are gone after.
+    """
+    query = Q()
+    for field in _CLAUSE_FIELDS[sender]:
+        query |= Q(**{field.name: instance})
+    tracker_pks = Tracker.objects.filter(query).values_list("pk", flat=True)
+    for tracker_pk in tracker_pks.distinct():
+        _rebuild_rules(tracker_pk)
+
+
+@receiver(post_save, sender=CharacterOwnership)
+def character_ownership_saved(sender, instance, **kwargs):
+    """Update character state index when a character changes owner."""
+    CharacterStateIndex.update_user(instance.user_id)
+
+
+@receiver(post_delete, sender=CharacterOwnership)
+def character_ownership_deleted(sender, instance, **kwargs):
+    """Update character state index when a character loses its owner."""
+    CharacterStateIndex.remove_character(instance.character.character_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def user_profile_saved(sender, instance, **kwargs):
+    """Update character state index when the state of a user might have changed."""
+    CharacterStateIndex.update_user(instance.user_id)
+
+
+def _rebuild_rules(tracker_pk: int) -> None:
+    """Invalidate compiled rules of a tracker and compile them again
+    once the current transaction is committed.
+
+    Repeated changes within a transaction therefore compile the rules only once.
+    """
+    TrackerRules.invalidate(tracker_pk)
+    transaction.on_commit(partial(_compile_rules, tracker_pk))
+
+
+def _compile_rules(tracker_pk: int) -> None:
+    try:
+        tracker = Tracker.objects.get(pk=tracker_pk)
+    except Tracker.DoesNotExist:
+        return
+    if tracker.is_enabled:
+        TrackerRules.get_or_compile(tracker)
+
+
+_CLAUSE_FIELDS = defaultdict(list)
+for field in Tracker._meta.many_to_many:
+    m2m_changed.connect(
+        tracker_m2m_changed,
+        sender=field.remote_field.through,
+        dispatch_uid=f"killtracker_tracker_{field.name}_changed",
+    )
+    _CLAUSE_FIELDS[field.related_model].append(field)
+
+for model in _CLAUSE_FIELDS:
+    pre_delete.connect(
+        tracker_clause_deleted,
+        sender=model,
+        dispatch_uid=f"killtracker_tracker_{model._meta.label_lower}_deleted",
+    )
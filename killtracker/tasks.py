@@ -1,6 +1,9 @@
-from celery import chain, shared_task
+from collections import defaultdict
+from typing import List, Optional
 
-from django.db import IntegrityError
+from celery import shared_task
+
+from django.db import IntegrityError, OperationalError
 from eveuniverse.core.esitools import is_esi_online
 from eveuniverse.tasks import update_unresolved_eve_entities
 
@@ -12,16 +15,24 @@ from app_utils.logging import LoggerAddTag
 
 from . import APP_NAME, __title__
 from .app_settings import (
-    KILLTRACKER_DISCORD_SEND_DELAY,
+    KILLTRACKER_BATCHED_MATCHING_ENABLED,
     KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES,
     KILLTRACKER_GENERATE_MESSAGE_RETRY_COUNTDOWN,
     KILLTRACKER_MAX_KILLMAILS_PER_RUN,
     KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS,
+    KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE,
     KILLTRACKER_STORING_KILLMAILS_ENABLED,
     KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
     KILLTRACKER_TASKS_TIMEOUT,
 )
+from .core.character_states import CharacterStateIndex
+from .core.delivery import MessageDeliveryService, send_next_message_batch
+from .core.entity_names import EntityNameCache
+from .core.killmail_archive import KillmailArchiveBuffer
 from .core.killmails import Killmail
+from .core.latency import STAGE_STORED
+from .core.tracker_index import TrackerIndex
+from .core.trackers import KillmailContext, OriginDistanceFilter
 from .exceptions import WebhookTooManyRequests
 from .models import EveKillmail, Tracker, Webhook
 
@@ -40,40 +51,20 @@ def run_killtracker(runs: int = 0) -> None:
 
     if runs == 0:
         logger.debug("Killtracker run started...")
-        qs = cached_queryset(
-            Webhook.objects.filter(is_enabled=True),
-            key=f"{APP_NAME}_enabled_webhooks",
-            timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
-        )
-        for webhook in qs:
-            webhook.reset_failed_messages()
+        reset_failed_messages()
 
     killmail = Killmail.create_from_zkb_redisq()
     if killmail:
-        killmail.save()
-        qs = cached_queryset(
-            Tracker.objects.filter(is_enabled=True),
-            key=f"{APP_NAME}_enabled_trackers",
-            timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
-        )
-        for tracker in qs:
-            run_tracker.delay(tracker_pk=tracker.pk, killmail_id=killmail.id)
-
-        if KILLTRACKER_STORING_KILLMAILS_ENABLED:
-            chain(
-                store_killmail.si(killmail.id),
-                update_unresolved_eve_entities.si(),
-            ).delay()
+        dispatch_killmail(killmail)
 
     total_killmails = runs + (1 if killmail else 0)
     if killmail and total_killmails < KILLTRACKER_MAX_KILLMAILS_PER_RUN:
         run_killtracker.delay(runs=runs + 1)
     else:
-        if (
-            KILLTRACKER_STORING_KILLMAILS_ENABLED
-            and KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS > 0
-        ):
-            delete_stale_killmails.delay()
+        if KILLTRACKER_STORING_KILLMAILS_ENABLED:
+            store_buffered_killmails.delay()
+            if KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS > 0:
+                delete_stale_killmails.delay()
 
         logger.info(
             "Killtracker runs completed. %d killmails received from ZKB",
@@ -81,6 +72,119 @@ def run_killtracker(runs: int = 0) -> None:
         )
 
 
+def dispatch_killmail(killmail: Killmail) -> None:
+    """Store a newly received killmail and start the trackers for it."""
+    if not CharacterStateIndex.exists():
+        rebuild_character_state_index.delay()
+    if not EntityNameCache.exists():
+        warm_entity_name_cache.delay()
+    killmail.mark_stage(STAGE_STORED)
+    killmail.save()
+    if KILLTRACKER_BATCHED_MATCHING_ENABLED:
+        run_trackers.delay(killmail_id=killmail.id)
+    else:
+        for tracker in _enabled_trackers():
+            run_tracker.delay(tracker_pk=tracker.pk, killmail_id=killmail.id)
+
+    if KILLTRACKER_STORING_KILLMAILS_ENABLED:
+        buffer_size = KillmailArchiveBuffer.add(killmail)
+        if buffer_size >= KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE:
+            store_buffered_killmails.delay()
+
+
+@shared_task(base=QueueOnce, timeout=KILLTRACKER_TASKS_TIMEOUT)
+def reset_failed_messages() -> None:
+    """Move failed messages of all enabled webhooks back into their main queue."""
+    qs = cached_queryset(
+        Webhook.objects.filter(is_enabled=True),
+        key=f"{APP_NAME}_enabled_webhooks",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
+    for webhook in qs:
+        webhook.reset_failed_messages()
+
+
+def _enabled_trackers():
+    return cached_queryset(
+        Tracker.objects.filter(is_enabled=True).select_related("webhook"),
+        key=f"{APP_NAME}_enabled_trackers",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
+
+
+@shared_task(bind=True, max_retries=None)
+def run_trackers(self, killmail_id: int, ignore_max_age: bool = False) -> None:
+    """Run all enabled trackers for given killmail and trigger sending if needed."""
+    retry_task_if_esi_is_down(self)
+    killmail = Killmail.get(killmail_id)
+    context = KillmailContext(killmail)
+    trackers = list(_enabled_trackers())
+    rules = tuple(tracker.rules() for tracker in trackers)
+    try:
+        candidate_pks = TrackerIndex.for_rules(rules).candidates(context)
+        distance_filter = OriginDistanceFilter.for_rules(rules)
+        out_of_range_pks = distance_filter.trackers_out_of_range(context)
+    except Exception:
+        logger.warning(
+            "Failed to pre-filter trackers for killmail %s. Checking all trackers",
+            killmail_id,
+            exc_info=True,
+        )
+        candidate_pks = {tracker.pk for tracker in trackers}
+        out_of_range_pks = set()
+    idle_webhooks = dict()
+    matching_trackers = defaultdict(list)
+    failed_tracker_pks = []
+    for tracker in trackers:
+        logger.debug(f"{tracker}: Checking killmail id {killmail_id}")
+        try:
+            if tracker.pk not in candidate_pks or tracker.pk in out_of_range_pks:
+                killmail_new = None
+            else:
+                killmail_new = tracker.process_killmail(
+                    killmail=killmail, ignore_max_age=ignore_max_age, context=context
+                )
+        except Exception:
+            logger.warning(
+                "%s: Failed to process killmail %s. Will retry",
+                tracker,
+                killmail_id,
+                exc_info=True,
+            )
+            failed_tracker_pks.append(tracker.pk)
+            continue
+
+        if killmail_new:
+            killmail_new.save()
+            matching_trackers[tracker.webhook_id].append(tracker)
+        else:
+            idle_webhooks[tracker.webhook_id] = tracker.webhook
+
+    for webhook_trackers in matching_trackers.values():
+        if webhook_trackers[0].webhook.collapse_duplicates:
+            generate_killmail_message.delay(
+                tracker_pk=webhook_trackers[0].pk,
+                killmail_id=killmail_id,
+                other_tracker_pks=[obj.pk for obj in webhook_trackers[1:]],
+            )
+        else:
+            for tracker in webhook_trackers:
+                generate_killmail_message.delay(
+                    tracker_pk=tracker.pk, killmail_id=killmail_id
+                )
+
+    for webhook_pk, webhook in idle_webhooks.items():
+        if webhook_pk not in matching_trackers and webhook.main_queue.size():
+            _start_sending(webhook_pk)
+
+    for tracker_pk in failed_tracker_pks:
+        run_tracker.delay(
+            tracker_pk=tracker_pk,
+            killmail_id=killmail_id,
+            ignore_max_age=ignore_max_age,
+        )
+
+
 @shared_task(bind=True, max_retries=None)
 def run_tracker(
     self, tracker_pk: int, killmail_id: int, ignore_max_age: bool = False
@@ -101,22 +205,27 @@ def run_tracker(
         killmail_new.save()
         generate_killmail_message.delay(tracker_pk=tracker_pk, killmail_id=killmail_id)
     elif tracker.webhook.main_queue.size():
-        send_messages_to_webhook.delay(webhook_pk=tracker.webhook.pk)
+        _start_sending(tracker.webhook.pk)
 
 
 @shared_task(bind=True, max_retries=None)
-def generate_killmail_message(self, tracker_pk: int, killmail_id: int) -> None:
-    """Generate and enqueue message from given killmail and start sending."""
+def generate_killmail_message(
+    self,
+    tracker_pk: int,
+    killmail_id: int,
+    other_tracker_pks: Optional[List[int]] = None,
+) -> None:
+    """Generate and enqueue message from given killmail and start sending.
+
+    Other trackers matching the same killmail are listed in the same message.
+    """
     retry_task_if_esi_is_down(self)
-    tracker = Tracker.objects.get_cached(
-        pk=tracker_pk,
-        select_related="webhook",
-        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
-    )
-    killmail = Killmail.get(killmail_id)
+    tracker = _get_tracker_cached(tracker_pk)
+    other_trackers = [_get_tracker_cached(pk) for pk in other_tracker_pks or []]
+    killmail = Killmail.get(killmail_id, tracker_pk=tracker_pk)
     logger.info("%s: Generating message from killmail %s", tracker, killmail.id)
     try:
-        tracker.generate_killmail_message(killmail)
+        tracker.generate_killmail_message(killmail, other_trackers=other_trackers)
     except Exception as ex:
         will_retry = self.request.retries < KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES
         logger.warning(
@@ -132,7 +241,23 @@ def generate_killmail_message(self, tracker_pk: int, killmail_id: int) -> None:
             exc=ex,
         )
     else:
-        send_messages_to_webhook.delay(webhook_pk=tracker.webhook.pk)
+        _start_sending(tracker.webhook.pk)
+
+
+def _start_sending(webhook_pk: int) -> None:
+    """Start sending queued messages of a webhook,
+    unless they are sent by the message delivery service.
+    """
+    if not MessageDeliveryService.is_running():
+        send_messages_to_webhook.delay(webhook_pk=webhook_pk)
+
+
+def _get_tracker_cached(tracker_pk: int) -> Tracker:
+    return Tracker.objects.get_cached(
+        pk=tracker_pk,
+        select_related="webhook",
+        timeout=KILLTRACKER_TASK_OBJECTS_CACHE_TIMEOUT,
+    )
 
 
 @shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
@@ -149,12 +274,82 @@ def store_killmail(killmail_id: int) -> None:
         logger.debug("%s: Stored killmail", killmail.id)
 
 
-@shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
+@shared_task(base=QueueOnce, timeout=KILLTRACKER_TASKS_TIMEOUT)
+def store_buffered_killmails() -> None:
+    """Store all buffered killmails as EveKillmail objects in batches
+    and resolve their entities once at the end.
+    """
+    batch_size = max(1, KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE)
+    total = 0
+    while True:
+        killmails, count = KillmailArchiveBuffer.read(batch_size)
+        if killmails:
+            total += _store_killmails(killmails)
+        KillmailArchiveBuffer.remove(count)
+        if count < batch_size:
+            break
+
+    if total:
+        logger.info("Stored %d killmails", total)
+        update_unresolved_eve_entities.delay()
+
+
+def _store_killmails(killmails: List[Killmail]) -> int:
+    """Store killmails in bulk and return the number of created killmails.
+
+    Falls back to storing one killmail at a time when the bulk insert fails,
+    so one bad killmail does not block the buffer. Bad killmails are dropped.
+    Operational errors like a lost connection are raised,
+    so the killmails stay in the buffer.
+    """
+    try:
+        created = EveKillmail.objects.create_from_killmails(
+            killmails, resolve_ids=False
+        )
+    except OperationalError:
+        raise
+    except Exception:
+        logger.warning(
+            "Failed to store %d killmails in bulk. Storing them one by one",
+            len(killmails),
+            exc_info=True,
+        )
+    else:
+        return len(created)
+
+    total = 0
+    for killmail in killmails:
+        try:
+            created = EveKillmail.objects.create_from_killmails(
+                [killmail], resolve_ids=False
+            )
+        except OperationalError:
+            raise
+        except Exception:
+            logger.exception("%s: Failed to store killmail. Dropping it", killmail.id)
+        else:
+            total += len(created)
+    return total
+
+
+@shared_task(base=QueueOnce, timeout=KILLTRACKER_TASKS_TIMEOUT)
+def rebuild_character_state_index() -> None:
+    """Rebuild index of the Auth states of all owned characters."""
+    CharacterStateIndex.rebuild()
+
+
+@shared_task(base=QueueOnce, timeout=KILLTRACKER_TASKS_TIMEOUT)
+def warm_entity_name_cache() -> None:
+    """Fill cache of entity names from the database."""
+    EntityNameCache.warm()
+
+
+@shared_task(base=QueueOnce, timeout=KILLTRACKER_TASKS_TIMEOUT)
 def delete_stale_killmails() -> None:
     """deleted all EveKillmail objects that are considered stale"""
-    _, details = EveKillmail.objects.delete_stale()
-    if details:
-        logger.info("Deleted %d stale killmails", details["killtracker.EveKillmail"])
+    result = EveKillmail.objects.delete_stale()
+    if result and result[1]["killtracker.EveKillmail"]:
+        logger.info("Deleted %d stale killmails", result[1]["killtracker.EveKillmail"])
 
 
 @shared_task(
@@ -175,33 +370,25 @@ def send_messages_to_webhook(self, webhook_pk: int) -> None:
         logger.warning("%s: Webhook is disabled - aborting", webhook)
         return
 
-    message = webhook.main_queue.dequeue()
-    if message:
-        logger.debug("%s: Sending message to webhook", webhook)
-        try:
-            response = webhook.send_message_to_webhook(message)
-        except WebhookTooManyRequests as ex:
-            webhook.main_queue.enqueue(message)
-            logger.warning(
-                "%s: Too many requests for webhook. Blocked for %s seconds. Aborting.",
-                webhook,
-                ex.retry_after,
-            )
-            return
+    if MessageDeliveryService.is_running():
+        logger.debug("%s: Messages are sent by the delivery service", webhook)
+        return
 
-        if not response.status_ok:
-            webhook.error_queue.enqueue(message)
-            logger.warning(
-                "%s: Failed to send message to webhook, will retry. "
-                "HTTP status code: %d, response: %s",
-                webhook,
-                response.status_code,
-                response.content,
-            )
+    try:
+        wait = send_next_message_batch(webhook)
+    except WebhookTooManyRequests as ex:
+        logger.warning(
+            "%s: Too many requests for webhook. Blocked for %s seconds. Aborting.",
+            webhook,
+            ex.retry_after,
+        )
+        return
 
-        raise self.retry(countdown=KILLTRACKER_DISCORD_SEND_DELAY)
-    else:
+    if wait is None:
         logger.debug("%s: No more messages to send for webhook", webhook)
+        return
+
+    raise self.retry(countdown=wait)
 
 
 @shared_task(timeout=KILLTRACKER_TASKS_TIMEOUT)
@@ -219,4 +406,4 @@ def send_test_message_to_webhook(webhook_pk: int, count: int = 1) -> None:
     for n in range(count):
         num_str = f"{n+1}/{count} " if count > 1 else ""
         webhook.enqueue_message(content=f"Test message {num_str}from {__title__}.")
-    send_messages_to_webhook.delay(webhook.pk)
+    _start_sending(webhook.pk)
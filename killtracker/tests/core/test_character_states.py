@@ -0,0 +1,109 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from allianceauth.authentication.models import CharacterOwnership
+from allianceauth.tests.auth_utils import AuthUtils
+from app_utils.allianceauth import get_redis_client
+from app_utils.testing import add_character_to_user_2
+
+from killtracker.core.character_states import CharacterStateIndex
+from killtracker.core.trackers import KillmailContext
+
+from ..testdata.factories import (
+    KillmailAttackerFactory,
+    KillmailFactory,
+    KillmailVictimFactory,
+)
+
+
+class TestCharacterStateIndex(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.state_member = AuthUtils.get_member_state()
+        cls.state_guest = AuthUtils.get_guest_state()
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = AuthUtils.create_member("Lex Luthor")
+        add_character_to_user_2(self.user, 1011, "Lex Luthor", 2011, "LexCorp")
+
+    def tearDown(self) -> None:
+        cache.clear()  # do not leak index into other tests
+
+    def test_should_return_none_when_index_does_not_exist(self):
+        # when/then
+        self.assertIsNone(CharacterStateIndex.state_ids([1011]))
+
+    def test_should_return_states_from_index_without_queries(self):
+        # given
+        CharacterStateIndex.rebuild()
+        # when
+        with self.assertNumQueries(0):
+            result = CharacterStateIndex.state_ids([1011, 1099])
+        # then
+        self.assertDictEqual(result, {1011: self.state_member.pk})
+
+    def test_should_fetch_states_from_database_when_index_does_not_exist(self):
+        # when
+        result = CharacterStateIndex.state_ids_or_fetch([1011, 1099])
+        # then
+        self.assertDictEqual(result, {1011: self.state_member.pk})
+
+    def test_should_add_new_character_to_index(self):
+        # given
+        CharacterStateIndex.rebuild()
+        # when
+        add_character_to_user_2(self.user, 1012, "Lana Lang", 2011, "LexCorp")
+        # then
+        self.assertDictEqual(
+            CharacterStateIndex.state_ids([1012]), {1012: self.state_member.pk}
+        )
+
+    def test_should_update_index_when_user_changes_state(self):
+        # given
+        CharacterStateIndex.rebuild()
+        # when
+        self.user.profile.state = self.state_guest
+        self.user.profile.save()
+        # then
+        self.assertDictEqual(
+            CharacterStateIndex.state_ids([1011]), {1011: self.state_guest.pk}
+        )
+
+    def test_should_remove_character_when_ownership_is_deleted(self):
+        # given
+        CharacterStateIndex.rebuild()
+        # when
+        CharacterOwnership.objects.filter(character__character_id=1011).delete()
+        # then
+        self.assertDictEqual(CharacterStateIndex.state_ids([1011]), {})
+
+    def test_should_not_create_index_when_updating(self):
+        # when
+        add_character_to_user_2(self.user, 1012, "Lana Lang", 2011, "LexCorp")
+        # then
+        self.assertFalse(CharacterStateIndex.exists())
+
+    def test_should_not_update_index_which_has_not_been_built(self):
+        # given
+        get_redis_client().hset(CharacterStateIndex.KEY, 1099, self.state_guest.pk)
+        # when
+        add_character_to_user_2(self.user, 1012, "Lana Lang", 2011, "LexCorp")
+        # then
+        self.assertFalse(CharacterStateIndex.exists())
+        self.assertIsNone(get_redis_client().hget(CharacterStateIndex.KEY, 1012))
+
+    def test_killmail_context_should_use_index(self):
+        # given
+        CharacterStateIndex.rebuild()
+        killmail = KillmailFactory(
+            attackers=[KillmailAttackerFactory(character_id=1011)],
+            victim=KillmailVictimFactory(character_id=1099),
+        )
+        context = KillmailContext(killmail)
+        # when
+        with self.assertNumQueries(0):
+            result = context.character_state_ids
+        # then
+        self.assertDictEqual(result, {1011: self.state_member.pk})
@@ -0,0 +1,150 @@
+import json
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from killtracker.core.consumer import RedisQConsumer
+
+from ..testdata.helpers import killmails_data
+
+MODULE_PATH = "killtracker.core.consumer"
+
+
+class RedisQStubHandler(BaseHTTPRequestHandler):
+    """Serves the killmails of the server one by one like RedisQ."""
+
+    protocol_version = "HTTP/1.1"  # enables keep-alive
+
+    def do_GET(self):
+        self.server.client_ports.add(self.client_address[1])
+        try:
+            package = self.server.packages.pop(0)
+        except IndexError:
+            package = None
+        body = json.dumps({"package": package}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RedisQStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, packages):
+        super().__init__(("127.0.0.1", 0), RedisQStubHandler)
+        self.packages = list(packages)
+        self.client_ports = set()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/listen.php"
+
+
+class TestRedisQConsumer(TestCase):
+    def setUp(self) -> None:
+        data = killmails_data()
+        self.server = RedisQStubServer([data[10000001], data[10000002]])
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        patcher = patch(
+            "killtracker.core.killmails.ZKB_REDISQ_URL", new=self.server.url
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_should_dispatch_received_killmails(self):
+        # given
+        dispatched = []
+        consumer = RedisQConsumer(dispatch=dispatched.append, max_killmails=2)
+        # when
+        consumer.run()
+        # then
+        self.assertListEqual([obj.id for obj in dispatched], [10000001, 10000002])
+        self.assertEqual(consumer.killmails_received, 2)
+        self.assertEqual(consumer.killmails_dispatched, 2)
+
+    def test_should_reuse_connection(self):
+        # given
+        consumer = RedisQConsumer(dispatch=lambda killmail: None, max_killmails=2)
+        # when
+        consumer.run()
+        # then
+        self.assertEqual(len(self.server.client_ports), 1)
+
+    def test_should_stop_gracefully_when_requested(self):
+        # given
+        dispatched = []
+
+        def dispatch(killmail):
+            dispatched.append(killmail)
+            consumer.stop()
+
+        consumer = RedisQConsumer(dispatch=dispatch)
+        # when
+        consumer.run()
+        # then
+        self.assertEqual(consumer.killmails_dispatched, len(dispatched))
+        self.assertGreaterEqual(len(dispatched), 1)
+
+    def test_should_continue_when_dispatch_fails(self):
+        # given
+        dispatched = []
+
+        def dispatch(killmail):
+            if killmail.id == 10000001:
+                raise RuntimeError
+            dispatched.append(killmail)
+
+        consumer = RedisQConsumer(dispatch=dispatch, max_killmails=2)
+        # when
+        consumer.run()
+        # then
+        self.assertListEqual([obj.id for obj in dispatched], [10000002])
+
+    def test_should_apply_backpressure_when_queue_is_full(self):
+        # given
+        release = threading.Event()
+        dispatched = []
+
+        def dispatch(killmail):
+            release.wait(timeout=5)
+            dispatched.append(killmail)
+
+        consumer = RedisQConsumer(dispatch=dispatch, queue_size=1, max_killmails=2)
+        runner = threading.Thread(target=consumer.run)
+        runner.start()
+        # when
+        while consumer.killmails_received < 2:
+            release.wait(timeout=0.05)
+        self.assertTrue(consumer._queue.full())
+        release.set()
+        runner.join(timeout=10)
+        # then
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(len(dispatched), 2)
+
+    @patch(
+        "killtracker.management.commands.killtracker_consume_redisq.dispatch_killmail"
+    )
+    def test_command_should_dispatch_killmails(self, mock_dispatch_killmail):
+        # given
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        # when
+        call_command(
+            "killtracker_consume_redisq", "--max-killmails=2", stdout=StringIO()
+        )
+        # then
+        self.assertEqual(mock_dispatch_killmail.call_count, 2)
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous_handler)
@@ -0,0 +1,309 @@
+import signal
+import time
+from io import StringIO
+from unittest.mock import patch
+
+import dhooks_lite
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from killtracker.core.delivery import MessageDeliveryService, send_next_message_batch
+from killtracker.exceptions import WebhookTooManyRequests
+
+from ..testdata.helpers import LoadTestDataMixin
+
+MODULE_PATH = "killtracker.core.delivery"
+
+
+@patch(MODULE_PATH + ".Webhook.send_message_to_webhook", spec=True)
+class TestSendNextMessageBatch(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        self.webhook_1.main_queue.clear()
+        self.webhook_1.error_queue.clear()
+        self.webhook_1.rate_limiter.clear()
+
+    def _queued_messages(self) -> list:
+        queue = self.webhook_1.main_queue
+        key = queue.keys[queue.priorities.index(queue.default_priority)]
+        return [obj.decode("utf8") for obj in queue.conn.lrange(key, 0, -1)]
+
+    def test_should_return_none_when_no_messages(self, mock_send_message_to_webhook):
+        # when
+        result = send_next_message_batch(self.webhook_1)
+        # then
+        self.assertIsNone(result)
+        self.assertFalse(mock_send_message_to_webhook.called)
+
+    def test_should_send_message_and_return_delay(self, mock_send_message_to_webhook):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=200
+        )
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        with patch(MODULE_PATH + ".KILLTRACKER_DISCORD_SEND_DELAY", 3):
+            result = send_next_message_batch(self.webhook_1)
+        # then
+        self.assertEqual(result, 3)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+
+    def test_should_not_send_when_rate_limited(self, mock_send_message_to_webhook):
+        # given
+        self.webhook_1.enqueue_message(content="Test message")
+        self.webhook_1.rate_limiter.block(30)
+        # when
+        result = send_next_message_batch(self.webhook_1)
+        # then
+        self.assertAlmostEqual(result, 30, delta=5)
+        self.assertFalse(mock_send_message_to_webhook.called)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
+    def test_should_requeue_messages_when_blocked(self, mock_send_message_to_webhook):
+        # given
+        mock_send_message_to_webhook.side_effect = WebhookTooManyRequests(10)
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        with self.assertRaises(WebhookTooManyRequests):
+            send_next_message_batch(self.webhook_1)
+        # then
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
+    def test_should_keep_order_of_messages_when_blocked(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.side_effect = WebhookTooManyRequests(10)
+        for num in range(3):
+            self.webhook_1.enqueue_message(
+                embeds=[dhooks_lite.Embed(description=f"Alert {num}")]
+            )
+        self.webhook_1.enqueue_message(content="Other message")
+        messages = self._queued_messages()
+        # when
+        with self.assertRaises(WebhookTooManyRequests):
+            send_next_message_batch(self.webhook_1)
+        # then
+        self.assertListEqual(self._queued_messages(), messages)
+
+    def test_should_move_messages_to_error_queue_on_failure(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=404
+        )
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        send_next_message_batch(self.webhook_1)
+        # then
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertEqual(self.webhook_1.error_queue.size(), 1)
+
+    def test_should_send_messages_one_by_one_when_batch_is_rejected(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        def my_send_message_to_webhook(message_json):
+            if "Invalid" in message_json:
+                return dhooks_lite.WebhookResponse({}, status_code=400)
+            return dhooks_lite.WebhookResponse({}, status_code=200)
+
+        mock_send_message_to_webhook.side_effect = my_send_message_to_webhook
+        for description in ["Alert 1", "Invalid", "Alert 2"]:
+            self.webhook_1.enqueue_message(
+                embeds=[dhooks_lite.Embed(description=description)]
+            )
+        # when
+        send_next_message_batch(self.webhook_1)
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 4)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertEqual(self.webhook_1.error_queue.size(), 1)
+        self.assertIn("Invalid", self.webhook_1.error_queue.dequeue())
+
+    def test_should_not_send_messages_one_by_one_on_server_error(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=500
+        )
+        for num in range(2):
+            self.webhook_1.enqueue_message(
+                embeds=[dhooks_lite.Embed(description=f"Alert {num}")]
+            )
+        # when
+        send_next_message_batch(self.webhook_1)
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 1)
+        self.assertEqual(self.webhook_1.error_queue.size(), 2)
+
+    def test_should_keep_unsent_messages_when_blocked_while_sending_one_by_one(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.side_effect = [
+            dhooks_lite.WebhookResponse({}, status_code=400),
+            dhooks_lite.WebhookResponse({}, status_code=200),
+            WebhookTooManyRequests(10),
+        ]
+        for num in range(3):
+            self.webhook_1.enqueue_message(
+                embeds=[dhooks_lite.Embed(description=f"Alert {num}")]
+            )
+        messages = self._queued_messages()
+        # when
+        with self.assertRaises(WebhookTooManyRequests):
+            send_next_message_batch(self.webhook_1)
+        # then
+        self.assertListEqual(self._queued_messages(), messages[1:])
+        self.assertEqual(self.webhook_1.error_queue.size(), 0)
+
+
+@patch(MODULE_PATH + ".POLL_INTERVAL", 0.01)
+@patch(MODULE_PATH + ".KILLTRACKER_DISCORD_SEND_DELAY", 0)
+@patch(MODULE_PATH + ".Webhook.send_message_to_webhook", spec=True)
+class TestMessageDeliveryService(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        for webhook in [self.webhook_1, self.webhook_2]:
+            webhook.main_queue.clear()
+            webhook.error_queue.clear()
+            webhook.rate_limiter.clear()
+        self.service = MessageDeliveryService(max_workers=2)
+        # webhooks are loaded here, because the test database
+        # is not visible to the threads of the service
+        self.service._webhooks = {
+            self.webhook_1.pk: self.webhook_1,
+            self.webhook_2.pk: self.webhook_2,
+        }
+        patcher = patch.object(self.service, "_reload_webhooks")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stop_when_all_sent(self, message_json):
+        # queue sizes can not be used here, because they can be zero
+        # while another sender puts back a message which did not fit its batch
+        self.service_was_running = MessageDeliveryService.is_running()
+        self.messages_to_send -= 1
+        if self.messages_to_send <= 0:
+            self.service.stop()
+        return dhooks_lite.WebhookResponse({}, status_code=200)
+
+    def test_should_send_queued_messages_of_all_webhooks(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.side_effect = self._stop_when_all_sent
+        self.webhook_1.enqueue_message(content="Message 1")
+        self.webhook_2.enqueue_message(content="Message 2")
+        self.webhook_2.enqueue_message(content="Message 3")
+        self.messages_to_send = 3
+        # when
+        self.service.run()
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 3)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertEqual(self.webhook_2.main_queue.size(), 0)
+        self.assertTrue(self.service_was_running)
+        self.assertFalse(MessageDeliveryService.is_running())
+
+    def test_should_keep_sending_after_errors(self, mock_send_message_to_webhook):
+        # given
+        responses = [RuntimeError]
+
+        def my_send_message_to_webhook(message_json):
+            if responses:
+                raise responses.pop()
+            return self._stop_when_all_sent(message_json)
+
+        mock_send_message_to_webhook.side_effect = my_send_message_to_webhook
+        self.webhook_1.enqueue_message(content="Message 1")
+        self.webhook_1.enqueue_message(content="Message 2")
+        self.messages_to_send = 1
+        # when
+        with patch(MODULE_PATH + ".ERROR_BACKOFF", 0):
+            self.service.run()
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 2)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertEqual(self.webhook_1.error_queue.size(), 1)
+
+    def test_should_keep_running_after_errors_in_main_loop(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.side_effect = self._stop_when_all_sent
+        self.webhook_1.enqueue_message(content="Message 1")
+        self.messages_to_send = 1
+        webhooks_with_messages = self.service._webhooks_with_messages
+        errors = [RuntimeError]
+
+        def my_webhooks_with_messages():
+            if errors:
+                raise errors.pop()
+            return webhooks_with_messages()
+
+        # when
+        with patch(MODULE_PATH + ".ERROR_BACKOFF", 0), patch.object(
+            self.service,
+            "_webhooks_with_messages",
+            side_effect=my_webhooks_with_messages,
+        ):
+            self.service.run()
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 1)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+
+    def test_should_retry_failed_messages(self, mock_send_message_to_webhook):
+        # given
+        mock_send_message_to_webhook.side_effect = self._stop_when_all_sent
+        self.webhook_1.error_queue.enqueue(
+            self.webhook_1._discord_message_asjson(content="Failed message")
+        )
+        self.messages_to_send = 1
+        # when
+        self.service.run()
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 1)
+        self.assertEqual(self.webhook_1.error_queue.size(), 0)
+
+    def test_should_keep_heartbeat_while_workers_are_busy(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        def my_send_message_to_webhook(message_json):
+            time.sleep(1.5)  # longer than the heartbeat timeout
+            self.service_was_running = MessageDeliveryService.is_running()
+            self.service.stop()
+            return dhooks_lite.WebhookResponse({}, status_code=200)
+
+        mock_send_message_to_webhook.side_effect = my_send_message_to_webhook
+        self.webhook_1.enqueue_message(content="Message 1")
+        # when
+        with patch.object(
+            MessageDeliveryService, "_HEARTBEAT_TIMEOUT", 1
+        ), patch.object(MessageDeliveryService, "_HEARTBEAT_INTERVAL", 0.1):
+            self.service.run()
+        # then
+        self.assertTrue(self.service_was_running)
+        self.assertFalse(MessageDeliveryService.is_running())
+
+    @patch(
+        "killtracker.management.commands.killtracker_deliver_messages"
+        ".MessageDeliveryService",
+        spec=True,
+    )
+    def test_command_should_run_service(
+        self, mock_service, mock_send_message_to_webhook
+    ):
+        # given
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        # when
+        call_command(
+            "killtracker_deliver_messages", "--max-workers=3", stdout=StringIO()
+        )
+        # then
+        mock_service.assert_called_once_with(max_workers=3)
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous_handler)
+        self.assertTrue(mock_service.return_value.run.called)
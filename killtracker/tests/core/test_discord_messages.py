@@ -1,8 +1,14 @@
+from unittest.mock import patch
+
 import dhooks_lite
 
+from django.core.cache import cache
+
 from app_utils.testing import NoSocketsTestCase
 
 from killtracker.core import discord_messages
+from killtracker.core.killmails import EntityCount, TrackerInfo
+from killtracker.models import Tracker
 
 from ..testdata.factories import (
     KillmailAttackerFactory,
@@ -12,6 +18,8 @@ from ..testdata.factories import (
 )
 from ..testdata.helpers import LoadTestDataMixin
 
+MODULE_PATH = "killtracker.core.discord_messages"
+
 
 class TestCreateEmbed(LoadTestDataMixin, NoSocketsTestCase):
     def test_should_create_normal_embed(self):
@@ -45,3 +53,102 @@ class TestCreateEmbed(LoadTestDataMixin, NoSocketsTestCase):
         embed = discord_messages.create_embed(tracker, killmail)
         # then
         self.assertIsInstance(embed, dhooks_lite.Embed)
+
+
+class TestRenderedEntityIds(NoSocketsTestCase):
+    def test_should_return_only_ids_shown_in_embed(self):
+        # given
+        final_blow = KillmailAttackerFactory(
+            character_id=1011,
+            corporation_id=2011,
+            alliance_id=3011,
+            faction_id=None,
+            ship_type_id=34562,
+            is_final_blow=True,
+        )
+        other_attacker = KillmailAttackerFactory(
+            character_id=1012, corporation_id=2012, is_final_blow=False
+        )
+        victim = KillmailVictimFactory(
+            character_id=1001,
+            corporation_id=2001,
+            alliance_id=3001,
+            faction_id=None,
+            ship_type_id=603,
+        )
+        killmail = KillmailFactory(
+            victim=victim,
+            attackers=[final_blow, other_attacker],
+            solar_system_id=30004984,
+            tracker_info=TrackerInfo(
+                tracker_pk=1,
+                main_org=EntityCount(id=3011, category="alliance", count=1),
+                matching_ship_type_ids=[34562, 3756],
+            ),
+        )
+        # when
+        result = discord_messages._rendered_entity_ids(killmail)
+        # then
+        self.assertSetEqual(
+            result,
+            {1001, 2001, 3001, 603, 30004984, 1011, 2011, 34562, 3011, 3756},
+        )
+
+
+@patch(MODULE_PATH + ".create_embed", wraps=discord_messages.create_embed)
+class TestCreateEmbedCached(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        attacker = KillmailAttackerFactory(
+            character_id=1011, corporation_id=2011, alliance_id=3011
+        )
+        victim = KillmailVictimFactory(
+            character_id=1001, corporation_id=2001, alliance_id=3001
+        )
+        self.killmail = KillmailFactory(victim=victim, attackers=[attacker])
+
+    def test_should_share_embed_between_trackers_with_same_inputs(
+        self, spy_create_embed
+    ):
+        # given
+        tracker_1 = TrackerFactory(color="#ff0000")
+        tracker_2 = TrackerFactory(color="#ff0000")
+        # when
+        embed_1 = discord_messages.create_embed_cached(tracker_1, self.killmail)
+        embed_2 = discord_messages.create_embed_cached(tracker_2, self.killmail)
+        # then
+        self.assertEqual(spy_create_embed.call_count, 1)
+        self.assertDictEqual(embed_1.asdict(), embed_2.asdict())
+
+    def test_should_create_new_embed_for_different_inputs(self, spy_create_embed):
+        # given
+        tracker_1 = TrackerFactory(color="#ff0000")
+        tracker_2 = TrackerFactory(color="#00ff00")
+        # when
+        discord_messages.create_embed_cached(tracker_1, self.killmail)
+        discord_messages.create_embed_cached(tracker_2, self.killmail)
+        # then
+        self.assertEqual(spy_create_embed.call_count, 2)
+
+
+class TestCreateContent(LoadTestDataMixin, NoSocketsTestCase):
+    def test_should_list_all_trackers(self):
+        # given
+        tracker_1 = TrackerFactory(
+            name="Alpha", is_posting_name=True, ping_type=Tracker.ChannelPingType.HERE
+        )
+        tracker_2 = TrackerFactory(
+            name="Bravo", is_posting_name=True, ping_type=Tracker.ChannelPingType.HERE
+        )
+        # when
+        result = discord_messages.create_content(tracker_1, other_trackers=[tracker_2])
+        # then
+        self.assertEqual(result, "@here Trackers **Alpha**, **Bravo**:")
+
+    def test_should_name_single_tracker(self):
+        # given
+        tracker = TrackerFactory(name="Alpha", is_posting_name=True)
+        # when
+        result = discord_messages.create_content(tracker, intro_text="Intro")
+        # then
+        self.assertEqual(result, "Intro\nTracker **Alpha**:")
@@ -0,0 +1,89 @@
+from unittest.mock import patch
+
+from eveuniverse.models import EveEntity
+
+from app_utils.allianceauth import get_redis_client
+from app_utils.testing import NoSocketsTestCase
+
+from killtracker.core.entity_names import EntityNameCache, resolve_names
+
+from ..testdata.helpers import LoadTestDataMixin
+
+MODULE_PATH = "killtracker.core.entity_names"
+
+
+class TestEntityNameCache(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        EntityNameCache.clear()
+
+    def test_should_warm_cache_from_database(self):
+        # when
+        EntityNameCache.warm()
+        # then
+        self.assertTrue(EntityNameCache.exists())
+        self.assertDictEqual(
+            EntityNameCache.names([1001, 3001]),
+            {1001: "Bruce Wayne", 3001: "Wayne Enterprises"},
+        )
+
+    def test_should_not_return_unknown_names(self):
+        # given
+        EntityNameCache.add({1001: "Bruce Wayne"})
+        # when
+        result = EntityNameCache.names([1001, 9999])
+        # then
+        self.assertDictEqual(result, {1001: "Bruce Wayne"})
+
+    def test_should_not_report_existing_when_not_warmed(self):
+        # given
+        EntityNameCache.add({1001: "Bruce Wayne"})
+        # when/then
+        self.assertFalse(EntityNameCache.exists())
+
+    @patch(MODULE_PATH + ".KILLTRACKER_ENTITY_NAMES_CACHE_TIMEOUT", 60)
+    def test_should_not_renew_timeout_when_adding_names(self):
+        # given
+        EntityNameCache.warm()
+        get_redis_client().expire(EntityNameCache.KEY, 10)
+        # when
+        EntityNameCache.add({1999: "New Character"})
+        # then
+        self.assertLessEqual(get_redis_client().ttl(EntityNameCache.KEY), 10)
+
+
+@patch(MODULE_PATH + ".EveEntity.objects.update_from_esi_by_id", spec=True)
+class TestResolveNames(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        EntityNameCache.clear()
+
+    def test_should_resolve_names_from_cache(self, mock_update_from_esi_by_id):
+        # given
+        EntityNameCache.add({1001: "Cached Name"})
+        # when
+        resolver = resolve_names([1001])
+        # then
+        self.assertEqual(resolver.to_name(1001), "Cached Name")
+        self.assertFalse(mock_update_from_esi_by_id.called)
+
+    def test_should_resolve_names_from_database_and_cache_them(
+        self, mock_update_from_esi_by_id
+    ):
+        # when
+        resolver = resolve_names([1001, None])
+        # then
+        self.assertEqual(resolver.to_name(1001), "Bruce Wayne")
+        self.assertDictEqual(EntityNameCache.names([1001]), {1001: "Bruce Wayne"})
+        self.assertFalse(mock_update_from_esi_by_id.called)
+
+    def test_should_resolve_unknown_names_from_esi(self, mock_update_from_esi_by_id):
+        # given
+        def my_update_from_esi_by_id(ids):
+            EveEntity.objects.create(id=1999, name="New Character")
+            return 1
+
+        mock_update_from_esi_by_id.side_effect = my_update_from_esi_by_id
+        # when
+        resolver = resolve_names([1001, 1999])
+        # then
+        self.assertEqual(resolver.to_name(1999), "New Character")
+        mock_update_from_esi_by_id.assert_called_once_with({1999})
@@ -0,0 +1,107 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import dhooks_lite
+import requests_mock
+
+from django.test import TestCase
+
+from killtracker.core import http
+from killtracker.core.http import (
+    PooledWebhook,
+    close_sessions,
+    connection_stats,
+    get_session,
+)
+
+MODULE_PATH = "killtracker.core.http"
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGetSession(TestCase):
+    def setUp(self) -> None:
+        close_sessions()
+
+    def test_should_return_same_session_for_same_host(self):
+        # when
+        session_1 = get_session("https://zkillboard.com/api/killID/1/")
+        session_2 = get_session("https://zkillboard.com/api/killID/2/")
+        # then
+        self.assertIs(session_1, session_2)
+
+    def test_should_return_different_sessions_for_different_hosts(self):
+        # when
+        session_1 = get_session("https://zkillboard.com/api/")
+        session_2 = get_session("https://redisq.zkillboard.com/listen.php")
+        # then
+        self.assertIsNot(session_1, session_2)
+
+    def test_should_create_new_sessions_after_fork(self):
+        # given
+        session_1 = get_session("https://zkillboard.com/api/")
+        # when
+        with patch(MODULE_PATH + ".os.getpid", return_value=http._sessions_pid + 1):
+            session_2 = get_session("https://zkillboard.com/api/")
+        # then
+        self.assertIsNot(session_1, session_2)
+
+    def test_should_report_connection_reuse(self):
+        # given
+        server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_port}/"
+        # when
+        for _ in range(3):
+            get_session(url).get(url, timeout=5)
+        # then
+        stats = {obj.host: obj for obj in connection_stats()}
+        self.assertEqual(stats[url[:-1]].requests, 3)
+        self.assertEqual(stats[url[:-1]].connections, 1)
+        self.assertAlmostEqual(stats[url[:-1]].reuse_ratio, 2 / 3)
+
+
+@requests_mock.Mocker()
+class TestPooledWebhook(TestCase):
+    def test_should_send_message_over_pooled_session(self, requests_mocker):
+        # given
+        url = "https://discord.com/api/webhooks/123/abc"
+        requests_mocker.register_uri("POST", url, status_code=200, json={})
+        hook = PooledWebhook(url=url)
+        embed = dhooks_lite.Embed(description="dummy")
+        # when
+        response = hook.execute(content="test", embeds=[embed], wait_for_response=True)
+        # then
+        self.assertEqual(response.status_code, 200)
+        request = requests_mocker.last_request
+        self.assertEqual(json.loads(request.text)["content"], "test")
+        self.assertEqual(request.qs["wait"], ["true"])
+
+    def test_should_override_request_method_of_dhooks_lite(self, requests_mocker):
+        # given
+        url = "https://discord.com/api/webhooks/123/abc"
+        requests_mocker.register_uri("POST", url, status_code=200, json={})
+        hook = PooledWebhook(url=url)
+        # when
+        with patch(MODULE_PATH + ".get_session", wraps=get_session) as spy_get_session:
+            hook.execute(content="test")
+        # then
+        spy_get_session.assert_called_once_with(url)
@@ -0,0 +1,47 @@
+from django.test import TestCase
+
+from app_utils.allianceauth import get_redis_client
+
+from killtracker.core.killmail_archive import KillmailArchiveBuffer
+
+from ..testdata.factories import KillmailFactory
+
+
+class TestKillmailArchiveBuffer(TestCase):
+    def setUp(self) -> None:
+        KillmailArchiveBuffer.clear()
+
+    def test_should_read_killmails_in_order_received(self):
+        # given
+        killmail_1 = KillmailFactory()
+        killmail_2 = KillmailFactory()
+        KillmailArchiveBuffer.add(killmail_1)
+        KillmailArchiveBuffer.add(killmail_2)
+        # when
+        killmails, count = KillmailArchiveBuffer.read(10)
+        # then
+        self.assertListEqual(killmails, [killmail_1, killmail_2])
+        self.assertEqual(count, 2)
+        self.assertEqual(KillmailArchiveBuffer.size(), 2)
+
+    def test_should_remove_oldest_killmails(self):
+        # given
+        killmail_1 = KillmailFactory()
+        killmail_2 = KillmailFactory()
+        KillmailArchiveBuffer.add(killmail_1)
+        KillmailArchiveBuffer.add(killmail_2)
+        # when
+        KillmailArchiveBuffer.remove(1)
+        # then
+        killmails, _ = KillmailArchiveBuffer.read(10)
+        self.assertListEqual(killmails, [killmail_2])
+
+    def test_should_skip_invalid_items(self):
+        # given
+        KillmailArchiveBuffer.add(KillmailFactory())
+        get_redis_client().rpush(KillmailArchiveBuffer._KEY, b"invalid")
+        # when
+        killmails, count = KillmailArchiveBuffer.read(10)
+        # then
+        self.assertEqual(len(killmails), 1)
+        self.assertEqual(count, 2)
@@ -1,7 +1,10 @@
 import unittest
+from copy import deepcopy
+from dataclasses import replace
 from datetime import timedelta
 from unittest.mock import patch
 
+import requests
 import requests_mock
 from redis.exceptions import LockError
 
@@ -18,11 +21,14 @@ from killtracker.core.killmails import (
     ZKB_REDISQ_URL,
     EntityCount,
     Killmail,
+    KillmailAttacker,
+    KillmailAttackers,
+    TrackerInfo,
 )
 from killtracker.exceptions import KillmailDoesNotExist
 
 from .. import CacheStub
-from ..testdata.factories import KillmailFactory
+from ..testdata.factories import KillmailAttackerFactory, KillmailFactory
 from ..testdata.helpers import killmails_data, load_killmail
 
 MODULE_PATH = "killtracker.core.killmails"
@@ -70,6 +76,24 @@ class TestCreateFromZkbRedisq(NoSocketsTestCase):
         self.assertFalse(killmail.zkb.is_npc)
         self.assertFalse(killmail.zkb.is_solo)
         self.assertFalse(killmail.zkb.is_awox)
+        self.assertIn("received", killmail.timestamps)
+
+    def test_should_fetch_with_session_and_without_lock(
+        self, requests_mocker, mock_redis
+    ):
+        # given
+        requests_mocker.register_uri(
+            "GET",
+            ZKB_REDISQ_URL,
+            status_code=200,
+            json={"package": killmails_data()[10000001]},
+        )
+        session = requests.Session()
+        # when
+        killmail = Killmail.create_from_zkb_redisq(session=session, use_lock=False)
+        # then
+        self.assertEqual(killmail.id, 10000001)
+        self.assertFalse(mock_redis.called)
 
     def test_should_return_none_when_zkb_returns_empty_package(
         self, requests_mocker, mock_redis
@@ -164,6 +188,62 @@ class TestKillmailSerialization(NoSocketsTestCase):
         self.assertEqual(killmail, killmail_2)
 
 
+class TestKillmailAttackers(NoSocketsTestCase):
+    def test_should_convert_attackers_into_columns(self):
+        # when
+        killmail = load_killmail(10000001)
+        # then
+        self.assertIsInstance(killmail.attackers, KillmailAttackers)
+        self.assertEqual(len(killmail.attackers), 3)
+
+    def test_should_return_attackers_like_a_list(self):
+        # given
+        attackers = [
+            KillmailAttacker(character_id=1001, is_final_blow=True),
+            KillmailAttacker(character_id=1002, security_status=-1.5),
+        ]
+        # when
+        killmail = KillmailFactory(attackers=attackers)
+        # then
+        self.assertEqual(killmail.attackers, attackers)
+        self.assertEqual(killmail.attackers[-1], attackers[1])
+        self.assertEqual(killmail.attackers[:1], attackers[:1])
+        self.assertEqual(list(killmail.attackers), attackers)
+        self.assertIsNone(killmail.attackers[0].alliance_id)
+        self.assertIsNone(killmail.attackers[0].security_status)
+        self.assertIsNone(killmail.attackers[1].is_final_blow)
+        with self.assertRaises(IndexError):
+            killmail.attackers[2]
+
+    def test_should_update_attacker_through_view(self):
+        # given
+        killmail = load_killmail(10000001)
+        self.assertSetEqual(killmail.attackers_distinct_alliance_ids(), {3001})
+        # when
+        killmail.attackers[0].alliance_id = 3002
+        # then
+        self.assertEqual(killmail.attackers[0].alliance_id, 3002)
+        self.assertSetEqual(killmail.attackers_distinct_alliance_ids(), {3001, 3002})
+
+    def test_should_return_counts(self):
+        # given
+        killmail = load_killmail(10000001)
+        # when
+        result = killmail.attackers.counts("ship_type_id")
+        # then
+        self.assertDictEqual(result, {34562: 1, 3756: 2})
+
+    def test_should_copy_attackers_independently(self):
+        # given
+        killmail_1 = load_killmail(10000001)
+        # when
+        killmail_2 = deepcopy(killmail_1)
+        killmail_2.attackers[0].character_id = 1099
+        # then
+        self.assertEqual(killmail_1.attackers[0].character_id, 1001)
+        self.assertEqual(killmail_2.attackers[0].character_id, 1099)
+
+
 class TestKillmailBasics(NoSocketsTestCase):
     @classmethod
     def setUpClass(cls):
@@ -298,6 +378,7 @@ class TestCreateFromZkbApi(NoSocketsTestCase):
 class TestKillmailStorage(TestCase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
 
     def test_should_store_and_retrieve_killmail(self):
         # given
@@ -308,6 +389,28 @@ class TestKillmailStorage(TestCase):
         # then
         self.assertEqual(killmail_1, killmail_2)
 
+    def test_should_store_killmail_for_tracker_separately(self):
+        # given
+        killmail = KillmailFactory()
+        killmail.save()
+        killmail_tracker = replace(killmail, tracker_info=TrackerInfo(tracker_pk=42))
+        # when
+        killmail_tracker.save()
+        # then
+        self.assertIsNone(Killmail.get(id=killmail.id).tracker_info)
+        self.assertEqual(
+            Killmail.get(id=killmail.id, tracker_pk=42).tracker_info.tracker_pk, 42
+        )
+
+    def test_should_fall_back_to_base_killmail_for_tracker(self):
+        # given
+        killmail_1 = KillmailFactory()
+        killmail_1.save()
+        # when
+        killmail_2 = Killmail.get(id=killmail_1.id, tracker_pk=42)
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+
     def test_should_raise_error_when_killmail_does_not_exist(self):
         # when/then
         with self.assertRaises(KillmailDoesNotExist):
@@ -343,3 +446,124 @@ class TestKillmailStorage(TestCase):
         killmail_2 = Killmail.get(id=killmail_1.id)
         self.assertEqual(killmail_1.id, killmail_2.id)
         self.assertEqual(killmail_2.zkb.points, 2)
+
+    def test_should_return_killmail_from_local_cache(self):
+        # given
+        killmail_1 = KillmailFactory()
+        killmail_1.save()
+        Killmail.get(id=killmail_1.id)
+        # when
+        with patch(MODULE_PATH + ".cache.get") as mock_cache_get:
+            killmail_2 = Killmail.get(id=killmail_1.id)
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+        self.assertFalse(mock_cache_get.called)
+        stats = Killmail.local_cache_stats()
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 1)
+
+    def test_should_not_return_outdated_killmail_from_local_cache(self):
+        # given
+        killmail_1 = KillmailFactory(zkb__points=1)
+        killmail_1.save()
+        Killmail.get(id=killmail_1.id)
+        killmail_1.zkb.points = 2
+        # when
+        killmail_1.save()
+        # then
+        self.assertEqual(Killmail.get(id=killmail_1.id).zkb.points, 2)
+
+    def test_should_not_return_deleted_killmail_from_local_cache(self):
+        # given
+        killmail = KillmailFactory()
+        killmail.save()
+        Killmail.get(id=killmail.id)
+        # when
+        killmail.delete()
+        # then
+        with self.assertRaises(KillmailDoesNotExist):
+            Killmail.get(id=killmail.id)
+
+    def test_should_read_killmail_stored_as_json(self):
+        # given
+        killmail_1 = KillmailFactory()
+        cache.set(key=Killmail._storage_key(killmail_1.id), value=killmail_1.asjson())
+        # when
+        killmail_2 = Killmail.get(id=killmail_1.id)
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+
+    def test_should_store_as_json_when_killmail_can_not_be_packed(self):
+        # given
+        killmail_1 = KillmailFactory(attackers=[KillmailAttackerFactory()])
+        killmail_1.attackers[0].character_id = 2**40
+        # when
+        killmail_1.save()
+        # then
+        self.assertIsInstance(cache.get(Killmail._storage_key(killmail_1.id)), str)
+        killmail_2 = Killmail.get(id=killmail_1.id)
+        self.assertEqual(killmail_1, killmail_2)
+
+
+class TestKillmailBinaryFormat(TestCase):
+    def test_should_convert_killmail(self):
+        # given
+        killmail_1 = load_killmail(10000001)
+        killmail_1.timestamps = {"received": 1.5}
+        # when
+        killmail_2 = Killmail.from_bytes(killmail_1.asbytes())
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+
+    def test_should_convert_killmail_with_tracker_info(self):
+        # given
+        killmail_1 = KillmailFactory(
+            tracker_info=TrackerInfo(
+                tracker_pk=42,
+                jumps=3,
+                distance=1.5,
+                main_org=EntityCount(id=2001, category="corporation", count=5),
+                main_ship_group=EntityCount(id=419, category="inventory_group"),
+                matching_ship_type_ids=[3756],
+            )
+        )
+        # when
+        killmail_2 = Killmail.from_bytes(killmail_1.asbytes())
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+
+    def test_should_keep_empty_attacker_fields(self):
+        # given
+        killmail_1 = KillmailFactory(
+            attackers=[
+                KillmailAttackerFactory(
+                    character_id=None,
+                    alliance_id=None,
+                    is_final_blow=None,
+                    security_status=None,
+                ),
+                KillmailAttackerFactory(is_final_blow=False, damage_done=0),
+            ]
+        )
+        # when
+        killmail_2 = Killmail.from_bytes(killmail_1.asbytes())
+        # then
+        self.assertEqual(killmail_1, killmail_2)
+
+    def test_should_be_smaller_than_json(self):
+        # given
+        killmail = KillmailFactory(
+            attackers=[KillmailAttackerFactory() for _ in range(100)]
+        )
+        # when
+        data = killmail.asbytes()
+        # then
+        self.assertLess(len(data), len(killmail.asjson().encode()) / 3)
+
+    def test_should_raise_error_for_unknown_version(self):
+        # given
+        data = bytearray(KillmailFactory().asbytes())
+        data[3] = 99
+        # when/then
+        with self.assertRaises(ValueError):
+            Killmail.from_bytes(bytes(data))
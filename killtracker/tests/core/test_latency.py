@@ -0,0 +1,140 @@
+import json
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from killtracker.core.latency import (
+    SCOPE_TRACKER,
+    SCOPE_WEBHOOK,
+    STAGE_ENQUEUED,
+    STAGE_MATCHED,
+    STAGE_RECEIVED,
+    STAGE_SENT,
+    STAGE_TOTAL,
+    LatencyHistogram,
+    latency_stats,
+    percentile,
+    record_message_sent,
+    reset_latency_stats,
+    stage_latencies,
+)
+
+MODULE_PATH = "killtracker.core.latency"
+
+
+class TestPercentile(TestCase):
+    def test_should_return_upper_bound_of_bucket(self):
+        # given
+        counts = [0, 0, 0, 50, 40, 10] + [0] * 9
+        # when/then
+        self.assertEqual(percentile(counts, 0.5), 1)
+        self.assertEqual(percentile(counts, 0.95), 5)
+        self.assertEqual(percentile(counts, 0.99), 5)
+
+    def test_should_return_infinity_for_overflow_bucket(self):
+        # given
+        counts = [1] + [0] * 13 + [1]
+        # when/then
+        self.assertEqual(percentile(counts, 0.99), float("inf"))
+
+    def test_should_return_none_when_empty(self):
+        self.assertIsNone(percentile([0] * 15, 0.5))
+
+
+class TestStageLatencies(TestCase):
+    def test_should_return_latency_since_previous_recorded_stage(self):
+        # given
+        timestamps = {STAGE_RECEIVED: 100.0, STAGE_MATCHED: 101.5, STAGE_SENT: 104.0}
+        # when
+        result = stage_latencies(timestamps)
+        # then
+        self.assertDictEqual(
+            result, {STAGE_MATCHED: 1.5, STAGE_SENT: 2.5, STAGE_TOTAL: 4.0}
+        )
+
+    def test_should_return_nothing_for_single_stage(self):
+        self.assertDictEqual(stage_latencies({STAGE_RECEIVED: 100.0}), {})
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_LATENCY_STATS_ENABLED", True)
+class TestRecordMessageSent(TestCase):
+    def setUp(self) -> None:
+        reset_latency_stats()
+
+    @patch(MODULE_PATH + ".now", lambda: 103.0)
+    def test_should_record_latencies_for_tracker_and_webhook(self):
+        # given
+        message = json.dumps(
+            {
+                "content": "dummy",
+                "_meta": {
+                    "tracker_pk": 7,
+                    "timestamps": {STAGE_RECEIVED: 100.0, STAGE_ENQUEUED: 100.2},
+                },
+            }
+        )
+        # when
+        record_message_sent(message, webhook_pk=3)
+        # then
+        stats = {(obj.scope, obj.obj_pk, obj.stage): obj for obj in latency_stats()}
+        self.assertSetEqual(
+            set(stats.keys()),
+            {
+                (SCOPE_TRACKER, 7, STAGE_ENQUEUED),
+                (SCOPE_TRACKER, 7, STAGE_SENT),
+                (SCOPE_TRACKER, 7, STAGE_TOTAL),
+                (SCOPE_WEBHOOK, 3, STAGE_ENQUEUED),
+                (SCOPE_WEBHOOK, 3, STAGE_SENT),
+                (SCOPE_WEBHOOK, 3, STAGE_TOTAL),
+            },
+        )
+        obj = stats[(SCOPE_WEBHOOK, 3, STAGE_TOTAL)]
+        self.assertEqual(obj.count, 1)
+        self.assertAlmostEqual(obj.mean, 3.0)
+        self.assertEqual(obj.p50, 5)
+
+    def test_should_ignore_messages_without_timestamps(self):
+        # when
+        record_message_sent(json.dumps({"content": "dummy"}), webhook_pk=3)
+        # then
+        self.assertListEqual(latency_stats(), [])
+
+    def test_should_do_nothing_when_disabled(self):
+        # given
+        message = json.dumps(
+            {"content": "dummy", "_meta": {"timestamps": {STAGE_RECEIVED: 100.0}}}
+        )
+        # when
+        with patch(MODULE_PATH + ".KILLTRACKER_LATENCY_STATS_ENABLED", False):
+            record_message_sent(message, webhook_pk=3)
+        # then
+        self.assertListEqual(latency_stats(), [])
+
+
+class TestLatencyHistogram(TestCase):
+    def setUp(self) -> None:
+        reset_latency_stats()
+
+    def test_should_count_latencies_per_bucket(self):
+        # given
+        histogram = LatencyHistogram(SCOPE_WEBHOOK, 1, STAGE_SENT)
+        # when
+        histogram.add(0.05)
+        histogram.add(0.3)
+        histogram.add(0.4)
+        histogram.add(5000)
+        # then
+        counts = histogram.counts()
+        self.assertEqual(counts[0], 1)
+        self.assertEqual(counts[2], 2)
+        self.assertEqual(counts[-1], 1)
+
+    def test_should_reset_all_histograms(self):
+        # given
+        LatencyHistogram(SCOPE_WEBHOOK, 1, STAGE_SENT).add(1)
+        LatencyHistogram(SCOPE_TRACKER, 2, STAGE_SENT).add(1)
+        # when
+        result = reset_latency_stats()
+        # then
+        self.assertEqual(result, 2)
+        self.assertListEqual(latency_stats(), [])
@@ -0,0 +1,84 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from killtracker.core.local_cache import LocalCache
+
+MODULE_PATH = "killtracker.core.local_cache"
+
+
+class TestLocalCache(TestCase):
+    def test_should_return_cached_object(self):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        obj = object()
+        cache.set("a", obj)
+        # when
+        result = cache.get("a")
+        # then
+        self.assertIs(result, obj)
+
+    def test_should_return_none_for_unknown_key(self):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        # when/then
+        self.assertIsNone(cache.get("a"))
+
+    def test_should_remove_least_recently_used_when_full(self):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        # when
+        cache.set("c", 3)
+        # then
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    @patch(MODULE_PATH + ".time.monotonic")
+    def test_should_not_return_expired_object(self, mock_monotonic):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        mock_monotonic.return_value = 1000
+        cache.set("a", 1)
+        # when
+        mock_monotonic.return_value = 1061
+        result = cache.get("a")
+        # then
+        self.assertIsNone(result)
+        self.assertEqual(len(cache), 0)
+
+    def test_should_count_hits_and_misses(self):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        cache.set("a", 1)
+        # when
+        cache.get("a")
+        cache.get("a")
+        cache.get("b")
+        # then
+        stats = cache.stats()
+        self.assertEqual(stats.hits, 2)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.size, 1)
+        self.assertAlmostEqual(stats.hit_ratio, 2 / 3)
+
+    def test_should_do_nothing_when_disabled(self):
+        # given
+        cache = LocalCache("test", maxsize=0, timeout=60)
+        # when
+        cache.set("a", 1)
+        # then
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_should_delete_object(self):
+        # given
+        cache = LocalCache("test", maxsize=2, timeout=60)
+        cache.set("a", 1)
+        # when
+        cache.delete("a")
+        # then
+        self.assertIsNone(cache.get("a"))
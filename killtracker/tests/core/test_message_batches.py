@@ -0,0 +1,90 @@
+import json
+
+from django.test import TestCase
+
+from killtracker.core.message_batches import MessageBatch, embed_chars
+
+
+def create_message(content="Alert", description="Killmail", **kwargs) -> str:
+    message = {"content": content, **kwargs}
+    if description:
+        message["embeds"] = [{"description": description}]
+    return json.dumps(message)
+
+
+class TestMessageBatch(TestCase):
+    def test_should_combine_embeds_of_messages_with_same_content(self):
+        # given
+        batch = MessageBatch()
+        # when
+        batch.add(create_message(description="first", _meta={"tracker_pk": 1}))
+        batch.add(create_message(description="second"))
+        # then
+        message = json.loads(batch.asjson())
+        self.assertEqual(message["content"], "Alert")
+        self.assertListEqual(
+            message["embeds"], [{"description": "first"}, {"description": "second"}]
+        )
+        self.assertNotIn("_meta", message)
+        self.assertEqual(len(batch), 2)
+
+    def test_should_not_combine_messages_with_different_content(self):
+        # given
+        batch = MessageBatch()
+        batch.add(create_message(content="Alert 1"))
+        # when
+        result = batch.add(create_message(content="Alert 2"))
+        # then
+        self.assertFalse(result)
+        self.assertEqual(len(batch), 1)
+
+    def test_should_not_combine_messages_without_embeds(self):
+        # given
+        batch = MessageBatch()
+        batch.add(create_message(description=None))
+        # when
+        result = batch.add(create_message(description=None))
+        # then
+        self.assertFalse(result)
+
+    def test_should_not_exceed_max_embeds(self):
+        # given
+        batch = MessageBatch(max_embeds=2)
+        batch.add(create_message())
+        batch.add(create_message())
+        # when
+        result = batch.add(create_message())
+        # then
+        self.assertFalse(result)
+        self.assertEqual(len(batch), 2)
+
+    def test_should_not_exceed_max_characters_of_embeds(self):
+        # given
+        batch = MessageBatch()
+        batch.add(create_message(description="x" * 4_000))
+        # when
+        result = batch.add(create_message(description="x" * 2_001))
+        # then
+        self.assertFalse(result)
+
+    def test_should_return_single_message_unchanged(self):
+        # given
+        batch = MessageBatch()
+        message = create_message(_meta={"tracker_pk": 1})
+        batch.add(message)
+        # when/then
+        self.assertEqual(batch.asjson(), message)
+
+
+class TestEmbedChars(TestCase):
+    def test_should_count_all_text_fields(self):
+        # given
+        embed = {
+            "title": "12345",
+            "description": "123",
+            "footer": {"text": "12"},
+            "author": {"name": "1"},
+            "fields": [{"name": "12", "value": "123"}],
+        }
+        # when/then
+        self.assertEqual(embed_chars(embed), 16)
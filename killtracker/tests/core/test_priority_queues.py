@@ -0,0 +1,190 @@
+import json
+
+from simple_mq import SimpleMQ
+
+from django.test import TestCase
+
+from app_utils.allianceauth import get_redis_client
+
+from killtracker.core.priority_queues import PriorityMQ
+
+HIGH, NORMAL, LOW = 3, 2, 1
+
+
+class TestPriorityMQ(TestCase):
+    def setUp(self) -> None:
+        self.queue = PriorityMQ(
+            get_redis_client(),
+            "test_priority_mq",
+            priorities=[LOW, NORMAL, HIGH],
+            default_priority=NORMAL,
+        )
+        self.queue.clear()
+        self.source = SimpleMQ(get_redis_client(), "test_priority_mq_source")
+        self.source.clear()
+        self.dead_letters = SimpleMQ(get_redis_client(), "test_priority_mq_dead")
+        self.dead_letters.clear()
+
+    def test_should_dequeue_from_highest_lane_first(self):
+        # given
+        self.queue.enqueue("normal 1")
+        self.queue.enqueue("low", priority=LOW)
+        self.queue.enqueue("high", priority=HIGH)
+        self.queue.enqueue("normal 2", priority=NORMAL)
+        # when
+        result = [self.queue.dequeue() for _ in range(5)]
+        # then
+        self.assertListEqual(result, ["high", "normal 1", "normal 2", "low", None])
+
+    def test_should_dequeue_from_given_lane_only(self):
+        # given
+        self.queue.enqueue("normal")
+        self.queue.enqueue("high", priority=HIGH)
+        # when/then
+        self.assertEqual(self.queue.dequeue(NORMAL), "normal")
+        self.assertIsNone(self.queue.dequeue(NORMAL))
+
+    def test_should_peek_next_message_with_priority(self):
+        # given
+        self.queue.enqueue("low", priority=LOW)
+        # when
+        result = self.queue.peek()
+        # then
+        self.assertEqual(result, ("low", LOW))
+        self.assertEqual(self.queue.size(), 1)
+
+    def test_should_peek_nothing_when_empty(self):
+        # when/then
+        self.assertEqual(self.queue.peek(), (None, NORMAL))
+
+    def test_should_report_sizes(self):
+        # given
+        self.queue.enqueue_bulk(["a", "b"], priority=HIGH)
+        self.queue.enqueue("c")
+        # when/then
+        self.assertEqual(self.queue.size(), 3)
+        self.assertDictEqual(self.queue.sizes(), {HIGH: 2, NORMAL: 1, LOW: 0})
+
+    def test_should_use_default_lane_for_unknown_priority(self):
+        # when
+        self.queue.enqueue("a", priority=99)
+        # then
+        self.assertDictEqual(self.queue.sizes(), {HIGH: 0, NORMAL: 1, LOW: 0})
+
+    def test_should_use_name_of_queue_for_default_lane(self):
+        # then
+        self.assertEqual(self.queue.lane().name, "test_priority_mq")
+        self.assertEqual(self.queue.lane(HIGH).name, "test_priority_mq_p3")
+
+    def test_should_clear_all_lanes(self):
+        # given
+        self.queue.enqueue("a", priority=HIGH)
+        self.queue.enqueue("b", priority=LOW)
+        # when
+        result = self.queue.clear()
+        # then
+        self.assertEqual(result, 2)
+        self.assertEqual(self.queue.size(), 0)
+
+    def test_should_dequeue_next_message_with_priority(self):
+        # given
+        self.queue.enqueue("low", priority=LOW)
+        # when/then
+        self.assertEqual(self.queue.dequeue_with_priority(), ("low", LOW))
+        self.assertEqual(self.queue.dequeue_with_priority(), (None, NORMAL))
+
+    def test_should_push_message_back_to_front_of_lane(self):
+        # given
+        self.queue.enqueue_bulk(["a", "b"], priority=LOW)
+        message = self.queue.dequeue()
+        # when
+        self.queue.push_front(message, priority=LOW)
+        # then
+        self.assertListEqual([self.queue.dequeue() for _ in range(2)], ["a", "b"])
+
+    def test_should_move_messages_into_lanes_of_their_priority(self):
+        # given
+        self.source.enqueue(json.dumps({"content": "a", "_meta": {"priority": HIGH}}))
+        self.source.enqueue(json.dumps({"content": "b"}))
+        self.source.enqueue("invalid")
+        # when
+        result = self.queue.enqueue_from(
+            self.source, dead_letter_queue=self.dead_letters, max_attempts=3
+        )
+        # then
+        self.assertEqual(result, (3, 0))
+        self.assertEqual(self.source.size(), 0)
+        self.assertDictEqual(self.queue.sizes(), {HIGH: 1, NORMAL: 2, LOW: 0})
+        self.assertEqual(json.loads(self.queue.dequeue())["content"], "a")
+
+    def test_should_move_messages_into_dead_letter_queue_after_max_attempts(self):
+        # given
+        message = json.dumps({"content": "bad"})
+        # when
+        results = []
+        for _ in range(3):
+            self.source.enqueue(message)
+            results.append(
+                self.queue.enqueue_from(
+                    self.source, dead_letter_queue=self.dead_letters, max_attempts=3
+                )
+            )
+            self.queue.dequeue()
+        # then
+        self.assertListEqual(results, [(1, 0), (1, 0), (0, 1)])
+        self.assertEqual(self.dead_letters.dequeue(), message)
+
+    def test_should_move_messages_in_batches(self):
+        # given
+        self.source.enqueue_bulk(
+            [json.dumps({"content": str(num)}) for num in range(5)]
+        )
+        # when
+        result = self.queue.enqueue_from(
+            self.source,
+            dead_letter_queue=self.dead_letters,
+            max_attempts=3,
+            batch_size=2,
+        )
+        # then
+        self.assertEqual(result, (5, 0))
+        self.assertEqual(self.source.size(), 0)
+        self.assertEqual(json.loads(self.queue.dequeue())["content"], "0")
+
+    def test_should_not_renew_timeout_of_attempts(self):
+        # given
+        self.source.enqueue(json.dumps({"content": "a"}))
+        self.queue.enqueue_from(
+            self.source,
+            dead_letter_queue=self.dead_letters,
+            max_attempts=3,
+            attempts_timeout=10,
+        )
+        # when
+        self.source.enqueue(json.dumps({"content": "b"}))
+        self.queue.enqueue_from(
+            self.source,
+            dead_letter_queue=self.dead_letters,
+            max_attempts=3,
+            attempts_timeout=1000,
+        )
+        # then
+        self.assertLessEqual(self.queue.conn.ttl(self.queue._attempts_key), 10)
+
+    def test_should_clear_attempts_of_sent_messages(self):
+        # given
+        message = json.dumps({"content": "a"})
+        for _ in range(2):
+            self.source.enqueue(message)
+            self.queue.enqueue_from(
+                self.source, dead_letter_queue=self.dead_letters, max_attempts=3
+            )
+            self.queue.dequeue()
+        # when
+        self.queue.clear_attempts([message])
+        self.source.enqueue(message)
+        result = self.queue.enqueue_from(
+            self.source, dead_letter_queue=self.dead_letters, max_attempts=3
+        )
+        # then
+        self.assertEqual(result, (1, 0))
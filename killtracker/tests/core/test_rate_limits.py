@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from killtracker.core.rate_limits import WebhookRateLimiter
+
+MODULE_PATH = "killtracker.core.rate_limits"
+
+
+class TestWebhookRateLimiter(TestCase):
+    def setUp(self) -> None:
+        self.limiter = WebhookRateLimiter(1)
+        self.limiter.clear()
+
+    def test_should_allow_sending_when_rate_limit_unknown(self):
+        # when
+        result = self.limiter.acquire()
+        # then
+        self.assertEqual(result, 0)
+        self.assertIsNone(self.limiter.delay())
+
+    def test_should_allow_sending_while_tokens_remain(self):
+        # given
+        self.limiter.update_from_headers(
+            {"X-RateLimit-Remaining": "2", "X-RateLimit-Reset-After": "30"}
+        )
+        # when
+        results = [self.limiter.acquire() for _ in range(2)]
+        # then
+        self.assertListEqual(results, [0, 0])
+        self.assertGreater(self.limiter.acquire(), 25)
+
+    def test_should_report_delay_until_reset_when_empty(self):
+        # given
+        self.limiter.update_from_headers(
+            {"x-ratelimit-remaining": "0", "x-ratelimit-reset-after": "1.5"}
+        )
+        # when
+        result = self.limiter.delay()
+        # then
+        self.assertGreater(result, 1)
+        self.assertLessEqual(result, 1.5)
+
+    def test_should_report_no_delay_while_tokens_remain(self):
+        # given
+        self.limiter.update_from_headers(
+            {"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "2"}
+        )
+        # when/then
+        self.assertEqual(self.limiter.delay(), 0)
+
+    @patch(MODULE_PATH + ".time.time")
+    def test_should_allow_sending_after_reset(self, mock_time):
+        # given
+        mock_time.return_value = 1000.0
+        self.limiter.block(10)
+        # when
+        mock_time.return_value = 1011.0
+        result = self.limiter.acquire()
+        # then
+        self.assertEqual(result, 0)
+        self.assertEqual(self.limiter.delay(), 0)
+
+    def test_should_ignore_responses_without_headers(self):
+        # when
+        result = self.limiter.update_from_headers({"Content-Type": "text/html"})
+        # then
+        self.assertFalse(result)
+        self.assertIsNone(self.limiter.delay())
+
+    def test_should_share_state_between_instances(self):
+        # given
+        WebhookRateLimiter(1).block(30)
+        # when/then
+        self.assertGreater(WebhookRateLimiter(1).acquire(), 25)
+        self.assertEqual(WebhookRateLimiter(2).acquire(), 0)
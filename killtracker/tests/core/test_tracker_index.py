@@ -0,0 +1,103 @@
+from app_utils.testing import NoSocketsTestCase
+
+from killtracker.core.tracker_index import TrackerIndex, _Key
+from killtracker.core.trackers import KillmailContext, TrackerRules
+
+from ..testdata.factories import (
+    KillmailAttackerFactory,
+    KillmailFactory,
+    KillmailVictimFactory,
+)
+from ..testdata.helpers import LoadTestDataMixin
+
+
+class TestTrackerIndex(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        self.rules = [
+            TrackerRules(tracker_pk=1),
+            TrackerRules(tracker_pk=2, require_solar_system_ids=frozenset([30004984])),
+            TrackerRules(tracker_pk=3, require_solar_system_ids=frozenset([30003067])),
+            TrackerRules(tracker_pk=4, require_region_ids=frozenset([10000064])),
+            TrackerRules(tracker_pk=5, require_constellation_ids=frozenset([20000448])),
+            TrackerRules(tracker_pk=6, require_victim_ship_type_ids=frozenset([603])),
+            TrackerRules(tracker_pk=7, require_victim_alliance_ids=frozenset([3099])),
+            TrackerRules(
+                tracker_pk=8, require_attacker_corporation_ids=frozenset([2001])
+            ),
+            TrackerRules(
+                tracker_pk=9,
+                require_attacker_alliance_ids=frozenset([3099]),
+                require_attacker_corporation_ids=frozenset([2001]),
+            ),
+            TrackerRules(
+                tracker_pk=10,
+                require_attacker_alliance_ids=frozenset([3099]),
+                require_attacker_corporation_ids=frozenset([2001]),
+                require_attacker_organizations_final_blow=True,
+            ),
+            TrackerRules(tracker_pk=11, require_victim_ship_group_ids=frozenset([25])),
+            TrackerRules(
+                tracker_pk=12, require_attackers_ship_group_ids=frozenset([419])
+            ),
+            TrackerRules(tracker_pk=13, exclude_low_sec=True),
+            TrackerRules(tracker_pk=14, exclude_high_sec=True, exclude_null_sec=True),
+            TrackerRules(tracker_pk=15, require_min_value=100),
+        ]
+        self.killmail = KillmailFactory(
+            solar_system_id=30004984,
+            victim=KillmailVictimFactory(
+                ship_type_id=603, alliance_id=3011, corporation_id=2011
+            ),
+            attackers=[
+                KillmailAttackerFactory(
+                    ship_type_id=3756,
+                    alliance_id=3001,
+                    corporation_id=2001,
+                    is_final_blow=True,
+                )
+            ],
+        )
+
+    def test_should_return_candidates(self):
+        # given
+        index = TrackerIndex(self.rules)
+        context = KillmailContext(self.killmail)
+        # when
+        result = index.candidates(context)
+        # then
+        self.assertSetEqual(result, {1, 2, 4, 6, 8, 10, 11, 12, 14, 15})
+
+    def test_should_not_exclude_any_tracker_which_matches(self):
+        # given
+        index = TrackerIndex(self.rules)
+        context = KillmailContext(self.killmail)
+        # when
+        result = index.candidates(context)
+        # then
+        for rules in self.rules:
+            with self.subTest(tracker_pk=rules.tracker_pk):
+                if rules.match(context):
+                    self.assertIn(rules.tracker_pk, result)
+
+    def test_should_return_non_location_trackers_for_killmail_without_location(
+        self,
+    ):
+        # given
+        index = TrackerIndex(self.rules)
+        self.killmail.solar_system_id = None
+        context = KillmailContext(self.killmail)
+        # when
+        result = index.candidates(context)
+        # then
+        self.assertSetEqual(result, {1, 6, 8, 10, 11, 12, 13, 14, 15})
+
+    def test_should_return_cached_index_for_same_rules(self):
+        # when
+        index_1 = TrackerIndex.for_rules(tuple(self.rules))
+        index_2 = TrackerIndex.for_rules(tuple(self.rules))
+        # then
+        self.assertIs(index_1, index_2)
+        self.assertEqual(len(index_1), 15)
+
+    def test_should_have_killmail_values_for_all_dimensions(self):
+        self.assertSetEqual(set(TrackerIndex._KILLMAIL_VALUES.keys()), set(_Key))
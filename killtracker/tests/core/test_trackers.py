@@ -0,0 +1,259 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from eveuniverse.models import EveGroup, EveRegion
+
+from allianceauth.eveonline.models import EveAllianceInfo, EveCorporationInfo
+from app_utils.testing import NoSocketsTestCase
+
+from killtracker.core.trackers import (
+    KillmailContext,
+    OriginDistanceFilter,
+    TrackerRules,
+)
+
+from ..testdata.factories import (
+    KillmailAttackerFactory,
+    KillmailFactory,
+    KillmailVictimFactory,
+    TrackerFactory,
+)
+from ..testdata.helpers import LoadTestDataMixin
+
+
+class TestTrackerRulesCompile(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_compile_clauses(self):
+        # given
+        tracker = TrackerFactory(
+            webhook=self.webhook_1,
+            origin_solar_system_id=30003067,
+            exclude_high_sec=True,
+            require_min_attackers=3,
+        )
+        tracker.require_attacker_alliances.add(self.alliance_3011)
+        tracker.exclude_victim_corporations.add(self.corporation_2001)
+        tracker.require_regions.add(EveRegion.objects.get(id=10000014))
+        tracker.require_attackers_ship_groups.add(EveGroup.objects.get(id=25))
+        tracker.require_attacker_states.add(self.state_member)
+        # when
+        rules = TrackerRules.from_tracker(tracker)
+        # then
+        self.assertEqual(rules.tracker_pk, tracker.pk)
+        self.assertEqual(rules.origin_solar_system_id, 30003067)
+        self.assertIsNotNone(rules.origin_position)
+        self.assertTrue(rules.exclude_high_sec)
+        self.assertEqual(rules.require_min_attackers, 3)
+        self.assertSetEqual(rules.require_attacker_alliance_ids, {3011})
+        self.assertSetEqual(rules.exclude_victim_corporation_ids, {2001})
+        self.assertSetEqual(rules.require_region_ids, {10000014})
+        self.assertSetEqual(rules.require_attackers_ship_group_ids, {25})
+        self.assertSetEqual(rules.require_attacker_state_ids, {self.state_member.pk})
+        self.assertTrue(rules.has_localization_clause)
+        self.assertTrue(rules.has_type_clause)
+
+    def test_should_return_cached_rules(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        TrackerRules.get_or_compile(tracker)
+        # when
+        with self.assertNumQueries(0):
+            rules = TrackerRules.get_or_compile(tracker)
+        # then
+        self.assertEqual(rules.tracker_pk, tracker.pk)
+
+    def test_should_invalidate_rules_when_tracker_is_saved(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        TrackerRules.get_or_compile(tracker)
+        # when
+        tracker.require_min_attackers = 5
+        tracker.save()
+        # then
+        rules = TrackerRules.get_or_compile(tracker)
+        self.assertEqual(rules.require_min_attackers, 5)
+
+    def test_should_invalidate_rules_when_clause_is_added(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        TrackerRules.get_or_compile(tracker)
+        # when
+        tracker.exclude_attacker_corporations.add(self.corporation_2011)
+        # then
+        rules = TrackerRules.get_or_compile(tracker)
+        self.assertSetEqual(rules.exclude_attacker_corporation_ids, {2011})
+
+    def test_should_rebuild_rules_after_commit(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        # when
+        with self.captureOnCommitCallbacks(execute=True):
+            tracker.require_attacker_alliances.add(self.alliance_3011)
+            tracker.require_min_attackers = 5
+            tracker.save()
+        # then
+        with self.assertNumQueries(0):
+            rules = TrackerRules.get_or_compile(tracker)
+        self.assertSetEqual(rules.require_attacker_alliance_ids, {3011})
+        self.assertEqual(rules.require_min_attackers, 5)
+
+    def test_should_invalidate_rules_when_clause_is_cleared(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        tracker.exclude_attacker_corporations.add(self.corporation_2011)
+        TrackerRules.get_or_compile(tracker)
+        # when
+        tracker.exclude_attacker_corporations.clear()
+        # then
+        rules = TrackerRules.get_or_compile(tracker)
+        self.assertSetEqual(rules.exclude_attacker_corporation_ids, set())
+
+
+class TestTrackerRulesMatch(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_should_match_organization_clauses_without_queries(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        tracker.require_attacker_alliances.add(self.alliance_3011)
+        tracker.exclude_victim_alliances.add(self.alliance_3001)
+        rules = TrackerRules.get_or_compile(tracker)
+        attacker = KillmailAttackerFactory(alliance_id=3011)
+        victim = KillmailVictimFactory(alliance_id=3002)
+        killmail = KillmailFactory(attackers=[attacker], victim=victim)
+        context = KillmailContext(killmail)
+        # when
+        with self.assertNumQueries(0):
+            result = rules.match(context)
+        # then
+        self.assertEqual(result.tracker_pk, tracker.pk)
+
+    def test_should_exclude_when_any_excluded_alliance_is_attacker(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        tracker.exclude_attacker_alliances.add(
+            self.alliance_3001, EveAllianceInfo.objects.get(alliance_id=3011)
+        )
+        rules = TrackerRules.get_or_compile(tracker)
+        attacker = KillmailAttackerFactory(alliance_id=3011)
+        killmail = KillmailFactory(attackers=[attacker])
+        # when
+        result = rules.match(KillmailContext(killmail))
+        # then
+        self.assertIsNone(result)
+
+    def test_should_exclude_when_victim_in_any_excluded_corporation(self):
+        # given
+        tracker = TrackerFactory(webhook=self.webhook_1)
+        tracker.exclude_victim_corporations.add(
+            self.corporation_2001, EveCorporationInfo.objects.get(corporation_id=2011)
+        )
+        rules = TrackerRules.get_or_compile(tracker)
+        victim = KillmailVictimFactory(corporation_id=2011)
+        killmail = KillmailFactory(victim=victim)
+        # when
+        result = rules.match(KillmailContext(killmail))
+        # then
+        self.assertIsNone(result)
+
+    def test_should_share_context_between_trackers(self):
+        # given
+        tracker_1 = TrackerFactory(webhook=self.webhook_1, exclude_high_sec=True)
+        tracker_2 = TrackerFactory(webhook=self.webhook_1, exclude_low_sec=True)
+        rules_1 = TrackerRules.get_or_compile(tracker_1)
+        rules_2 = TrackerRules.get_or_compile(tracker_2)
+        killmail = KillmailFactory(solar_system_id=30004984)
+        context = KillmailContext(killmail)
+        rules_1.match(context)
+        # when
+        with self.assertNumQueries(0):
+            rules_2.match(context)
+
+
+class TestOriginDistanceFilter(LoadTestDataMixin, NoSocketsTestCase):
+    def setUp(self) -> None:
+        origin = TrackerRules.from_tracker(
+            TrackerFactory.build(
+                webhook=self.webhook_1, origin_solar_system_id=30003067
+            )
+        ).origin_position
+        self.rules = [
+            TrackerRules(
+                tracker_pk=1,
+                origin_solar_system_id=30003067,
+                origin_position=origin,
+                require_max_distance=50,
+            ),
+            TrackerRules(
+                tracker_pk=2,
+                origin_solar_system_id=30003067,
+                origin_position=origin,
+                require_max_distance=0.1,
+            ),
+            TrackerRules(tracker_pk=3, require_max_distance=10),
+            TrackerRules(
+                tracker_pk=4, origin_solar_system_id=30003067, origin_position=origin
+            ),
+        ]
+
+    def test_should_return_trackers_out_of_range(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=30004984))
+        distance_filter = OriginDistanceFilter(self.rules)
+        # when
+        result = distance_filter.trackers_out_of_range(context)
+        # then
+        self.assertSetEqual(result, {2, 3})
+
+    @patch("killtracker.core.trackers.np", None)
+    def test_should_return_trackers_out_of_range_without_numpy(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=30004984))
+        distance_filter = OriginDistanceFilter(self.rules)
+        # when
+        result = distance_filter.trackers_out_of_range(context)
+        # then
+        self.assertSetEqual(result, {2, 3})
+
+    def test_should_return_all_trackers_with_distance_clause_for_w_space(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=31000005))
+        distance_filter = OriginDistanceFilter(self.rules)
+        # when
+        result = distance_filter.trackers_out_of_range(context)
+        # then
+        self.assertSetEqual(result, {1, 2, 3})
+
+    def test_should_return_cached_filter_for_same_rules(self):
+        # when
+        filter_1 = OriginDistanceFilter.for_rules(tuple(self.rules))
+        filter_2 = OriginDistanceFilter.for_rules(tuple(self.rules))
+        # then
+        self.assertIs(filter_1, filter_2)
+        self.assertEqual(len(filter_1), 3)
+
+    def test_should_return_new_filter_when_rules_change(self):
+        # given
+        filter_1 = OriginDistanceFilter.for_rules(tuple(self.rules))
+        # when
+        filter_2 = OriginDistanceFilter.for_rules(tuple(self.rules[:2]))
+        # then
+        self.assertIsNot(filter_1, filter_2)
+        self.assertEqual(len(filter_2), 2)
+
+    @patch("killtracker.core.trackers.KillmailContext.jumps_from", lambda *args: 1)
+    def test_should_agree_with_rules(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=30004984))
+        distance_filter = OriginDistanceFilter(self.rules)
+        # when
+        result = distance_filter.trackers_out_of_range(context)
+        # then
+        for rules in self.rules[:3]:
+            with self.subTest(tracker_pk=rules.tracker_pk):
+                self.assertEqual(
+                    rules.tracker_pk in result, rules.match(context) is None
+                )
@@ -0,0 +1,167 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from eveuniverse.models import EveSolarSystem, EveStargate
+
+from app_utils.testing import NoSocketsTestCase
+
+from killtracker.core.trackers import KillmailContext
+from killtracker.core.universe import NO_ROUTE, SolarSystemInfo, UniverseGraph
+
+from ..testdata.factories import KillmailFactory
+from ..testdata.load_eveuniverse import load_eveuniverse
+
+HUOLA = 30003067
+KOURMONEN = 30003068
+KAMELA = 30003069
+SOSALA = 30003070
+ABUNE = 30004984
+THERA = 31000005
+
+MODULE_PATH = "killtracker.core.trackers"
+
+
+def create_stargates(*connections):
+    """Create stargates in both directions for given pairs of solar systems."""
+    stargate_id = 50000001
+    for source_id, destination_id in connections:
+        for a, b in [(source_id, destination_id), (destination_id, source_id)]:
+            EveStargate.objects.create(
+                id=stargate_id,
+                name=f"Stargate {stargate_id}",
+                eve_solar_system_id=a,
+                destination_eve_solar_system_id=b,
+                eve_type_id=603,  # any type will do
+            )
+            stargate_id += 1
+
+
+class TestUniverseGraph(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        create_stargates((HUOLA, KOURMONEN), (KOURMONEN, KAMELA), (KAMELA, SOSALA))
+        cls.graph = UniverseGraph.load()
+
+    def test_should_load_all_solar_systems(self):
+        self.assertEqual(len(self.graph), EveSolarSystem.objects.count())
+        self.assertIn(HUOLA, self.graph)
+        self.assertEqual(self.graph.num_stargates, 6)
+
+    def test_should_return_same_solar_system_info_as_database(self):
+        for solar_system in EveSolarSystem.objects.all():
+            with self.subTest(solar_system=solar_system):
+                self.assertEqual(
+                    self.graph.solar_system_info(solar_system.id),
+                    SolarSystemInfo.from_solar_system(solar_system),
+                )
+
+    def test_should_return_none_for_unknown_solar_system(self):
+        self.assertIsNone(self.graph.solar_system_info(30000001))
+
+    def test_should_calculate_jumps(self):
+        self.assertEqual(self.graph.jumps(HUOLA, HUOLA), 0)
+        self.assertEqual(self.graph.jumps(HUOLA, KOURMONEN), 1)
+        self.assertEqual(self.graph.jumps(HUOLA, SOSALA), 3)
+        self.assertEqual(self.graph.jumps(SOSALA, HUOLA), 3)
+
+    def test_should_report_no_route_when_map_is_complete(self):
+        self.assertEqual(self.graph.jumps(HUOLA, ABUNE), NO_ROUTE)
+
+    def test_should_return_none_when_stargates_are_unknown(self):
+        self.assertIsNone(self.graph.jumps(THERA, HUOLA))
+        self.assertIsNone(self.graph.jumps(30000001, HUOLA))
+
+    def test_should_calculate_jumps_without_queries(self):
+        with self.assertNumQueries(0):
+            self.graph.jumps(KAMELA, HUOLA)
+
+
+class TestUniverseGraphWithIncompleteMap(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        create_stargates((HUOLA, KOURMONEN), (KOURMONEN, KAMELA), (KAMELA, SOSALA))
+        # destination of this stargate has not been loaded
+        EveStargate.objects.create(
+            id=50000101,
+            name="Stargate 50000101",
+            eve_solar_system_id=KAMELA,
+            eve_type_id=603,
+        )
+        # stargates of Abune have not been loaded
+        EveStargate.objects.create(
+            id=50000102,
+            name="Stargate 50000102",
+            eve_solar_system_id=SOSALA,
+            destination_eve_solar_system_id=ABUNE,
+            eve_type_id=603,
+        )
+        cls.graph = UniverseGraph.load()
+
+    def test_should_calculate_jumps_up_to_first_incomplete_system(self):
+        self.assertEqual(self.graph.jumps(HUOLA, SOSALA), 3)
+        self.assertEqual(self.graph.jumps(SOSALA, ABUNE), 1)
+        self.assertEqual(self.graph.jumps(SOSALA, KOURMONEN), 2)
+
+    def test_should_return_none_when_a_shorter_route_could_exist(self):
+        self.assertIsNone(self.graph.jumps(HUOLA, ABUNE))
+        self.assertIsNone(self.graph.jumps(SOSALA, HUOLA))
+        self.assertIsNone(self.graph.jumps(ABUNE, SOSALA))
+
+
+class TestKillmailContextWithUniverseGraph(NoSocketsTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_eveuniverse()
+        create_stargates((HUOLA, KOURMONEN), (KOURMONEN, KAMELA))
+
+    def setUp(self) -> None:
+        UniverseGraph.reset()
+        self.addCleanup(UniverseGraph.reset)
+        UniverseGraph.instance()
+
+    def test_should_calculate_jumps_locally(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=KAMELA))
+        # when
+        with self.assertNumQueries(0):
+            jumps = context.jumps_from(HUOLA)
+        # then
+        self.assertEqual(jumps, 2)
+
+    def test_should_return_solar_system_without_queries(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=KAMELA))
+        # when
+        with self.assertNumQueries(0):
+            solar_system = context.solar_system
+        # then
+        self.assertEqual(solar_system.id, KAMELA)
+        self.assertTrue(solar_system.is_low_sec)
+
+    @patch(MODULE_PATH + ".EveSolarSystem.jumps_to", spec=True)
+    def test_should_cache_jumps_from_esi_when_there_is_no_route(self, mock_jumps_to):
+        # given
+        cache.clear()
+        mock_jumps_to.return_value = None
+        # when
+        results = [
+            KillmailContext(KillmailFactory(solar_system_id=HUOLA)).jumps_from(ABUNE)
+            for _ in range(2)
+        ]
+        # then
+        self.assertListEqual(results, [None, None])
+        self.assertEqual(mock_jumps_to.call_count, 1)
+
+    def test_should_not_ask_esi_when_there_is_no_route(self):
+        # given
+        context = KillmailContext(KillmailFactory(solar_system_id=THERA))
+        # when
+        with self.assertNumQueries(0):
+            jumps = context.jumps_from(HUOLA)
+        # then
+        self.assertIsNone(jumps)
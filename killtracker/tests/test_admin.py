@@ -1,4 +1,6 @@
+from django.contrib.admin.sites import AdminSite
 from django.contrib.auth.models import User
+from django.test import RequestFactory
 from django.urls import reverse
 from django_webtest import WebTest
 from eveuniverse.models import EveType
@@ -6,6 +8,13 @@ from eveuniverse.models import EveType
 from allianceauth.eveonline.models import EveCorporationInfo
 from app_utils.testing import create_fake_user
 
+from killtracker.admin import TrackerAdmin
+from killtracker.core.latency import (
+    SCOPE_WEBHOOK,
+    STAGE_TOTAL,
+    LatencyHistogram,
+    reset_latency_stats,
+)
 from killtracker.models import Tracker, Webhook
 
 from .testdata.factories import TrackerFactory
@@ -41,6 +50,47 @@ class TestTrackerChangeList(LoadTestDataMixin, WebTest):
         add_page = self.app.get(reverse("admin:killtracker_tracker_changelist"))
         self.assertEqual(add_page.status_code, 200)
 
+    def test_should_render_clauses_from_prefetched_objects(self):
+        # given
+        modeladmin = TrackerAdmin(model=Tracker, admin_site=AdminSite())
+        request = RequestFactory().get("/")
+        request.user = self.user
+        trackers = list(modeladmin.get_queryset(request))
+        # when
+        with self.assertNumQueries(0):
+            result = [modeladmin._clauses(obj) for obj in trackers]
+        # then
+        self.assertIn("Exclude attacker corporations = Wayne Technologies", result)
+
+
+class TestWebhookLatency(LoadTestDataMixin, WebTest):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            "Bruce_Wayne", "bruce@example.com", "password"
+        )
+
+    def test_should_show_latency_stats(self):
+        # given
+        reset_latency_stats()
+        LatencyHistogram(SCOPE_WEBHOOK, self.webhook_1.pk, STAGE_TOTAL).add(1.5)
+        self.app.set_user(self.user)
+        # when
+        page = self.app.get(reverse("admin:killtracker_webhook_latency"))
+        # then
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(self.webhook_1.name, page.text)
+        self.assertIn("1.50s", page.text)
+
+    def test_should_link_latency_stats_from_change_list(self):
+        # given
+        self.app.set_user(self.user)
+        # when
+        page = self.app.get(reverse("admin:killtracker_webhook_changelist"))
+        # then
+        self.assertIn(reverse("admin:killtracker_webhook_latency"), page.text)
+
 
 class TestTrackerValidations(LoadTestDataMixin, WebTest):
     @classmethod
@@ -8,7 +8,7 @@ from django.test import TestCase
 from django.test.utils import override_settings
 
 from killtracker import tasks
-from killtracker.core.killmails import ZKB_REDISQ_URL
+from killtracker.core.killmails import ZKB_REDISQ_URL, Killmail
 
 from .testdata.factories import TrackerFactory
 from .testdata.helpers import LoadTestDataMixin, killmails_data
@@ -26,6 +26,7 @@ class TestTasksEnd2End(LoadTestDataMixin, TestCase):
     def setUpClass(cls) -> None:
         super().setUpClass()
         cache.clear()
+        Killmail.clear_local_cache()
         cls.tracker_1 = TrackerFactory(
             name="My Tracker",
             exclude_null_sec=True,
@@ -33,6 +34,9 @@ class TestTasksEnd2End(LoadTestDataMixin, TestCase):
             webhook=cls.webhook_1,
         )
 
+    def tearDown(self) -> None:
+        cache.clear()  # do not leak character state index into other tests
+
     @patch(PACKAGE_PATH + ".tasks.retry_task_if_esi_is_down", lambda x: None)
     def test_normal_case(self, requests_mocker, mock_execute):
         # given
@@ -1,4 +1,5 @@
 import json
+import time
 from datetime import timedelta
 from unittest.mock import patch
 
@@ -8,6 +9,7 @@ from bs4 import BeautifulSoup
 from markdown import markdown
 
 from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 from django.utils.timezone import now
 from eveuniverse.models import (
@@ -23,7 +25,8 @@ from app_utils.testing import NoSocketsTestCase
 
 from killtracker.core.killmails import Killmail
 from killtracker.exceptions import WebhookTooManyRequests
-from killtracker.models import EveKillmail, Webhook
+from killtracker.managers import _raw_delete
+from killtracker.models import EveKillmail, EveKillmailAttacker, Webhook
 
 from .testdata.factories import TrackerFactory
 from .testdata.helpers import LoadTestDataMixin, load_eve_killmails, load_killmail
@@ -50,6 +53,102 @@ class TestWebhookQueue(LoadTestDataMixin, TestCase):
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
         self.assertEqual(self.webhook_1.main_queue.size(), 2)
 
+    @patch(MODELS_PATH + ".KILLTRACKER_DISCORD_MESSAGE_MAX_ATTEMPTS", 2)
+    def test_should_move_messages_failing_too_often_into_dead_letter_queue(self):
+        # given
+        self.webhook_1.dead_letter_queue.clear()
+        self.webhook_1.enqueue_message(content="Bad message")
+        message = self.webhook_1.main_queue.dequeue()
+        # when
+        self.webhook_1.error_queue.enqueue(message)
+        first_result = self.webhook_1.reset_failed_messages()
+        self.webhook_1.error_queue.enqueue(self.webhook_1.main_queue.dequeue())
+        second_result = self.webhook_1.reset_failed_messages()
+        # then
+        self.assertEqual(first_result, 1)
+        self.assertEqual(second_result, 0)
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+        self.assertEqual(self.webhook_1.dead_letter_queue.dequeue(), message)
+
+    def test_should_keep_priority_when_resetting_failed_messages(self):
+        # given
+        self.webhook_1.enqueue_message(
+            content="Urgent", priority=Webhook.MessagePriority.HIGH
+        )
+        self.webhook_1.error_queue.enqueue(self.webhook_1.main_queue.dequeue())
+        # when
+        self.webhook_1.reset_failed_messages()
+        # then
+        self.assertDictEqual(
+            self.webhook_1.main_queue.sizes(),
+            {
+                Webhook.MessagePriority.HIGH: 1,
+                Webhook.MessagePriority.NORMAL: 0,
+                Webhook.MessagePriority.LOW: 0,
+            },
+        )
+
+    def test_should_dequeue_batch_from_highest_priority_first(self):
+        # given
+        self.webhook_1.enqueue_message(content="Normal 1")
+        self.webhook_1.enqueue_message(
+            content="Low", priority=Webhook.MessagePriority.LOW
+        )
+        for _ in range(2):
+            self.webhook_1.enqueue_message(
+                embeds=[dhooks_lite.Embed(description="Capital")],
+                priority=Webhook.MessagePriority.HIGH,
+            )
+        # when
+        batch = self.webhook_1.dequeue_message_batch(10)
+        # then
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(batch.priority, Webhook.MessagePriority.HIGH)
+        contents = [
+            json.loads(self.webhook_1.dequeue_message_batch(10).asjson())["content"]
+            for _ in range(2)
+        ]
+        self.assertListEqual(contents, ["Normal 1", "Low"])
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+
+    def test_should_skip_expired_messages_and_send_summary_instead(self):
+        # given
+        for num in range(3):
+            self.webhook_1.main_queue.enqueue(
+                Webhook._discord_message_asjson(
+                    content=f"Old {num}", meta={"expires_at": 1.0}
+                )
+            )
+        self.webhook_1.enqueue_message(content="Fresh", max_age=3600)
+        # when
+        batch = self.webhook_1.dequeue_message_batch(10)
+        # then
+        message = json.loads(batch.asjson())
+        self.assertIn("3 older alerts skipped", message["content"])
+        next_message = json.loads(self.webhook_1.dequeue_message_batch(10).asjson())
+        self.assertEqual(next_message["content"], "Fresh")
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+
+    def test_should_not_add_expired_messages_to_batch(self):
+        # given
+        self.webhook_1.enqueue_message(content="Fresh")
+        self.webhook_1.main_queue.enqueue(
+            Webhook._discord_message_asjson(content="Fresh", meta={"expires_at": 1.0})
+        )
+        # when
+        batch = self.webhook_1.dequeue_message_batch(10)
+        # then
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
+    def test_should_stamp_enqueued_messages(self):
+        # when
+        self.webhook_1.enqueue_message(content="Test", max_age=60)
+        # then
+        meta = json.loads(self.webhook_1.main_queue.dequeue())["_meta"]
+        self.assertAlmostEqual(meta["enqueued_at"], time.time(), delta=5)
+        self.assertAlmostEqual(meta["expires_at"], meta["enqueued_at"] + 60)
+
     def test_discord_message_asjson_normal(self):
         embed = dhooks_lite.Embed(description="my_description")
         result = Webhook._discord_message_asjson(
@@ -159,6 +258,73 @@ class TestEveKillmailManager(LoadTestDataMixin, NoSocketsTestCase):
         self.assertFalse(created)
         self.assertEqual(eve_killmail.solar_system_id, 30004984)
 
+    def test_should_create_many_killmails_in_bulk(self):
+        # given
+        killmails = [load_killmail(10000001), load_killmail(10000002)]
+        # when
+        result = EveKillmail.objects.create_from_killmails(killmails)
+        # then
+        self.assertSetEqual({obj.id for obj in result}, {10000001, 10000002})
+        eve_killmail = EveKillmail.objects.get(id=10000002)
+        self.assertEqual(eve_killmail.attackers.count(), len(killmails[1].attackers))
+        self.assertEqual(eve_killmail.solar_system_id, killmails[1].solar_system_id)
+
+    def test_should_skip_existing_killmails_when_creating_in_bulk(self):
+        # given
+        load_eve_killmails([10000001])
+        killmails = [load_killmail(10000001), load_killmail(10000002)]
+        # when
+        result = EveKillmail.objects.create_from_killmails(killmails)
+        # then
+        self.assertListEqual([obj.id for obj in result], [10000002])
+        self.assertEqual(
+            EveKillmail.objects.get(id=10000001).attackers.count(),
+            len(killmails[0].attackers),
+        )
+
+    def test_should_create_missing_entities_when_creating_in_bulk(self):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.attackers[0].character_id = 1999
+        # when
+        EveKillmail.objects.create_from_killmails([killmail], resolve_ids=False)
+        # then
+        self.assertTrue(EveEntity.objects.filter(id=1999).exists())
+        eve_killmail = EveKillmail.objects.get(id=10000001)
+        self.assertTrue(eve_killmail.attackers.filter(character_id=1999).exists())
+
+    def test_should_skip_killmails_stored_by_another_process_meanwhile(self):
+        # given
+        killmails = [load_killmail(10000001), load_killmail(10000002)]
+        bulk_create = EveKillmail.objects._bulk_create_from_killmails
+        calls = []
+
+        def my_bulk_create(killmails_new):
+            if not calls:
+                bulk_create([load_killmail(10000001)])  # stored by another process
+            calls.append([obj.id for obj in killmails_new])
+            return bulk_create(killmails_new)
+
+        # when
+        with patch(
+            "killtracker.managers.EveKillmailBaseManager._bulk_create_from_killmails",
+            side_effect=my_bulk_create,
+        ):
+            result = EveKillmail.objects.create_from_killmails(
+                killmails, resolve_ids=False
+            )
+        # then
+        self.assertListEqual(calls, [[10000001, 10000002], [10000002]])
+        self.assertListEqual([obj.id for obj in result], [10000002])
+        self.assertEqual(EveKillmail.objects.count(), 2)
+
+    def test_should_create_killmails_with_constant_number_of_queries(self):
+        # given
+        killmails = [load_killmail(10000001), load_killmail(10000002)]
+        # when/then
+        with self.assertNumQueries(6):
+            EveKillmail.objects.create_from_killmails(killmails, resolve_ids=False)
+
     @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 1)
     def test_delete_stale(self):
         load_eve_killmails([10000001, 10000002, 10000003])
@@ -173,6 +339,69 @@ class TestEveKillmailManager(LoadTestDataMixin, NoSocketsTestCase):
         self.assertTrue(EveKillmail.objects.filter(id=10000002).exists())
         self.assertTrue(EveKillmail.objects.filter(id=10000003).exists())
 
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE", 2)
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 1)
+    def test_should_delete_stale_killmails_in_chunks(self):
+        # given
+        load_eve_killmails([10000001, 10000002, 10000003])
+        EveKillmail.objects.filter(id__in=[10000001, 10000002, 10000003]).update(
+            time=now() - timedelta(days=2)
+        )
+        attackers_count = EveKillmailAttacker.objects.count()
+        # when
+        total, details = EveKillmail.objects.delete_stale()
+        # then
+        self.assertEqual(details["killtracker.EveKillmail"], 3)
+        self.assertEqual(details["killtracker.EveKillmailAttacker"], attackers_count)
+        self.assertEqual(total, 3 + attackers_count)
+        self.assertFalse(EveKillmail.objects.exists())
+        self.assertFalse(EveKillmailAttacker.objects.exists())
+
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE", 5)
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 1)
+    def test_should_limit_chunks_to_max_query_params_of_database(self):
+        # given
+        load_eve_killmails([10000001, 10000002, 10000003])
+        EveKillmail.objects.update(time=now() - timedelta(days=2))
+        # when
+        with patch.object(connection.features, "max_query_params", 2), patch(
+            "killtracker.managers._raw_delete", wraps=_raw_delete
+        ) as spy:
+            _, details = EveKillmail.objects.delete_stale()
+        # then
+        self.assertEqual(details["killtracker.EveKillmail"], 3)
+        chunk_sizes = {len(args[2]) for args, _ in spy.call_args_list}
+        self.assertSetEqual(chunk_sizes, {1, 2})
+
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_TIME_BUDGET", 0)
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_CHUNK_SIZE", 1)
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 1)
+    def test_should_stop_deleting_when_time_budget_is_exhausted(self):
+        # given
+        load_eve_killmails([10000001, 10000002])
+        EveKillmail.objects.update(time=now() - timedelta(days=2))
+        # when
+        _, details = EveKillmail.objects.delete_stale()
+        # then
+        self.assertEqual(details["killtracker.EveKillmail"], 1)
+        self.assertListEqual(
+            list(EveKillmail.objects.values_list("id", flat=True)), [10000002]
+        )
+
+    @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 0)
+    def test_should_not_delete_when_purging_is_disabled(self):
+        # given
+        load_eve_killmails([10000001])
+        EveKillmail.objects.update(time=now() - timedelta(days=2))
+        # when
+        result = EveKillmail.objects.delete_stale()
+        # then
+        self.assertIsNone(result)
+        self.assertTrue(EveKillmail.objects.exists())
+
+    def test_should_have_index_on_time(self):
+        self.assertTrue(EveKillmail._meta.get_field("time").db_index)
+
     @patch("killtracker.managers.KILLTRACKER_PURGE_KILLMAILS_AFTER_DAYS", 0)
     def test_dont_delete_stale_when_turned_off(self):
         load_eve_killmails([10000001, 10000002, 10000003])
@@ -266,6 +495,7 @@ class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
     def setUp(self) -> None:
         self.message = Webhook._discord_message_asjson(content="Test message")
         cache.clear()
+        self.webhook_1.rate_limiter.clear()
 
     def test_when_send_ok_returns_true(self, requests_mocker):
         # given
@@ -306,6 +536,20 @@ class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
         self.assertFalse(response.status_ok)
         self.assertTrue(requests_mocker.called)
 
+    def test_should_update_rate_limit_from_response(self, requests_mocker):
+        # given
+        requests_mocker.register_uri(
+            "POST",
+            self.webhook_1.url,
+            status_code=200,
+            json={},
+            headers={"x-ratelimit-remaining": "0", "x-ratelimit-reset-after": "1.5"},
+        )
+        # when
+        self.webhook_1.send_message_to_webhook(self.message)
+        # then
+        self.assertAlmostEqual(self.webhook_1.rate_limiter.delay(), 1.5, delta=0.5)
+
     def test_too_many_requests_normal(self, requests_mocker):
         # given
         requests_mocker.register_uri(
@@ -335,6 +579,7 @@ class TestWebhookSendMessage(LoadTestDataMixin, TestCase):
         self.assertAlmostEqual(
             cache.ttl(self.webhook_1._blocked_cache_key()), 2002, delta=5
         )
+        self.assertAlmostEqual(self.webhook_1.rate_limiter.delay(), 2002, delta=5)
 
     def test_too_many_requests_no_retry_value(self, requests_mocker):
         # given
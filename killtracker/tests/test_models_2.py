@@ -20,7 +20,7 @@ from app_utils.esi_testing import BravadoOperationStub
 from app_utils.testing import NoSocketsTestCase, add_character_to_user_2
 
 from ..core.killmails import EntityCount, Killmail
-from ..models import Tracker
+from ..models import Tracker, Webhook
 from .testdata.factories import (
     KillmailAttackerFactory,
     KillmailFactory,
@@ -771,3 +771,107 @@ class TestTrackerEnqueueKillmail(LoadTestDataMixin, TestCase):
         self.tracker.generate_killmail_message(Killmail.from_json(killmail.asjson()))
 
         self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
+    def test_should_enqueue_message_with_priority_of_tracker(self):
+        # given
+        self.tracker.priority = Webhook.MessagePriority.HIGH
+        self.tracker.save()
+        self.webhook_1.enqueue_message(content="Other message")
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+        # when
+        self.tracker.generate_killmail_message(Killmail.from_json(killmail.asjson()))
+        # then
+        message = json.loads(self.webhook_1.main_queue.dequeue())
+        self.assertEqual(message["_meta"]["priority"], Webhook.MessagePriority.HIGH)
+        self.assertIn("My Tracker", message["content"])
+
+    def test_should_enqueue_message_with_highest_priority_of_all_trackers(self):
+        # given
+        other_tracker = TrackerFactory(
+            webhook=self.webhook_1, priority=Webhook.MessagePriority.HIGH
+        )
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+        # when
+        self.tracker.generate_killmail_message(
+            Killmail.from_json(killmail.asjson()), other_trackers=[other_tracker]
+        )
+        # then
+        message = json.loads(self.webhook_1.main_queue.dequeue())
+        self.assertEqual(message["_meta"]["priority"], Webhook.MessagePriority.HIGH)
+
+    def test_should_enqueue_message_with_max_age_of_tracker(self):
+        # given
+        self.tracker.max_message_age = 10
+        self.tracker.save()
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+        # when
+        self.tracker.generate_killmail_message(Killmail.from_json(killmail.asjson()))
+        # then
+        meta = json.loads(self.webhook_1.main_queue.dequeue())["_meta"]
+        self.assertAlmostEqual(meta["expires_at"], meta["enqueued_at"] + 600)
+        self.assertIn("killmail_time", meta)
+
+    def test_should_enqueue_message_with_largest_max_age_of_all_trackers(self):
+        # given
+        self.tracker.max_message_age = 10
+        self.tracker.save()
+        other_tracker = TrackerFactory(webhook=self.webhook_1, max_message_age=30)
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+        # when
+        self.tracker.generate_killmail_message(
+            Killmail.from_json(killmail.asjson()), other_trackers=[other_tracker]
+        )
+        # then
+        meta = json.loads(self.webhook_1.main_queue.dequeue())["_meta"]
+        self.assertAlmostEqual(meta["expires_at"], meta["enqueued_at"] + 1800)
+
+    def test_should_enqueue_message_without_max_age_when_one_tracker_has_none(self):
+        # given
+        self.tracker.max_message_age = 10
+        self.tracker.save()
+        other_tracker = TrackerFactory(webhook=self.webhook_1, max_message_age=None)
+        killmail = self.tracker.process_killmail(load_killmail(10000001))
+        # when
+        self.tracker.generate_killmail_message(
+            Killmail.from_json(killmail.asjson()), other_trackers=[other_tracker]
+        )
+        # then
+        meta = json.loads(self.webhook_1.main_queue.dequeue())["_meta"]
+        self.assertNotIn("expires_at", meta)
+
+
+class TestTrackerMessagePriority(LoadTestDataMixin, NoSocketsTestCase):
+    def test_should_return_priority_of_tracker(self):
+        # given
+        tracker = TrackerFactory(
+            webhook=self.webhook_1, priority=Webhook.MessagePriority.LOW
+        )
+        killmail = load_killmail(10000001)
+        # when/then
+        self.assertEqual(
+            tracker.message_priority(killmail), Webhook.MessagePriority.LOW
+        )
+
+    def test_should_return_high_priority_for_valuable_killmails(self):
+        # given
+        tracker = TrackerFactory(
+            webhook=self.webhook_1,
+            priority=Webhook.MessagePriority.LOW,
+            high_priority_min_value=10_000,
+        )
+        killmail = load_killmail(10000001)
+        # when/then
+        self.assertEqual(
+            tracker.message_priority(killmail), Webhook.MessagePriority.HIGH
+        )
+
+    def test_should_return_priority_of_tracker_for_cheap_killmails(self):
+        # given
+        tracker = TrackerFactory(
+            webhook=self.webhook_1, high_priority_min_value=1_000_000_000_000
+        )
+        killmail = load_killmail(10000001)
+        # when/then
+        self.assertEqual(
+            tracker.message_priority(killmail), Webhook.MessagePriority.NORMAL
+        )
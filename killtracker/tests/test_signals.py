@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed
+from django.test import TestCase
+
+from allianceauth.eveonline.models import EveAllianceInfo
+
+from ..core.trackers import TrackerRules
+from ..models import Tracker
+from .testdata.factories import TrackerFactory
+from .testdata.helpers import LoadTestDataMixin
+
+
+class TestTrackerRulesInvalidation(LoadTestDataMixin, TestCase):
+    def setUp(self) -> None:
+        self.alliance = EveAllianceInfo.objects.get(alliance_id=3001)
+        self.tracker = TrackerFactory(webhook=self.webhook_1)
+        self.tracker.exclude_attacker_alliances.add(self.alliance)
+        TrackerRules.get_or_compile(self.tracker)
+
+    def _send_reverse_m2m_changed(self, action, pk_set):
+        # all clauses are defined without reverse accessors,
+        # so the signal is sent like the reverse manager would do
+        m2m_changed.send(
+            sender=Tracker.exclude_attacker_alliances.through,
+            instance=self.alliance,
+            action=action,
+            reverse=True,
+            model=Tracker,
+            pk_set=pk_set,
+            using="default",
+        )
+
+    def _rules_are_cached(self) -> bool:
+        return cache.get(TrackerRules._cache_key(self.tracker.pk)) is not None
+
+    def test_should_invalidate_rules_when_clause_changes(self):
+        # when
+        self.tracker.exclude_attacker_alliances.remove(self.alliance)
+        # then
+        self.assertFalse(self._rules_are_cached())
+
+    def test_should_invalidate_rules_when_clause_changes_in_reverse(self):
+        # when
+        self._send_reverse_m2m_changed("post_remove", {self.tracker.pk})
+        # then
+        self.assertFalse(self._rules_are_cached())
+
+    def test_should_invalidate_rules_when_clause_is_cleared_in_reverse(self):
+        # when
+        self._send_reverse_m2m_changed("post_clear", None)
+        # then
+        self.assertFalse(self._rules_are_cached())
+
+    def test_should_invalidate_rules_when_object_of_clause_is_deleted(self):
+        # when
+        self.alliance.delete()
+        # then
+        self.assertFalse(self._rules_are_cached())
+
+    def test_should_keep_rules_when_unrelated_object_is_deleted(self):
+        # given
+        alliance = EveAllianceInfo.objects.get(alliance_id=3011)
+        # when
+        alliance.delete()
+        # then
+        self.assertTrue(self._rules_are_cached())
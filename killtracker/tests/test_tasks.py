@@ -1,24 +1,32 @@
-from unittest.mock import patch
+import json
+from unittest.mock import Mock, patch
 
 import celery
 import dhooks_lite
 
 from django.core.cache import cache
+from django.db import OperationalError
 from django.test import TestCase
 from django.test.utils import override_settings
 
+from ..core.killmail_archive import KillmailArchiveBuffer
+from ..core.killmails import Killmail
+from ..core.latency import latency_stats, reset_latency_stats
 from ..exceptions import WebhookTooManyRequests
 from ..models import EveKillmail
 from ..tasks import (
     delete_stale_killmails,
+    dispatch_killmail,
     generate_killmail_message,
     run_killtracker,
     run_tracker,
+    run_trackers,
     send_messages_to_webhook,
     send_test_message_to_webhook,
+    store_buffered_killmails,
     store_killmail,
 )
-from .testdata.factories import TrackerFactory
+from .testdata.factories import TrackerFactory, WebhookFactory
 from .testdata.helpers import LoadTestDataMixin, load_eve_killmails, load_killmail
 
 MODULE_PATH = "killtracker.tasks"
@@ -50,12 +58,16 @@ class TestTrackerBase(LoadTestDataMixin, TestCase):
 @override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
 @patch(MODULE_PATH + ".is_esi_online", spec=True)
 @patch(MODULE_PATH + ".delete_stale_killmails", spec=True)
-@patch(MODULE_PATH + ".store_killmail", spec=True)
+@patch(MODULE_PATH + ".store_buffered_killmails", spec=True)
 @patch(MODULE_PATH + ".Killmail.create_from_zkb_redisq")
 @patch(MODULE_PATH + ".run_tracker", spec=True)
+@patch(MODULE_PATH + ".KILLTRACKER_BATCHED_MATCHING_ENABLED", False)
+@patch(MODULE_PATH + ".rebuild_character_state_index", new=Mock())
 class TestRunKilltracker(TestTrackerBase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
+        KillmailArchiveBuffer.clear()
 
     @staticmethod
     def my_fetch_from_zkb():
@@ -70,7 +82,7 @@ class TestRunKilltracker(TestTrackerBase):
         self,
         mock_run_tracker,
         mock_create_from_zkb_redisq,
-        mock_store_killmail,
+        mock_store_buffered_killmails,
         mock_delete_stale_killmails,
         mock_is_esi_online,
     ):
@@ -82,7 +94,7 @@ class TestRunKilltracker(TestTrackerBase):
         run_killtracker.delay()
         # then
         self.assertEqual(mock_run_tracker.delay.call_count, 6)
-        self.assertEqual(mock_store_killmail.si.call_count, 0)
+        self.assertFalse(mock_store_buffered_killmails.delay.called)
         self.assertFalse(mock_delete_stale_killmails.delay.called)
         self.assertEqual(self.webhook_1.main_queue.size(), 1)
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
@@ -92,7 +104,7 @@ class TestRunKilltracker(TestTrackerBase):
         self,
         mock_run_tracker,
         mock_create_from_zkb_redisq,
-        mock_store_killmail,
+        mock_store_buffered_killmails,
         mock_delete_stale_killmails,
         mock_is_esi_online,
     ):
@@ -103,7 +115,7 @@ class TestRunKilltracker(TestTrackerBase):
         run_killtracker.delay()
         # then
         self.assertEqual(mock_run_tracker.delay.call_count, 0)
-        self.assertEqual(mock_store_killmail.si.call_count, 0)
+        self.assertFalse(mock_store_buffered_killmails.delay.called)
         self.assertFalse(mock_delete_stale_killmails.delay.called)
 
     @patch(MODULE_PATH + ".KILLTRACKER_MAX_KILLMAILS_PER_RUN", 2)
@@ -111,7 +123,7 @@ class TestRunKilltracker(TestTrackerBase):
         self,
         mock_run_tracker,
         mock_create_from_zkb_redisq,
-        mock_store_killmail,
+        mock_store_buffered_killmails,
         mock_delete_stale_killmails,
         mock_is_esi_online,
     ):
@@ -129,7 +141,7 @@ class TestRunKilltracker(TestTrackerBase):
         self,
         mock_run_tracker,
         mock_create_from_zkb_redisq,
-        mock_store_killmail,
+        mock_store_buffered_killmails,
         mock_delete_stale_killmails,
         mock_is_esi_online,
     ):
@@ -140,16 +152,236 @@ class TestRunKilltracker(TestTrackerBase):
         run_killtracker.delay()
         # then
         self.assertEqual(mock_run_tracker.delay.call_count, 6)
-        self.assertEqual(mock_store_killmail.si.call_count, 3)
+        self.assertEqual(KillmailArchiveBuffer.size(), 3)
+        self.assertTrue(mock_store_buffered_killmails.delay.called)
         self.assertTrue(mock_delete_stale_killmails.delay.called)
 
 
+@override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
+@patch(MODULE_PATH + ".is_esi_online", lambda: True)
+@patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+@patch(MODULE_PATH + ".KILLTRACKER_BATCHED_MATCHING_ENABLED", True)
+@patch(MODULE_PATH + ".rebuild_character_state_index", new=Mock())
+@patch(MODULE_PATH + ".delete_stale_killmails", spec=True)
+@patch(MODULE_PATH + ".Killmail.create_from_zkb_redisq")
+@patch(MODULE_PATH + ".run_trackers", spec=True)
+@patch(MODULE_PATH + ".run_tracker", spec=True)
+class TestRunKilltrackerBatched(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        Killmail.clear_local_cache()
+
+    def test_should_start_one_task_per_killmail(
+        self,
+        mock_run_tracker,
+        mock_run_trackers,
+        mock_create_from_zkb_redisq,
+        mock_delete_stale_killmails,
+    ):
+        # given
+        mock_create_from_zkb_redisq.side_effect = TestRunKilltracker.my_fetch_from_zkb()
+        # when
+        run_killtracker.delay()
+        # then
+        self.assertEqual(mock_run_trackers.delay.call_count, 3)
+        self.assertEqual(mock_run_tracker.delay.call_count, 0)
+
+
+@patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_ENABLED", False)
+@patch(MODULE_PATH + ".KILLTRACKER_BATCHED_MATCHING_ENABLED", True)
+@patch(MODULE_PATH + ".run_trackers", spec=True)
+@patch(MODULE_PATH + ".rebuild_character_state_index", spec=True)
+class TestDispatchKillmail(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        Killmail.clear_local_cache()
+
+    def test_should_rebuild_character_state_index_when_missing(
+        self, mock_rebuild_character_state_index, mock_run_trackers
+    ):
+        # when
+        dispatch_killmail(load_killmail(10000001))
+        # then
+        self.assertTrue(mock_rebuild_character_state_index.delay.called)
+        self.assertTrue(mock_run_trackers.delay.called)
+
+    @patch(MODULE_PATH + ".CharacterStateIndex.exists", lambda: True)
+    def test_should_not_rebuild_character_state_index_when_exists(
+        self, mock_rebuild_character_state_index, mock_run_trackers
+    ):
+        # when
+        dispatch_killmail(load_killmail(10000001))
+        # then
+        self.assertFalse(mock_rebuild_character_state_index.delay.called)
+
+
+@patch(MODULE_PATH + ".retry_task_if_esi_is_down", lambda x: None)
+@patch(MODULE_PATH + ".send_messages_to_webhook", spec=True)
+@patch(MODULE_PATH + ".generate_killmail_message", spec=True)
+class TestRunTrackers(TestTrackerBase):
+    def setUp(self) -> None:
+        cache.clear()
+        Killmail.clear_local_cache()
+
+    def test_should_generate_message_for_matching_tracker_only(
+        self, mock_generate_killmail_message, mock_send_messages_to_webhook
+    ):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        self.assertEqual(mock_generate_killmail_message.delay.call_count, 1)
+        _, kwargs = mock_generate_killmail_message.delay.call_args
+        self.assertEqual(kwargs["tracker_pk"], self.tracker_1.pk)
+        self.assertFalse(mock_send_messages_to_webhook.delay.called)
+
+    def test_should_generate_one_message_for_trackers_of_collapsing_webhook(
+        self, mock_generate_killmail_message, mock_send_messages_to_webhook
+    ):
+        # given
+        webhook = WebhookFactory(collapse_duplicates=True)
+        tracker_a = TrackerFactory(webhook=webhook)
+        tracker_b = TrackerFactory(webhook=webhook)
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        calls = [
+            kwargs
+            for _, kwargs in mock_generate_killmail_message.delay.call_args_list
+            if kwargs["tracker_pk"] in {tracker_a.pk, tracker_b.pk}
+        ]
+        self.assertEqual(len(calls), 1)
+        self.assertSetEqual(
+            {calls[0]["tracker_pk"], *calls[0]["other_tracker_pks"]},
+            {tracker_a.pk, tracker_b.pk},
+        )
+
+    def test_should_store_killmail_for_each_matching_tracker(
+        self, mock_generate_killmail_message, mock_send_messages_to_webhook
+    ):
+        # given
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        killmail_new = Killmail.get(killmail.id, tracker_pk=self.tracker_1.pk)
+        self.assertEqual(killmail_new.tracker_info.tracker_pk, self.tracker_1.pk)
+        self.assertIsNone(Killmail.get(killmail.id).tracker_info)
+
+    def test_should_start_sending_once_when_queue_non_empty(
+        self, mock_generate_killmail_message, mock_send_messages_to_webhook
+    ):
+        # given
+        killmail = load_killmail(10000003)
+        killmail.save()
+        self.webhook_1.enqueue_message(content="test")
+        # when
+        run_trackers(killmail.id)
+        # then
+        self.assertFalse(mock_generate_killmail_message.delay.called)
+        self.assertEqual(mock_send_messages_to_webhook.delay.call_count, 1)
+
+    @patch(MODULE_PATH + ".Tracker.process_killmail", spec=True)
+    def test_should_skip_trackers_out_of_range(
+        self,
+        mock_process_killmail,
+        mock_generate_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        # given
+        self.tracker_1.is_enabled = False
+        self.tracker_1.save()
+        self.tracker_2.is_enabled = False
+        self.tracker_2.save()
+        TrackerFactory(
+            webhook=self.webhook_1,
+            origin_solar_system_id=30003067,
+            require_max_distance=0.1,
+        )
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        self.assertFalse(mock_process_killmail.called)
+        self.assertFalse(mock_generate_killmail_message.delay.called)
+
+    @patch(MODULE_PATH + ".Tracker.process_killmail", spec=True)
+    def test_should_skip_trackers_which_are_not_candidates(
+        self,
+        mock_process_killmail,
+        mock_generate_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        # given
+        self.tracker_1.is_enabled = False
+        self.tracker_1.save()
+        self.tracker_2.is_enabled = False
+        self.tracker_2.save()
+        TrackerFactory(webhook=self.webhook_1, exclude_low_sec=True)
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        self.assertFalse(mock_process_killmail.called)
+        self.assertFalse(mock_generate_killmail_message.delay.called)
+
+    @patch(MODULE_PATH + ".Tracker.process_killmail", spec=True)
+    def test_should_continue_with_other_trackers_after_error(
+        self,
+        mock_process_killmail,
+        mock_generate_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        # given
+        self.tracker_2.is_enabled = False
+        self.tracker_2.save()
+        TrackerFactory(webhook=self.webhook_1)
+        killmail = load_killmail(10000001)
+        killmail.save()
+        mock_process_killmail.side_effect = [RuntimeError, killmail]
+        # when
+        with patch(MODULE_PATH + ".run_tracker", spec=True) as mock_run_tracker:
+            run_trackers(killmail.id)
+        # then
+        self.assertEqual(mock_process_killmail.call_count, 2)
+        self.assertEqual(mock_generate_killmail_message.delay.call_count, 1)
+        self.assertEqual(mock_run_tracker.delay.call_count, 1)
+        _, kwargs = mock_run_tracker.delay.call_args
+        self.assertEqual(kwargs["killmail_id"], killmail.id)
+
+    @patch(MODULE_PATH + ".OriginDistanceFilter.trackers_out_of_range", spec=True)
+    def test_should_check_all_trackers_when_pre_filtering_fails(
+        self,
+        mock_trackers_out_of_range,
+        mock_generate_killmail_message,
+        mock_send_messages_to_webhook,
+    ):
+        # given
+        mock_trackers_out_of_range.side_effect = RuntimeError
+        killmail = load_killmail(10000001)
+        killmail.save()
+        # when
+        run_trackers(killmail.id)
+        # then
+        self.assertEqual(mock_generate_killmail_message.delay.call_count, 1)
+        _, kwargs = mock_generate_killmail_message.delay.call_args
+        self.assertEqual(kwargs["tracker_pk"], self.tracker_1.pk)
+
+
 @patch(MODULE_PATH + ".retry_task_if_esi_is_down", lambda x: None)
 @patch(MODULE_PATH + ".send_messages_to_webhook", spec=True)
 @patch(MODULE_PATH + ".generate_killmail_message", spec=True)
 class TestRunTracker(TestTrackerBase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
 
     def test_call_enqueue_for_matching_killmail(
         self, mock_enqueue_killmail_message, mock_send_messages_to_webhook
@@ -202,6 +434,7 @@ class TestRunTracker(TestTrackerBase):
 class TestGenerateKillmailMessage(TestTrackerBase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
         self.retries = 0
         killmail = load_killmail(10000001)
         killmail.save()
@@ -224,6 +457,16 @@ class TestGenerateKillmailMessage(TestTrackerBase):
         self.assertEqual(self.webhook_1.main_queue.size(), 1)
         self.assertFalse(mock_retry.called)
 
+    @patch(MODULE_PATH + ".MessageDeliveryService.is_running", lambda: True)
+    def test_should_not_start_sending_when_delivery_service_is_running(
+        self, mock_send_messages_to_webhook, mock_retry
+    ):
+        # when
+        generate_killmail_message(self.tracker_1.pk, self.killmail_id)
+        # then
+        self.assertFalse(mock_send_messages_to_webhook.delay.called)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
     @patch(MODULE_PATH + ".KILLTRACKER_GENERATE_MESSAGE_MAX_RETRIES", 3)
     @patch(MODULE_PATH + ".Tracker.generate_killmail_message", spec=True)
     def test_retry_until_maximum(
@@ -247,6 +490,8 @@ class TestGenerateKillmailMessage(TestTrackerBase):
 class TestSendMessagesToWebhook(TestTrackerBase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
+        self.webhook_1.rate_limiter.clear()
 
     def test_one_message(self, mock_send_message_to_webhook):
         """when one message in queue, then send it and retry with delay"""
@@ -262,6 +507,36 @@ class TestSendMessagesToWebhook(TestTrackerBase):
         self.assertEqual(self.webhook_1.main_queue.size(), 0)
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
 
+    def test_should_stop_when_delivery_service_is_running(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        with patch(MODULE_PATH + ".MessageDeliveryService.is_running", lambda: True):
+            send_messages_to_webhook.delay(self.webhook_1.pk)
+        # then
+        self.assertFalse(mock_send_message_to_webhook.called)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+
+    @patch("killtracker.core.latency.KILLTRACKER_LATENCY_STATS_ENABLED", True)
+    def test_should_record_latency_of_sent_message(self, mock_send_message_to_webhook):
+        # given
+        reset_latency_stats()
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=200
+        )
+        self.webhook_1.enqueue_message(
+            content="Test message",
+            meta={"tracker_pk": self.tracker_1.pk, "timestamps": {"received": 1.0}},
+        )
+        # when
+        send_messages_to_webhook.delay(self.webhook_1.pk)
+        # then
+        stats = {(obj.scope, obj.obj_pk, obj.stage) for obj in latency_stats()}
+        self.assertIn(("webhook", self.webhook_1.pk, "total"), stats)
+        self.assertIn(("tracker", self.tracker_1.pk, "total"), stats)
+
     def test_three_message(self, mock_send_message_to_webhook):
         """when three messages in queue, then sends them and returns 3"""
         # given
@@ -278,6 +553,50 @@ class TestSendMessagesToWebhook(TestTrackerBase):
         self.assertEqual(self.webhook_1.main_queue.size(), 0)
         self.assertEqual(self.webhook_1.error_queue.size(), 0)
 
+    def test_should_combine_messages_with_same_content(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=200
+        )
+        for num in range(3):
+            self.webhook_1.enqueue_message(
+                content="Test message",
+                embeds=[dhooks_lite.Embed(description=f"Killmail {num}")],
+            )
+        self.webhook_1.enqueue_message(
+            content="Other message", embeds=[dhooks_lite.Embed(description="Other")]
+        )
+        # when
+        send_messages_to_webhook.delay(self.webhook_1.pk)
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 2)
+        first_message = json.loads(mock_send_message_to_webhook.call_args_list[0][0][0])
+        self.assertListEqual(
+            [embed["description"] for embed in first_message["embeds"]],
+            ["Killmail 0", "Killmail 1", "Killmail 2"],
+        )
+        self.assertEqual(self.webhook_1.main_queue.size(), 0)
+
+    def test_should_move_rejected_combined_messages_to_error_queue(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=404
+        )
+        for num in range(2):
+            self.webhook_1.enqueue_message(
+                content="Test message",
+                embeds=[dhooks_lite.Embed(description=f"Killmail {num}")],
+            )
+        # when
+        send_messages_to_webhook.delay(self.webhook_1.pk)
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 3)
+        self.assertEqual(self.webhook_1.error_queue.size(), 2)
+
     def test_no_messages(self, mock_send_message_to_webhook):
         """when no messages in queue, then do nothing"""
         # given
@@ -319,11 +638,73 @@ class TestSendMessagesToWebhook(TestTrackerBase):
         self.assertEqual(mock_send_message_to_webhook.call_count, 1)
         self.assertEqual(self.webhook_1.main_queue.size(), 1)
 
+    def test_should_wait_until_rate_limit_resets(self, mock_send_message_to_webhook):
+        # given
+        self.webhook_1.enqueue_message(content="Test message")
+        self.webhook_1.rate_limiter.block(30)
+        # when
+        with patch(
+            MODULE_PATH + ".send_messages_to_webhook.retry", spec=True
+        ) as mock_retry:
+            mock_retry.side_effect = celery.exceptions.Retry
+            with self.assertRaises(celery.exceptions.Retry):
+                send_messages_to_webhook(self.webhook_1.pk)
+        # then
+        self.assertFalse(mock_send_message_to_webhook.called)
+        self.assertEqual(self.webhook_1.main_queue.size(), 1)
+        _, kwargs = mock_retry.call_args
+        self.assertAlmostEqual(kwargs["countdown"], 30, delta=5)
+
+    def test_should_send_next_message_right_away_while_tokens_remain(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=200
+        )
+        self.webhook_1.enqueue_message(content="Test message")
+        self.webhook_1.enqueue_message(content="Other message")
+        self.webhook_1.rate_limiter.update_from_headers(
+            {"X-RateLimit-Remaining": "4", "X-RateLimit-Reset-After": "2"}
+        )
+        # when
+        with patch(
+            MODULE_PATH + ".send_messages_to_webhook.retry", spec=True
+        ) as mock_retry:
+            mock_retry.side_effect = celery.exceptions.Retry
+            with self.assertRaises(celery.exceptions.Retry):
+                send_messages_to_webhook(self.webhook_1.pk)
+        # then
+        self.assertEqual(mock_send_message_to_webhook.call_count, 1)
+        _, kwargs = mock_retry.call_args
+        self.assertEqual(kwargs["countdown"], 0)
+
+    @patch("killtracker.core.delivery.KILLTRACKER_DISCORD_SEND_DELAY", 5)
+    def test_should_wait_default_delay_when_rate_limit_unknown(
+        self, mock_send_message_to_webhook
+    ):
+        # given
+        mock_send_message_to_webhook.return_value = dhooks_lite.WebhookResponse(
+            {}, status_code=200
+        )
+        self.webhook_1.enqueue_message(content="Test message")
+        # when
+        with patch(
+            MODULE_PATH + ".send_messages_to_webhook.retry", spec=True
+        ) as mock_retry:
+            mock_retry.side_effect = celery.exceptions.Retry
+            with self.assertRaises(celery.exceptions.Retry):
+                send_messages_to_webhook(self.webhook_1.pk)
+        # then
+        _, kwargs = mock_retry.call_args
+        self.assertEqual(kwargs["countdown"], 5)
+
 
 @patch(MODULE_PATH + ".logger", spec=True)
 class TestStoreKillmail(TestTrackerBase):
     def setUp(self) -> None:
         cache.clear()
+        Killmail.clear_local_cache()
 
     def test_normal(self, mock_logger):
         # given
@@ -346,6 +727,96 @@ class TestStoreKillmail(TestTrackerBase):
         self.assertTrue(mock_logger.warning.called)
 
 
+@patch(MODULE_PATH + ".update_unresolved_eve_entities", spec=True)
+@patch(MODULE_PATH + ".KILLTRACKER_STORING_KILLMAILS_BATCH_SIZE", 2)
+class TestStoreBufferedKillmails(TestTrackerBase):
+    def setUp(self) -> None:
+        KillmailArchiveBuffer.clear()
+
+    def test_should_store_all_buffered_killmails_in_batches(
+        self, mock_update_unresolved_eve_entities
+    ):
+        # given
+        for killmail_id in [10000001, 10000002, 10000003]:
+            KillmailArchiveBuffer.add(load_killmail(killmail_id))
+        # when
+        with patch(
+            "killtracker.managers.EveKillmailBaseManager.create_from_killmails",
+            wraps=EveKillmail.objects.create_from_killmails,
+        ) as spy:
+            store_buffered_killmails()
+        # then
+        self.assertEqual(spy.call_count, 2)
+        self.assertSetEqual(
+            set(EveKillmail.objects.values_list("id", flat=True)),
+            {10000001, 10000002, 10000003},
+        )
+        self.assertEqual(KillmailArchiveBuffer.size(), 0)
+        self.assertEqual(mock_update_unresolved_eve_entities.delay.call_count, 1)
+
+    def test_should_skip_killmails_which_already_exist(
+        self, mock_update_unresolved_eve_entities
+    ):
+        # given
+        load_eve_killmails([10000001])
+        KillmailArchiveBuffer.add(load_killmail(10000001))
+        KillmailArchiveBuffer.add(load_killmail(10000002))
+        # when
+        store_buffered_killmails()
+        # then
+        self.assertTrue(EveKillmail.objects.filter(id=10000002).exists())
+        self.assertEqual(KillmailArchiveBuffer.size(), 0)
+
+    def test_should_do_nothing_when_buffer_is_empty(
+        self, mock_update_unresolved_eve_entities
+    ):
+        # when
+        store_buffered_killmails()
+        # then
+        self.assertFalse(mock_update_unresolved_eve_entities.delay.called)
+
+    def test_should_keep_killmails_in_buffer_when_storing_fails(
+        self, mock_update_unresolved_eve_entities
+    ):
+        # given
+        KillmailArchiveBuffer.add(load_killmail(10000001))
+        # when
+        with patch(
+            "killtracker.managers.EveKillmailBaseManager.create_from_killmails",
+            side_effect=OperationalError,
+        ):
+            with self.assertRaises(OperationalError):
+                store_buffered_killmails()
+        # then
+        self.assertEqual(KillmailArchiveBuffer.size(), 1)
+
+    def test_should_drop_bad_killmail_and_store_the_others(
+        self, mock_update_unresolved_eve_entities
+    ):
+        # given
+        for killmail_id in [10000001, 10000002, 10000003]:
+            KillmailArchiveBuffer.add(load_killmail(killmail_id))
+        create_from_killmails = EveKillmail.objects.create_from_killmails
+
+        def my_create_from_killmails(killmails, resolve_ids):
+            if 10000002 in {killmail.id for killmail in killmails}:
+                raise ValueError("bad killmail")
+            return create_from_killmails(killmails, resolve_ids=resolve_ids)
+
+        # when
+        with patch(
+            "killtracker.managers.EveKillmailBaseManager.create_from_killmails",
+            side_effect=my_create_from_killmails,
+        ):
+            store_buffered_killmails()
+        # then
+        self.assertSetEqual(
+            set(EveKillmail.objects.values_list("id", flat=True)),
+            {10000001, 10000003},
+        )
+        self.assertEqual(KillmailArchiveBuffer.size(), 0)
+
+
 @override_settings(CELERY_ALWAYS_EAGER=True, CELERY_EAGER_PROPAGATES_EXCEPTIONS=True)
 @patch("killtracker.models.dhooks_lite.Webhook.execute", spec=True)
 @patch(MODULE_PATH + ".logger", spec=True)
@@ -0,0 +1,82 @@
+# flake8: noqa
+"""this benchmarks the formats for storing killmails in the cache"""
+
+# init and setup django project
+import inspect
+import os
+import sys
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+myauth_dir = os.path.dirname(os.path.dirname(os.path.dirname(currentdir))) + "/myauth"
+sys.path.insert(0, myauth_dir)
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myauth.settings.local")
+django.setup()
+
+# normal includes
+import pickle
+import random
+import timeit
+
+from django.utils.timezone import now
+
+from killtracker.core.killmails import (
+    Killmail,
+    KillmailAttacker,
+    KillmailPosition,
+    KillmailVictim,
+    KillmailZkb,
+)
+
+ATTACKERS_COUNT = 1000
+REPEATS = 100
+
+
+def create_killmail(attackers_count: int) -> Killmail:
+    attackers = [
+        KillmailAttacker(
+            character_id=random.randint(90_000_000, 2_200_000_000),
+            corporation_id=random.randint(98_000_000, 99_000_000),
+            alliance_id=random.choice([None, random.randint(99_000_000, 99_100_000)]),
+            faction_id=None,
+            ship_type_id=random.randint(500, 50_000),
+            damage_done=random.randint(0, 100_000),
+            is_final_blow=n == 0,
+            security_status=random.uniform(-10, 5),
+            weapon_type_id=random.randint(500, 50_000),
+        )
+        for n in range(attackers_count)
+    ]
+    return Killmail(
+        id=100_000_001,
+        time=now(),
+        victim=KillmailVictim(
+            character_id=90_000_001,
+            corporation_id=98_000_001,
+            alliance_id=99_000_001,
+            ship_type_id=23913,
+            damage_taken=1_000_000,
+        ),
+        attackers=attackers,
+        position=KillmailPosition(x=1.0, y=2.0, z=3.0),
+        zkb=KillmailZkb(location_id=50_000_001, hash="abc", total_value=1e10),
+        solar_system_id=30004984,
+    )
+
+
+killmail = create_killmail(ATTACKERS_COUNT)
+data_json = killmail.asjson()
+data_bytes = killmail.asbytes()
+formats = [
+    ("JSON", killmail.asjson, lambda: Killmail.from_json(data_json), data_json),
+    ("binary", killmail.asbytes, lambda: Killmail.from_bytes(data_bytes), data_bytes),
+]
+print(f"Killmail with {ATTACKERS_COUNT} attackers, {REPEATS} repeats")
+print(f"{'Format':<8} {'Encode (ms)':>12} {'Decode (ms)':>12} {'Size (KB)':>10}")
+for name, encode, decode, data in formats:
+    encode_ms = timeit.timeit(encode, number=REPEATS) / REPEATS * 1000
+    decode_ms = timeit.timeit(decode, number=REPEATS) / REPEATS * 1000
+    size_kb = len(pickle.dumps(data)) / 1024
+    print(f"{name:<8} {encode_ms:>12.2f} {decode_ms:>12.2f} {size_kb:>10.1f}")
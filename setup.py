@@ -45,6 +45,6 @@ setup(
         "django-eveuniverse>=0.18",
         "allianceauth-app-utils>=1.14.2",
         "redis-simple-mq>=0.4",
-        "dhooks-lite>=0.6",
+        "dhooks-lite>=1.1,<3",
     ],
 )